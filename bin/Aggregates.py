@@ -0,0 +1,247 @@
+#!/usr/bin/python
+#
+# Aggregate functions for Relation.groupBy(keyCols).agg(...)
+#
+# an aggregate reduces the values of one column within a group.  Every
+# aggregate can:
+#   reduce(vals): reduce a list of values
+#   reduceSegments(vals, starts, counts): reduce a numpy array of values
+#     sorted by group, where group i is vals[starts[i]:starts[i]+counts[i]].
+#     returns one value per group (used by ColumnarRelation)
+# and keeps a mergeable state, so groups can be built up a value at a time
+# or combined from partial groups:
+#   initial() -> state of an empty group
+#   add(state, val) -> state
+#   merge(state, otherState) -> state
+#   result(state) -> value
+#
+# aggregates are given by name ('count', 'sum', 'min', 'max', 'mean',
+# 'stddev', 'sketch') or as an Aggregate object (e.g. Percentile(99),
+# Quantile(99.9, 0.001))
+#
+# Quantile and Sketch keep a QuantileSketch per group instead of every value
+# (see QuantileSketch.py).  Their input values may be numbers or sketches,
+# so a column of per-run sketches aggregates into the sketches or quantiles
+# of all runs
+
+import math
+
+import QuantileSketch
+
+try:
+  import numpy as np
+except ImportError: # only needed by ColumnarRelation
+  np = None
+
+class Aggregate(object):
+  def reduce(self, vals):
+    state = self.initial()
+    for val in vals:
+      state = self.add(state, val)
+    return self.result(state)
+
+  # default: reduce each group separately
+  def reduceSegments(self, vals, starts, counts):
+    return [self.reduce(vals[s:s+c].tolist()) for s, c in zip(starts.tolist(), counts.tolist())]
+
+class Count(Aggregate):
+  def initial(self):
+    return 0
+  def add(self, state, val):
+    return state + 1
+  def merge(self, state, otherState):
+    return state + otherState
+  def result(self, state):
+    return state
+  def reduce(self, vals):
+    return len(vals)
+  def reduceSegments(self, vals, starts, counts):
+    return counts
+
+class Sum(Aggregate):
+  def initial(self):
+    return 0
+  def add(self, state, val):
+    return state + val
+  def merge(self, state, otherState):
+    return state + otherState
+  def result(self, state):
+    return state
+  def reduce(self, vals):
+    return sum(vals)
+  def reduceSegments(self, vals, starts, counts):
+    return np.add.reduceat(vals, starts)
+
+# min and max of an empty group are None
+class Min(Aggregate):
+  def initial(self):
+    return None
+  def add(self, state, val):
+    return val if state == None or val < state else state
+  def merge(self, state, otherState):
+    return state if otherState == None else self.add(state, otherState)
+  def result(self, state):
+    return state
+  def reduce(self, vals):
+    return min(vals)
+  def reduceSegments(self, vals, starts, counts):
+    return np.minimum.reduceat(vals, starts)
+
+class Max(Aggregate):
+  def initial(self):
+    return None
+  def add(self, state, val):
+    return val if state == None or val > state else state
+  def merge(self, state, otherState):
+    return state if otherState == None else self.add(state, otherState)
+  def result(self, state):
+    return state
+  def reduce(self, vals):
+    return max(vals)
+  def reduceSegments(self, vals, starts, counts):
+    return np.maximum.reduceat(vals, starts)
+
+# state is (count, sum)
+class Mean(Aggregate):
+  def initial(self):
+    return (0, 0.0)
+  def add(self, state, val):
+    return (state[0] + 1, state[1] + val)
+  def merge(self, state, otherState):
+    return (state[0] + otherState[0], state[1] + otherState[1])
+  def result(self, state):
+    return state[1] / state[0] if state[0] > 0 else None
+  def reduce(self, vals):
+    return float(sum(vals)) / len(vals) if len(vals) > 0 else None
+  def reduceSegments(self, vals, starts, counts):
+    return np.add.reduceat(vals.astype(np.float64), starts) / counts
+
+# sample standard deviation (divides by n-1), 0.0 for a single value
+# state is (count, mean, sum of squared differences from the mean) so that
+# partial groups merge without losing precision
+class Stddev(Aggregate):
+  def initial(self):
+    return (0, 0.0, 0.0)
+  def add(self, state, val):
+    (n, mean, m2) = state
+    n += 1
+    delta = val - mean
+    mean += delta / float(n)
+    return (n, mean, m2 + delta * (val - mean))
+  def merge(self, state, otherState):
+    (n1, mean1, m21) = state
+    (n2, mean2, m22) = otherState
+    n = n1 + n2
+    if n == 0:
+      return state
+    delta = mean2 - mean1
+    return (n, mean1 + delta * n2 / float(n), m21 + m22 + delta * delta * n1 * n2 / float(n))
+  def result(self, state):
+    (n, mean, m2) = state
+    if n == 0:
+      return None
+    return math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+  def reduce(self, vals):
+    n = len(vals)
+    if n == 0:
+      return None
+    mean = float(sum(vals)) / n
+    return math.sqrt(sum((v - mean) ** 2 for v in vals) / (n - 1)) if n > 1 else 0.0
+  def reduceSegments(self, vals, starts, counts):
+    vals = vals.astype(np.float64)
+    means = np.add.reduceat(vals, starts) / counts
+    deviations = vals - np.repeat(means, counts)
+    m2 = np.add.reduceat(deviations * deviations, starts)
+    return np.sqrt(m2 / np.maximum(counts - 1, 1))
+
+# percentile p (0-100), interpolating linearly between the closest ranks
+# state is the list of values
+class Percentile(Aggregate):
+  def __init__(self, p):
+    assert 0 <= p <= 100, "percentile must be in [0, 100]"
+    self.p = p
+  def initial(self):
+    return []
+  def add(self, state, val):
+    state.append(val)
+    return state
+  def merge(self, state, otherState):
+    return state + otherState
+  def result(self, state):
+    return self.reduce(state)
+  def reduce(self, vals):
+    if len(vals) == 0:
+      return None
+    vals = sorted(vals)
+    pos = (len(vals) - 1) * self.p / 100.0
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, len(vals) - 1)
+    return vals[lo] + (vals[hi] - vals[lo]) * (pos - lo)
+  def reduceSegments(self, vals, starts, counts):
+    # sort values within each group
+    groupIds = np.repeat(np.arange(len(starts)), counts)
+    vals = vals[np.lexsort((vals, groupIds))].astype(np.float64)
+    pos = (counts - 1) * self.p / 100.0
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo + 1, counts - 1)
+    loVals = vals[starts + lo]
+    return loVals + (vals[starts + hi] - loVals) * (pos - lo)
+
+# helper
+# add a number or merge a sketch into sketch
+def addToSketch(sketch, val):
+  if isinstance(val, QuantileSketch.QuantileSketch):
+    return sketch.merge(val)
+  return sketch.add(val)
+
+# percentile p (0-100) estimated within relativeError of the value of the
+# closest rank below, see QuantileSketch.py
+# state is a QuantileSketch
+class Quantile(Aggregate):
+  def __init__(self, p, relativeError=QuantileSketch.defaultError):
+    assert 0 <= p <= 100, "percentile must be in [0, 100]"
+    self.p = p
+    self.relativeError = relativeError
+  def initial(self):
+    return QuantileSketch.QuantileSketch(self.relativeError)
+  def add(self, state, val):
+    return addToSketch(state, val)
+  def merge(self, state, otherState):
+    return state.merge(otherState)
+  def result(self, state):
+    return state.quantile(self.p / 100.0)
+  def reduceSegments(self, vals, starts, counts):
+    return [self.initial().addArray(vals[s:s+c]).quantile(self.p / 100.0) for s, c in zip(starts.tolist(), counts.tolist())]
+
+# the QuantileSketch of the values, e.g. to save per-run sketches and merge
+# them later.  state is a QuantileSketch, the result is a copy of it
+class Sketch(Aggregate):
+  def __init__(self, relativeError=QuantileSketch.defaultError):
+    self.relativeError = relativeError
+  def initial(self):
+    return QuantileSketch.QuantileSketch(self.relativeError)
+  def add(self, state, val):
+    return addToSketch(state, val)
+  def merge(self, state, otherState):
+    return state.merge(otherState)
+  def result(self, state):
+    return state.copy()
+  def reduceSegments(self, vals, starts, counts):
+    return [self.initial().addArray(vals[s:s+c]) for s, c in zip(starts.tolist(), counts.tolist())]
+
+aggregates = {
+  'count'  : Count(),
+  'sum'    : Sum(),
+  'min'    : Min(),
+  'max'    : Max(),
+  'mean'   : Mean(),
+  'stddev' : Stddev(),
+  'sketch' : Sketch(),
+}
+
+# return the Aggregate for a name or an Aggregate object
+def getAggregate(agg):
+  if isinstance(agg, Aggregate):
+    return agg
+  assert agg in aggregates, "unknown aggregate {!r}, use one of {!r} or an Aggregate".format(agg, sorted(aggregates.keys()))
+  return aggregates[agg]
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+#
+# Bloom filter: a compact set that may answer "maybe" for values never added
+#
+# a value is added by setting numHashes bits of a bit array, chosen by the
+# value's hash.  A value whose bits are not all set was surely never added.
+# Used by Relation.semiJoin and antiJoin to drop the rows whose keys surely
+# don't match before the exact check, which then only holds the remaining
+# keys in memory.
+#
+# ex:
+#   bloom = BloomFilter.forItems(1 << 20, len(keys))
+#   for key in keys:
+#     bloom.add(key)
+#   maybe = key in bloom
+
+import math
+
+mask64 = (1 << 64) - 1
+
+class BloomFilter(object):
+  def __init__(self, numBits, numHashes):
+    assert numBits > 0, "a Bloom filter needs at least one bit"
+    assert numHashes > 0, "a Bloom filter needs at least one hash"
+    self.numBits = numBits
+    self.numHashes = numHashes
+    self.bits = bytearray((numBits + 7) // 8)
+
+  def add(self, value):
+    for bit in self.positions(value):
+      self.bits[bit >> 3] |= 1 << (bit & 7)
+
+  def __contains__(self, value):
+    for bit in self.positions(value):
+      if not self.bits[bit >> 3] & (1 << (bit & 7)):
+        return False
+    return True
+
+  # internal
+  # the bits of value: two halves of a mixed 64 bit hash combined as
+  # h1 + i * h2 (double hashing)
+  def positions(self, value):
+    h = mix64(hash(value))
+    (h1, h2) = (h & 0xffffffff, (h >> 32) | 1)
+    return [(h1 + i * h2) % self.numBits for i in range(self.numHashes)]
+
+# helper
+# spread the bits of a hash (python hashes small ints to themselves)
+# finalizer of MurmurHash3
+def mix64(h):
+  h &= mask64
+  h ^= h >> 33
+  h = (h * 0xff51afd7ed558ccd) & mask64
+  h ^= h >> 33
+  h = (h * 0xc4ceb9fe1a85ec53) & mask64
+  h ^= h >> 33
+  return h
+
+# a Bloom filter of numBits bits, with the number of hashes that gives the
+# fewest false positives for numItems values
+def forItems(numBits, numItems):
+  numHashes = int(round(float(numBits) / max(numItems, 1) * math.log(2)))
+  return BloomFilter(numBits, min(max(numHashes, 1), 16))
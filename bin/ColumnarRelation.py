@@ -0,0 +1,1124 @@
+#!/usr/bin/python
+#
+# Columnar storage for relations
+# cols: a tuple of strings representing the columns of this relation
+# arrays: a list of numpy arrays, one per column, all of the same length
+#
+# ColumnarRelation supports the same operations as Relational.Relation but
+# keeps one typed numpy array per column.  Object arrays are only used when
+# numpy can't type the values (strings, tuples, mixed types, None).
+# Row tuples are only built when rows is read, so avoid reading rows inside
+# a loop.
+#
+# dictionary encoding: encode(cols) stores columns as small integer codes
+# plus a table of their distinct values (DictColumn).  Join, group and
+# duplicate keys use the codes without hashing the rows, and expressions
+# on a single encoded column are evaluated once per distinct value.  column()
+# and arrays return decoded arrays; use rawColumn() to see the encoding
+#
+# select, generateCol and filter given an Expr evaluate it on whole columns
+# with numpy (with numpy's semantics, e.g. x / 0 is inf rather than an error)
+#
+# zone maps: createZoneMaps(cols) keeps the min and max of every chunk of
+# rows of each column.  select/filter on an Expr and selectEquals skip the
+# chunks whose range can't satisfy the comparisons (col op value, isin) the
+# expression ands together, and keep the chunks that satisfy them entirely
+# without evaluating it.  Zone maps are dropped with the indexes
+#
+# statistics (see Relation.stats) are reduced with numpy on each column.
+# NaNs in float columns are skipped like None, the value table of a
+# dictionary encoded column is reduced instead of its rows
+#
+# with setProcesses(n), functions given to select, generateCol,
+# splitAndGenerateCols, filter and cast run on ranges of rows in n processes.
+# The workers read the column arrays inherited from this process and only
+# send back the results
+
+import itertools
+import operator
+
+import numpy as np
+
+import Relational
+import Aggregates
+import Windows
+import Expr
+import Parallel
+
+# list of tuples of the values of arrays in rows start to stop
+def rangeTuples(arrays, start, stop):
+  if len(arrays) == 0:
+    return [()] * (stop - start)
+  return zip(*[a[start:stop].tolist() for a in arrays])
+
+# convert a sequence of values into a 1-d numpy array
+# numbers and bools get a typed array, everything else an object array
+# (strings are kept as python objects so that values compare as before)
+def toColumn(vals):
+  if isinstance(vals, np.ndarray) and vals.ndim == 1:
+    if vals.dtype.kind in 'SU':
+      return vals.astype(object)
+    return vals
+  vals = list(vals)
+  if len(vals) == 0:
+    return np.empty(0, dtype=object)
+  try:
+    arr = np.array(vals)
+  except ValueError: # ragged sequences
+    arr = None
+  if arr is None or arr.ndim != 1 or arr.dtype.kind not in 'biuf':
+    arr = np.empty(len(vals), dtype=object)
+    for i, val in enumerate(vals):
+      arr[i] = val
+  return arr
+
+# map the values of an array to dense integer codes
+# returns (codes, uniques) where uniques[codes] == arr
+# typed arrays are sorted by numpy, object arrays are hashed in one pass
+def factorize(arr):
+  if arr.dtype.kind != 'O':
+    uniques, codes = np.unique(arr, return_inverse=True)
+    return (codes.astype(np.int64), uniques)
+  table = {}
+  codes = np.fromiter((table.setdefault(v, len(table)) for v in arr.tolist()), np.int64, len(arr))
+  uniques = np.empty(len(table), dtype=object)
+  for v, code in table.items():
+    uniques[code] = v
+  return (codes, uniques)
+
+# map the codes of the same column in several relations into one table of
+# values.  encoded is a list of (codes, values)
+# returns (list of codes into the shared table, number of shared values)
+def unifyCodes(encoded):
+  table = {}
+  unified = []
+  for (codes, values) in encoded:
+    remap = np.fromiter((table.setdefault(v, len(table)) for v in values.tolist()), np.int64, len(values))
+    unified.append(remap[codes])
+  return (unified, len(table))
+
+# combine the codes of several key columns into a single integer code per
+# row, two rows have the same code iff all of their key values are equal
+# keyColumns is a list of (codes, number of distinct codes).  Codes are not
+# dense, but never overflow
+def combineCodes(keyColumns, length):
+  codes = np.zeros(length, dtype=np.int64)
+  size = 1
+  for (colCodes, numCodes) in keyColumns:
+    if size * numCodes >= 2 ** 62:
+      (uniques, codes) = np.unique(codes, return_inverse=True)
+      codes = codes.astype(np.int64)
+      size = len(uniques)
+    codes = codes * numCodes + colCodes
+    size *= numCodes
+  return codes
+
+# number the distinct codes in the order they first appear
+# returns (number of every row's code, first row of every number)
+def firstAppearanceIds(codes):
+  (uniqueCodes, firstIdx, inverse) = np.unique(codes, return_index=True, return_inverse=True)
+  order = np.argsort(firstIdx, kind='mergesort')
+  ids = np.empty(len(order), dtype=np.int64)
+  ids[order] = np.arange(len(order))
+  return (ids[inverse], firstIdx[order])
+
+# a dictionary encoded column, values[codes] is the column
+# codes: array of the smallest unsigned integer type
+# values: array of the distinct values
+class DictColumn(object):
+  def __init__(self, codes, values):
+    self.codes = codes
+    self.values = values
+
+  def __len__(self):
+    return len(self.codes)
+
+  def decode(self):
+    return self.values[self.codes]
+
+  def take(self, selector):
+    return DictColumn(self.codes[selector], self.values)
+
+# the rank of each of the distinct values in values
+def distinctRanks(values):
+  order = np.argsort(values, kind='mergesort')
+  ranks = np.empty(len(order), dtype=np.int64)
+  ranks[order] = np.arange(len(order))
+  return ranks
+
+# the ranks of the distinct values vals sorted by keyFn(val), values with
+# equal keys get equal ranks
+def keyRanks(vals, keyFn):
+  keys = map(keyFn, vals)
+  order = sorted(range(len(keys)), key=keys.__getitem__)
+  ranks = np.empty(len(keys), dtype=np.int64)
+  rank = 0
+  for n, i in enumerate(order):
+    if n > 0 and keys[order[n - 1]] < keys[i]:
+      rank += 1
+    ranks[i] = rank
+  return ranks
+
+# dictionary encode an array
+def encodeColumn(arr):
+  (codes, values) = factorize(arr)
+  return DictColumn(codes.astype(np.min_scalar_type(max(len(values) - 1, 0))), values)
+
+# encode codes into the values of newValues, which may repeat values
+def reencodeColumn(codes, newValues):
+  encoded = encodeColumn(newValues)
+  return DictColumn(encoded.codes[codes], encoded.values)
+
+# the dictionary encoded column col followed by the values vals, new values
+# are added to the end of the value table
+def appendEncoded(col, vals):
+  values = col.values.tolist()
+  table = dict((v, i) for i, v in enumerate(values))
+  newCodes = []
+  try:
+    for v in vals.tolist():
+      code = table.get(v)
+      if code == None:
+        code = table[v] = len(values)
+        values.append(v)
+      newCodes.append(code)
+  except TypeError: # unhashable values
+    return np.concatenate((col.decode(), vals))
+  codes = np.concatenate((col.codes.astype(np.int64), np.array(newCodes, dtype=np.int64)))
+  return DictColumn(codes.astype(np.min_scalar_type(len(values) - 1)), toColumn(values))
+
+# the array of a column, decoded if it is a DictColumn
+def decodeColumn(arr):
+  return arr.decode() if isinstance(arr, DictColumn) else arr
+
+# the rows selector of a column, keeping a DictColumn encoded
+def takeColumn(arr, selector):
+  return arr.take(selector) if isinstance(arr, DictColumn) else arr[selector]
+
+# return the concatenation of the ranges [starts[i], starts[i]+counts[i])
+def expandRanges(starts, counts):
+  total = counts.sum()
+  offsets = np.repeat(np.cumsum(counts) - counts, counts)
+  return np.repeat(starts, counts) + np.arange(total) - offsets
+
+# join positions (see ColumnarRelation.joinPositions) matching row i to the
+# rows order[starts[i]:starts[i]+counts[i]]
+def rangePositions(order, starts, counts, inner):
+  emit = counts if inner else np.maximum(counts, 1)
+  leftIdx = np.repeat(np.arange(len(starts)), emit)
+  matched = np.repeat(counts > 0, emit)
+  if len(order) == 0:
+    rightIdx = np.zeros(len(leftIdx), dtype=np.int64)
+  else:
+    rightIdx = order[np.minimum(expandRanges(starts, emit), len(order) - 1)]
+  return (leftIdx, rightIdx, matched)
+
+# a column that is only read (e.g. from disk) the first time it is used
+# load is a function returning the array
+class DeferredColumn(object):
+  def __init__(self, load):
+    self.load = load
+    self.array = None
+
+  def resolve(self):
+    if self.array is None:
+      self.array = self.load()
+    return self.array
+
+# rows per chunk of a zone map
+zoneChunkSize = 65536
+
+# minimum and maximum of each chunk of chunkSize rows of a column
+# hasNan: True for chunks with NaNs (which min and max skip), None if the
+# column can't hold NaNs
+class ZoneMap(object):
+  def __init__(self, chunkSize, mins, maxs, hasNan=None):
+    self.chunkSize = chunkSize
+    self.mins = mins
+    self.maxs = maxs
+    self.hasNan = hasNan
+
+  # build the zone map of an array or DictColumn
+  @staticmethod
+  def build(arr, chunkSize=zoneChunkSize):
+    starts = np.arange(0, len(arr), chunkSize)
+    if len(arr) == 0:
+      return ZoneMap(chunkSize, np.empty(0, dtype=object), np.empty(0, dtype=object))
+    if isinstance(arr, DictColumn):
+      # reduce the ranks of the values, which sort like the values
+      order = np.argsort(arr.values, kind='mergesort')
+      ranks = distinctRanks(arr.values)[arr.codes]
+      mins = arr.values[order[np.minimum.reduceat(ranks, starts)]]
+      maxs = arr.values[order[np.maximum.reduceat(ranks, starts)]]
+      return ZoneMap(chunkSize, mins, maxs)
+    if arr.dtype.kind in 'biuf':
+      hasNan = np.logical_or.reduceat(np.isnan(arr), starts) if arr.dtype.kind == 'f' else None
+      return ZoneMap(chunkSize, np.fmin.reduceat(arr, starts), np.fmax.reduceat(arr, starts), hasNan)
+    chunks = [arr[start:start + chunkSize].tolist() for start in starts.tolist()]
+    return ZoneMap(chunkSize, toColumn(map(min, chunks)), toColumn(map(max, chunks)))
+
+  # classify the chunks for the condition "value of the column op value"
+  # op is a comparison operator or 'in' (value is then a set of values)
+  # returns (chunks that may hold matching rows, chunks holding only
+  # matching rows), or None if the values can't be compared
+  def classify(self, op, value):
+    if op == 'in':
+      maybe = np.zeros(len(self.mins), dtype=bool)
+      sure = np.zeros(len(self.mins), dtype=bool)
+      for val in value:
+        classified = self.classify('==', val)
+        if classified == None:
+          return None
+        maybe |= classified[0]
+        sure |= classified[1]
+      return (maybe, sure)
+    (mins, maxs) = (self.mins, self.maxs)
+    if mins.dtype.kind in 'biuf' and not isinstance(value, (int, long, float, np.number)):
+      return None
+    try:
+      if op == '==':
+        (maybe, sure) = ((mins <= value) & (maxs >= value), (mins == value) & (maxs == value))
+      elif op == '!=':
+        (maybe, sure) = (~((mins == value) & (maxs == value)), (maxs < value) | (mins > value))
+      elif op == '<':
+        (maybe, sure) = (mins < value, maxs < value)
+      elif op == '<=':
+        (maybe, sure) = (mins <= value, maxs <= value)
+      elif op == '>':
+        (maybe, sure) = (maxs > value, mins > value)
+      else:
+        assert op == '>=', "unknown comparison {!r}".format(op)
+        (maybe, sure) = (maxs >= value, mins >= value)
+    except TypeError:
+      return None
+    if np.shape(maybe) != mins.shape or np.shape(sure) != mins.shape: # not compared elementwise
+      return None
+    (maybe, sure) = (np.asarray(maybe, dtype=bool), np.asarray(sure, dtype=bool))
+    if self.hasNan is not None: # NaN only satisfies !=
+      if op == '!=':
+        maybe = maybe | self.hasNan
+      else:
+        sure = sure & ~self.hasNan
+    return (maybe, sure)
+
+# True if fn (a builtin numeric cast) casts the array arr with astype to the
+# values fn gives for each value: arr holds numbers, and if fn makes ints
+# they are finite and fit in an int64 (astype turns NaN into -2**63)
+def castsWhole(arr, fn):
+  if fn not in (int, float, long) or arr.dtype.kind not in 'biuf':
+    return False
+  if fn == float or arr.dtype.kind in 'bi':
+    return True
+  if arr.dtype.kind == 'u':
+    return len(arr) == 0 or arr.max() <= np.iinfo(np.int64).max
+  return bool(np.isfinite(arr).all()) and bool((np.abs(arr) < 2.0 ** 63).all())
+
+# convert a numpy scalar to the equivalent python value
+def toPython(val):
+  return val.item() if isinstance(val, np.generic) else val
+
+class ColumnarRelation(Relational.Relation):
+  # constructor
+  # default (empty relation)
+  # copy (from a Relation or ColumnarRelation)
+  # (tuple(cols), list(tuple(rows)),) as for Relation
+  def __init__(self, arg=None):
+    if arg == None:
+      self.cols = ()
+      self.arrays = []
+      self.length = 0
+    elif isinstance(arg, ColumnarRelation):
+      # operations never modify arrays in place, so they may be shared
+      self.cols = tuple(arg.cols)
+      self.arrays = list(arg.arrayList)
+      self.length = arg.length
+      self.zoneMaps = dict(arg.zoneMaps)
+    elif isinstance(arg, Relational.Relation):
+      self.cols = tuple(arg.cols)
+      self.rows = arg.rows
+    elif (
+           isinstance(arg, tuple) and
+           len(arg) == 2 and
+           isinstance(arg[0], tuple) and
+           isinstance(arg[1], list)
+         ): # input is columns and rows to create relation
+      self.cols = tuple(arg[0])
+      for col in self.cols:
+        assert isinstance(col, str)
+      l = len(self.cols)
+      for row in arg[1]:
+        assert len(row) == l
+      self.rows = arg[1]
+    else:
+      assert False, "ColumnarRelation input invalid: {!r}".format(arg)
+
+  # create a relation directly from column arrays (no copy)
+  @staticmethod
+  def fromArrays(cols, arrays):
+    assert len(cols) == len(arrays), "need one array per column"
+    rel = ColumnarRelation()
+    rel.cols = tuple(cols)
+    rel.arrays = [a if isinstance(a, DictColumn) else toColumn(a) for a in arrays]
+    rel.length = len(rel.arrayList[0]) if len(rel.arrayList) > 0 else 0
+    for a in rel.arrayList:
+      assert len(a) == rel.length, "all columns must have the same length"
+    return rel
+
+  # drop the zone maps too
+  def invalidateIndexes(self):
+    Relational.Relation.invalidateIndexes(self)
+    self.zoneMaps = {}
+
+  # build the zone maps of cols (default: every column)
+  # all zone maps of a relation have the same chunk size, creating them with
+  # another chunk size drops the others
+  def createZoneMaps(self, cols=None, chunkSize=zoneChunkSize):
+    if any(zoneMap.chunkSize != chunkSize for zoneMap in self.zoneMaps.values()):
+      self.zoneMaps = {}
+    for col in self.cols if cols == None else cols:
+      self.zoneMaps[col] = ZoneMap.build(self.rawColumn(col), chunkSize)
+
+  # helper
+  # classify the rows for a predicate Expr with the zone maps
+  # returns (rows that may match, rows that surely match) as boolean masks,
+  # None if no zone map applies to the predicate
+  def zoneCandidates(self, expr):
+    if len(self.zoneMaps) == 0:
+      return None
+    chunkSize = self.zoneMaps.values()[0].chunkSize
+    numChunks = -(-self.length // chunkSize)
+    maybe = np.ones(numChunks, dtype=bool)
+    sure = np.ones(numChunks, dtype=bool)
+    used = False
+    for condition in Expr.conjuncts(expr):
+      compared = Expr.comparison(condition)
+      classified = None
+      if compared != None and compared[0] in self.zoneMaps:
+        classified = self.zoneMaps[compared[0]].classify(compared[1], compared[2])
+      if classified == None:
+        sure[:] = False # the condition has to be evaluated
+      else:
+        used = True
+        maybe &= classified[0]
+        sure &= classified[1]
+    if not used:
+      return None
+    return (np.repeat(maybe, chunkSize)[:self.length], np.repeat(sure, chunkSize)[:self.length])
+
+  # every assignment of arrays (or rows) drops the indexes
+  # reading arrays loads any deferred columns and returns a new list of the
+  # decoded arrays, use column() to read one.  arrayList holds the columns
+  # as they are stored
+  @property
+  def arrays(self):
+    return [self.column(c) for c in self.cols]
+
+  @arrays.setter
+  def arrays(self, arrays):
+    self.arrayList = arrays
+    self.invalidateIndexes()
+
+  def numRows(self):
+    return self.length
+
+  # row tuples are built on demand
+  @property
+  def rows(self):
+    if len(self.cols) == 0:
+      return [()] * self.length
+    return zip(*[self.column(c).tolist() for c in self.cols])
+
+  @rows.setter
+  def rows(self, rows):
+    rows = list(rows)
+    self.length = len(rows)
+    if len(rows) == 0:
+      self.arrays = [np.empty(0, dtype=object) for c in self.cols]
+    else:
+      self.arrays = [toColumn(vals) for vals in zip(*rows)]
+    assert len(self.arrays) == len(self.cols) or self.length == 0
+
+  # return column col as stored: an array or a DictColumn
+  def rawColumn(self, col):
+    assert col in self.cols, "Column {!r} not in cols {!r}".format(col, self.cols)
+    i = self.cols.index(col)
+    if isinstance(self.arrayList[i], DeferredColumn):
+      self.arrayList[i] = self.arrayList[i].resolve()
+    return self.arrayList[i]
+
+  # return the array for column col
+  def column(self, col):
+    return decodeColumn(self.rawColumn(col))
+
+  # return (codes, values) of column col, values[codes] is the column
+  def columnCodes(self, col):
+    arr = self.rawColumn(col)
+    if isinstance(arr, DictColumn):
+      return (arr.codes, arr.values)
+    return factorize(arr)
+
+  # dictionary encode columns cols (default: every object column with at
+  # most half as many distinct values as rows)
+  def encode(self, cols=None):
+    for i, col in enumerate(self.cols):
+      arr = self.rawColumn(col)
+      if isinstance(arr, DictColumn) or (cols != None and col not in cols):
+        continue
+      if cols == None and arr.dtype.kind != 'O':
+        continue
+      try:
+        encoded = encodeColumn(arr)
+      except TypeError: # unhashable values
+        assert cols == None, "can't encode column {!r}, its values can't be hashed".format(col)
+        continue
+      if cols != None or len(encoded.values) * 2 <= self.length:
+        self.arrayList[i] = encoded
+
+  # decode dictionary encoded columns cols (default: all of them)
+  def decode(self, cols=None):
+    for i, col in enumerate(self.cols):
+      if cols == None or col in cols:
+        self.arrayList[i] = self.column(col)
+
+  # helper
+  # integer codes of the keyCols values of this relation and of each of
+  # otherRelations, equal codes iff equal keys (see combineCodes)
+  # returns a list of code arrays, one per relation
+  def sharedKeyCodes(self, keyCols, otherRelations=()):
+    relations = [self] + list(otherRelations)
+    lengths = [rel.length for rel in relations]
+    keyColumns = []
+    for c in keyCols:
+      if any(isinstance(rel.rawColumn(c), DictColumn) for rel in relations):
+        # only the value tables are hashed
+        (codes, numCodes) = unifyCodes([rel.columnCodes(c) for rel in relations])
+        keyColumns.append((np.concatenate(codes), numCodes))
+      else:
+        (codes, uniques) = factorize(np.concatenate([rel.column(c) for rel in relations]))
+        keyColumns.append((codes, len(uniques)))
+    codes = combineCodes(keyColumns, sum(lengths))
+    bounds = np.cumsum([0] + lengths)
+    return [codes[bounds[i]:bounds[i + 1]] for i in range(len(relations))]
+
+  # return an iterator of tuples of the given columns
+  def iterProjected(self, projectCols):
+    return rangeTuples([self.column(c) for c in projectCols], 0, self.length)
+
+  # helper
+  # compute the statistics of every column (see Relation.stats)
+  def computeStats(self):
+    return dict((c, self.columnStats(c)) for c in self.cols)
+
+  # helper
+  # the statistics of column col
+  def columnStats(self, col):
+    arr = self.rawColumn(col)
+    state = Relational.Relation.initialStats()
+    if isinstance(arr, DictColumn):
+      # the values that appear, and how many times
+      counts = np.bincount(arr.codes, minlength=len(arr.values))
+      (vals, counts) = (arr.values[counts > 0].tolist(), counts[counts > 0].tolist())
+      Relational.Relation.addStats(state, vals)
+      stats = Relational.Relation.statsResult(state)
+      present = [(v, n) for v, n in zip(vals, counts) if v != None]
+      stats['count'] = sum(n for v, n in present)
+      if stats['sum'] != None:
+        stats['sum'] = sum(v * n for v, n in present)
+      return stats
+    if arr.dtype.kind in 'biuf':
+      vals = arr[~np.isnan(arr)] if arr.dtype.kind == 'f' else arr
+      if len(vals) == 0:
+        return Relational.Relation.statsResult(state)
+      return {'count': len(vals), 'min': toPython(vals.min()), 'max': toPython(vals.max()),
+              'sum': toPython(vals.sum()), 'distinct': len(np.unique(vals))}
+    Relational.Relation.addStats(state, arr.tolist())
+    return Relational.Relation.statsResult(state)
+
+  # helper
+  # add rows at the end of the columns, see Relation.append
+  # encoded columns stay encoded, the zone maps are dropped
+  def appendRows(self, rows):
+    if len(rows) == 0:
+      return
+    new = ColumnarRelation((self.cols, rows))
+    if self.length == 0:
+      arrays = new.arrayList
+    else:
+      arrays = []
+      for c in self.cols:
+        arr = self.rawColumn(c)
+        if isinstance(arr, DictColumn):
+          arrays.append(appendEncoded(arr, new.column(c)))
+        else:
+          arrays.append(np.concatenate((arr, new.column(c))))
+    self.arrays = arrays
+    self.length += len(rows)
+
+  # helper
+  # apply fn(start, stop) to ranges of range(length), in parallel if
+  # setProcesses was called.  returns the list of results in order
+  def mapRanges(self, fn, length):
+    return Parallel.mapRanges(fn, length, self.processes, self.chunkSize)
+
+  # keep only the rows given by a boolean mask or an index array
+  def takeRows(self, selector):
+    self.arrays = [takeColumn(self.rawColumn(c), selector) for c in self.cols]
+    if selector.dtype == bool:
+      self.length = int(np.count_nonzero(selector))
+    else:
+      self.length = len(selector)
+
+  # convert back to a row oriented Relation
+  def toRelation(self):
+    return Relational.Relation((self.cols, self.rows))
+
+  # projection on relation
+  def project(self, projectCols):
+    assert isinstance(projectCols, tuple), "Projection Fields must be a tuple"
+    for c in projectCols:
+      assert c in self.cols, "Projection Field {!r} not in cols {!r}".format(c, self.cols)
+    # deferred columns stay deferred, zone maps are kept
+    (sortedOn, zoneMaps) = (self.sortedOn, self.zoneMaps)
+    self.arrays = [self.arrayList[self.cols.index(c)] for c in projectCols]
+    self.cols = projectCols
+    self.zoneMaps = dict((c, zoneMaps[c]) for c in projectCols if c in zoneMaps)
+    self.keepSorted(sortedOn)
+
+  # evaluate an Expr on the columns
+  # values numpy can't compute with (e.g. None in arithmetic) are computed
+  # per row instead.  An expression of a single encoded column is evaluated
+  # on its values, and the conditions of & and | separately
+  def evalExpr(self, expr):
+    inputs = expr.columns()
+    if len(inputs) == 1 and isinstance(self.rawColumn(inputs[0]), DictColumn):
+      encoded = self.rawColumn(inputs[0])
+      return ColumnarRelation.fromArrays(inputs, [encoded.values]).evalExpr(expr)[encoded.codes]
+    if isinstance(expr, Expr.BinOp) and expr.op in ('&', '|'):
+      combine = np.logical_and if expr.op == '&' else np.logical_or
+      return combine(self.evalExpr(expr.left), self.evalExpr(expr.right))
+    try:
+      result = expr.evalColumns(self.column, self.length)
+    except (TypeError, AttributeError):
+      return toColumn(map(expr.compileRow(inputs), self.iterProjected(inputs)))
+    return toColumn(result.tolist()) if result.dtype.kind == 'O' else result
+
+  # perform a selection
+  # selectFn is still called once per row, but only the input columns are read
+  # an Expr is evaluated on the whole columns, or only on the chunks of rows
+  # the zone maps can't decide
+  def select(self, selectFn, selectFnColInputs=None):
+    sortedOn = self.sortedOn
+    zones = self.zoneCandidates(selectFn) if isinstance(selectFn, Expr.Expr) else None
+    if zones != None:
+      (maybe, sure) = zones
+      check = np.flatnonzero(maybe & ~sure)
+      inputs = selectFn.columns()
+      checked = ColumnarRelation.fromArrays(inputs, [takeColumn(self.rawColumn(c), check) for c in inputs])
+      mask = sure.copy()
+      mask[check] = checked.evalExpr(selectFn).astype(bool)
+    elif isinstance(selectFn, Expr.Expr):
+      mask = self.evalExpr(selectFn).astype(bool)
+    else:
+      arrays = [self.column(c) for c in selectFnColInputs]
+      def keepRange(start, stop):
+        vals = rangeTuples(arrays, start, stop)
+        return np.fromiter((bool(selectFn(v)) for v in vals), dtype=bool, count=stop - start)
+      mask = np.concatenate(self.mapRanges(keepRange, self.length))
+    self.takeRows(mask)
+    self.keepSorted(sortedOn)
+
+  # generate new column for each tuple
+  def generateCol(self, colName, generateFn, generateFnColInputs=None):
+    if isinstance(generateFn, Expr.Expr):
+      self.arrayList.append(self.evalExpr(generateFn))
+    else:
+      arrays = [self.column(c) for c in generateFnColInputs]
+      def generateRange(start, stop):
+        return [generateFn(v) for v in rangeTuples(arrays, start, stop)]
+      newVals = self.mapRanges(generateRange, self.length)
+      self.arrayList.append(toColumn(list(itertools.chain.from_iterable(newVals))))
+    self.cols = self.cols + (colName,)
+
+  # generate multiple new rows from each row
+  # only the source row index is kept for the old columns
+  def splitAndGenerateCols(self, colNames, generateFn, generateFnColInputs):
+    arrays = self.arrays
+    inputArrays = [self.column(c) for c in generateFnColInputs]
+    def splitRange(start, stop):
+      sourceIdx = []
+      newVals = []
+      rows = rangeTuples(arrays, start, stop)
+      for i, (row, vals) in enumerate(zip(rows, rangeTuples(inputArrays, start, stop)), start):
+        for newColVals in generateFn(row, vals):
+          assert len(newColVals) == len(colNames), "number of new values must match number of new columns"
+          assert isinstance(newColVals, tuple), "new values must be in a tuple"
+          sourceIdx.append(i)
+          newVals.append(newColVals)
+      return (sourceIdx, newVals)
+    chunks = self.mapRanges(splitRange, self.length)
+    sourceIdx = list(itertools.chain.from_iterable(c[0] for c in chunks))
+    newVals = list(itertools.chain.from_iterable(c[1] for c in chunks))
+    self.takeRows(np.array(sourceIdx, dtype=np.int64))
+    if len(newVals) == 0:
+      self.arrayList.extend([np.empty(0, dtype=object) for c in colNames])
+    else:
+      self.arrayList.extend([toColumn(vals) for vals in zip(*newVals)])
+    self.cols = self.cols + colNames
+
+  # left hash join, same semantics as Relation.leftHashJoin
+  # keys from both relations are mapped to integer codes and matched with
+  # a sorted search instead of hashing tuples.  If otherRelation has an index
+  # on joinIndex the left keys are looked up in it instead
+  def leftHashJoin(self, otherRelation, joinIndex, inner=True):
+    otherIndex = otherRelation.getIndex(joinIndex)
+    if not isinstance(otherRelation, ColumnarRelation):
+      otherRelation = ColumnarRelation(otherRelation)
+    Relational.Relation.joinNonIndexCols(self.cols, otherRelation.cols, joinIndex)
+
+    if otherIndex == None:
+      (leftIdx, rightIdx, matched) = self.joinPositions(otherRelation, joinIndex, inner)
+    else:
+      (leftIdx, rightIdx, matched) = self.indexJoinPositions(otherIndex, joinIndex, inner)
+    self.joinRows(otherRelation, joinIndex, leftIdx, rightIdx, matched)
+
+  # internal
+  # replace the rows by the joined rows of this relation and otherRelation
+  # given by the positions of joinPositions
+  def joinRows(self, otherRelation, joinIndex, leftIdx, rightIdx, matched):
+    sortedOn = self.sortedOn
+    myNonIndex = [c for c in self.cols if c not in joinIndex]
+    otherNonIndex = [c for c in otherRelation.cols if c not in joinIndex]
+    newArrays = [takeColumn(self.rawColumn(c), leftIdx) for c in joinIndex]
+    newArrays.extend([takeColumn(self.rawColumn(c), leftIdx) for c in myNonIndex])
+    allMatched = matched.all()
+    for c in otherNonIndex:
+      if allMatched:
+        newArrays.append(takeColumn(otherRelation.rawColumn(c), rightIdx))
+      else: # outer join, include Nones
+        col = otherRelation.column(c)
+        out = np.empty(len(leftIdx), dtype=object)
+        out[matched] = col[rightIdx[matched]].astype(object)
+        newArrays.append(out)
+
+    self.cols = tuple(joinIndex) + tuple(myNonIndex) + tuple(otherNonIndex)
+    self.arrays = newArrays
+    self.length = len(leftIdx)
+    self.keepSorted(sortedOn) # left rows keep their order
+
+  # band join, see Relation.bandJoin
+  # one sorted sweep: the other rows are sorted by key and time, then the
+  # ranges of all rows are found with searchsorted
+  def bandJoin(self, otherRelation, joinIndex, timeCols, before, after, inner=True):
+    if not isinstance(otherRelation, ColumnarRelation):
+      otherRelation = ColumnarRelation(otherRelation)
+    Relational.Relation.joinNonIndexCols(self.cols, otherRelation.cols, joinIndex)
+    times = self.column(timeCols[0])
+    if times.dtype.kind == 'O' or otherRelation.column(timeCols[1]).dtype.kind == 'O':
+      return Relational.Relation.bandJoin(self, otherRelation, joinIndex, timeCols, before, after, inner)
+    (order, (starts, stops)) = self.sweepPositions(otherRelation, joinIndex, timeCols[1],
+        ((times - before, 'left'), (times + after, 'right')))
+    self.joinRows(otherRelation, joinIndex, *rangePositions(order, starts, np.maximum(stops - starts, 0), inner))
+
+  # as-of join, see Relation.asofJoin
+  # like bandJoin, the match of a row is the last one before its time
+  def asofJoin(self, otherRelation, joinIndex, timeCols, tolerance=None, inner=True):
+    if not isinstance(otherRelation, ColumnarRelation):
+      otherRelation = ColumnarRelation(otherRelation)
+    Relational.Relation.joinNonIndexCols(self.cols, otherRelation.cols, joinIndex)
+    times = self.column(timeCols[0])
+    if times.dtype.kind == 'O' or otherRelation.column(timeCols[1]).dtype.kind == 'O':
+      return Relational.Relation.asofJoin(self, otherRelation, joinIndex, timeCols, tolerance, inner)
+    # without a tolerance the earliest time bounds nothing but the key
+    earliest = times - tolerance if tolerance != None else None
+    (order, (starts, stops)) = self.sweepPositions(otherRelation, joinIndex, timeCols[1],
+        ((earliest, 'left'), (times, 'right')))
+    counts = (stops > starts).astype(np.int64)
+    self.joinRows(otherRelation, joinIndex, *rangePositions(order, stops - counts, counts, inner))
+
+  # internal
+  # sort the rows of otherRelation by joinIndex and otherTimeCol, and find
+  # where each row of this relation would go for each of bounds
+  # bounds: list of (array of times per row, searchsorted side), or (None,
+  # side) for the start of the rows with the same key
+  # returns (sorted positions of the other rows, list of positions in them)
+  def sweepPositions(self, otherRelation, joinIndex, otherTimeCol, bounds):
+    n = self.length
+    # dense key codes and time ranks, combined into a code sorting like
+    # (key, time)
+    codes = np.unique(np.concatenate(self.sharedKeyCodes(joinIndex, [otherRelation])), return_inverse=True)[1]
+    (myCodes, otherCodes) = (codes[:n].astype(np.int64), codes[n:].astype(np.int64))
+    boundTimes = [times for (times, side) in bounds if times is not None]
+    (timeValues, ranks) = np.unique(np.concatenate([otherRelation.column(otherTimeCol)] + boundTimes), return_inverse=True)
+    numRanks = len(timeValues)
+    otherKeys = otherCodes * numRanks + ranks[:otherRelation.length]
+    order = np.argsort(otherKeys, kind='mergesort') # equal times keep their order
+    sortedKeys = otherKeys[order]
+
+    positions = []
+    offset = otherRelation.length
+    for (times, side) in bounds:
+      if times is None:
+        positions.append(np.searchsorted(sortedKeys, myCodes * numRanks, side))
+      else:
+        positions.append(np.searchsorted(sortedKeys, myCodes * numRanks + ranks[offset:offset + n], side))
+        offset += n
+    return (order, positions)
+
+  # internal
+  # match the keys of both relations for leftHashJoin
+  # returns arrays (left row, right row, True if the right row matched)
+  def joinPositions(self, otherRelation, joinIndex, inner):
+    (leftCodes, rightCodes) = self.sharedKeyCodes(joinIndex, [otherRelation])
+
+    # stable sort keeps right matches in their original order
+    order = np.argsort(rightCodes, kind='mergesort')
+    sortedRight = rightCodes[order]
+    starts = np.searchsorted(sortedRight, leftCodes, 'left')
+    counts = np.searchsorted(sortedRight, leftCodes, 'right') - starts
+    return rangePositions(order, starts, counts, inner)
+
+  # internal
+  # match the keys of this relation against otherIndex for leftHashJoin
+  def indexJoinPositions(self, otherIndex, joinIndex, inner):
+    leftIdx = []
+    rightIdx = []
+    matched = []
+    for i, key in enumerate(self.iterProjected(joinIndex)):
+      positions = otherIndex.get(key, ())
+      if len(positions) > 0:
+        leftIdx.extend([i] * len(positions))
+        rightIdx.extend(positions)
+        matched.extend([True] * len(positions))
+      elif not inner:
+        leftIdx.append(i)
+        rightIdx.append(0)
+        matched.append(False)
+    return (np.array(leftIdx, dtype=np.int64), np.array(rightIdx, dtype=np.int64), np.array(matched, dtype=bool))
+
+  # keep the rows whose joinIndex values are (not) found in otherRelation,
+  # see Relation.semiJoin.  The keys of both relations are coded together
+  # and looked up with in1d, the Bloom filter is only used if bloomBits is
+  # given
+  def selectKeys(self, otherRelation, joinIndex, found, bloomBits):
+    if bloomBits != None or otherRelation.getIndex(joinIndex) != None:
+      return Relational.Relation.selectKeys(self, otherRelation, joinIndex, found, bloomBits)
+    if not isinstance(otherRelation, ColumnarRelation):
+      otherRelation = ColumnarRelation(otherRelation)
+    sortedOn = self.sortedOn
+    (myCodes, otherCodes) = self.sharedKeyCodes(joinIndex, [otherRelation])
+    self.takeRows(np.in1d(myCodes, otherCodes, invert=not found))
+    self.keepSorted(sortedOn)
+
+  # return True if the relation contains duplicate rows based off the columns in keyCols
+  def hasDuplicates(self, keyCols):
+    if self.getIndex(keyCols) != None:
+      return Relational.Relation.hasDuplicates(self, keyCols)
+    codes = self.sharedKeyCodes(keyCols)[0]
+    return len(np.unique(codes)) != self.length
+
+  # keep only the first row of every distinct keyCols value, see
+  # Relation.distinct.  The rows are found from the key codes
+  def distinct(self, keyCols=None):
+    sortedOn = self.sortedOn
+    firstRows = firstAppearanceIds(self.sharedKeyCodes(self.cols if keyCols == None else keyCols)[0])[1]
+    self.takeRows(np.sort(firstRows))
+    self.keepSorted(sortedOn)
+
+  # return True if the relations contain the same set of keys based off keyCols
+  # if doAssert then die if not a match
+  def keysMatch(self, otherRelation, keyCols, **kwargs):
+    if self.getIndex(keyCols) != None or otherRelation.getIndex(keyCols) != None:
+      return Relational.Relation.keysMatch(self, otherRelation, keyCols, **kwargs)
+    if not isinstance(otherRelation, ColumnarRelation):
+      otherRelation = ColumnarRelation(otherRelation)
+    nLeft = self.length
+    codes = np.concatenate(self.sharedKeyCodes(keyCols, [otherRelation]))
+    leftOnly = np.setdiff1d(codes[:nLeft], codes[nLeft:])
+    rightOnly = np.setdiff1d(codes[nLeft:], codes[:nLeft])
+    match = len(leftOnly) == 0 and len(rightOnly) == 0
+    if 'doAssert' in kwargs and kwargs['doAssert'] and not match:
+      # find one row for every mismatched key to report it
+      (uniqueCodes, firstIdx) = np.unique(codes, return_index=True)
+      keyArrays = [np.concatenate((self.column(c), otherRelation.column(c))) for c in keyCols]
+      def keysOf(mismatched):
+        idx = firstIdx[np.searchsorted(uniqueCodes, mismatched)]
+        return set(zip(*[a[idx].tolist() for a in keyArrays]))
+      assert False, "keys mismatched\nIn left but not right:\n{!r}\nIn right but not left:\n{!r}".format(keysOf(leftOnly), keysOf(rightOnly))
+    return match
+
+  # inner join with all of otherRelations on joinIndex (see joinDataSetsOrDie)
+  # when all relations are columnar the keys of every relation are coded
+  # together once and each relation's rows are gathered by code
+  def joinManyOrDie(self, otherRelations, joinIndex):
+    relations = [self] + list(otherRelations)
+    if not all(isinstance(rel, ColumnarRelation) for rel in relations):
+      return Relational.Relation.joinManyOrDie(self, otherRelations, joinIndex)
+    nonIndexCols = Relational.Relation.joinManyNonIndexCols(relations, joinIndex)
+
+    lengths = [rel.length for rel in relations]
+    bounds = np.cumsum([0] + lengths)
+    # dense codes, so that there is a slot per code
+    codes = np.unique(np.concatenate(self.sharedKeyCodes(joinIndex, relations[1:])), return_inverse=True)[1]
+    numCodes = codes.max() + 1 if len(codes) > 0 else 0
+    # return the set of keys of rel with the given codes
+    def keysOf(rel, relCodes, wanted):
+      idx = np.flatnonzero(np.in1d(relCodes, wanted))
+      return set(zip(*[rel.column(c)[idx].tolist() for c in joinIndex]))
+
+    myCodes = codes[:lengths[0]]
+    newArrays = [self.rawColumn(c) for c in tuple(joinIndex) + nonIndexCols[0]]
+    for i, rel in enumerate(relations):
+      relCodes = codes[bounds[i]:bounds[i + 1]]
+      counts = np.bincount(relCodes, minlength=numCodes)
+      assert (counts <= 1).all(), Relational.Relation.duplicateKeysMessage(rel, i, joinIndex)
+      if i == 0:
+        myPresent = counts > 0
+        continue
+      present = counts > 0
+      if (present != myPresent).any():
+        leftOnly = keysOf(self, myCodes, np.flatnonzero(myPresent & ~present))
+        rightOnly = keysOf(rel, relCodes, np.flatnonzero(present & ~myPresent))
+        assert False, "keys mismatched\nIn left but not right:\n{!r}\nIn right but not left:\n{!r}".format(leftOnly, rightOnly)
+      positions = np.empty(numCodes, dtype=np.int64)
+      positions[relCodes] = np.arange(len(relCodes))
+      gather = positions[myCodes]
+      newArrays.extend([takeColumn(rel.rawColumn(c), gather) for c in nonIndexCols[i]])
+
+    newCols = tuple(joinIndex) + tuple(c for cols in nonIndexCols for c in cols)
+    return ColumnarRelation.fromArrays(newCols, newArrays)
+
+  # keep only the rows whose keyCols values equal the tuple key
+  # uses the index on keyCols if there is one
+  def selectEquals(self, keyCols, key):
+    index = self.getIndex(keyCols)
+    if index == None and any(isinstance(val, (tuple, list)) for val in key):
+      Relational.Relation.selectEquals(self, keyCols, key) # numpy would compare sequences elementwise
+    elif index == None:
+      if len(keyCols) > 0: # compare as an Expr, so that zone maps apply
+        self.select(reduce(operator.and_, [Expr.col(c) == val for c, val in zip(keyCols, key)]))
+    else:
+      self.takeRows(np.array(index.get(key, ()), dtype=np.int64))
+
+  # group rows by the values of keyCols, see Relation.groupBy
+  def groupBy(self, keyCols):
+    return ColumnarGrouping(self, keyCols)
+
+  # compute window functions over partitions of the rows, see Relation.window
+  # rows are sorted by partition and order once, then every window function
+  # computes whole segments
+  def window(self, partitionCols, orderCols, specs):
+    (outCols, fns) = self.resolveWindowSpecs(specs)
+    n = self.length
+    if n == 0:
+      self.arrayList.extend([np.empty(0, dtype=object) for c in outCols])
+      self.cols = self.cols + outCols
+      return
+    partitionCodes = self.sharedKeyCodes(partitionCols)[0]
+    orderRanks = [self.columnRanks(c) for c in orderCols]
+    # lexsort is stable and sorts by the last key first
+    order = np.lexsort(orderRanks[::-1] + [partitionCodes])
+
+    sortedCodes = partitionCodes[order]
+    newPartition = np.concatenate(([True], sortedCodes[1:] != sortedCodes[:-1]))
+    starts = np.flatnonzero(newPartition)
+    counts = np.diff(np.append(starts, n))
+    newKeys = newPartition.copy()
+    for ranks in orderRanks:
+      sortedRanks = ranks[order]
+      newKeys[1:] |= sortedRanks[1:] != sortedRanks[:-1]
+
+    for (fn, inCol) in fns:
+      vals = self.column(inCol)[order] if inCol != None else None
+      if vals is not None and vals.dtype.kind == 'O':
+        # python objects, compute each partition as a list
+        out = toColumn(Windows.WindowFn.computeSegments(fn, vals, starts, counts, newKeys))
+      else:
+        out = toColumn(fn.computeSegments(vals, starts, counts, newKeys))
+      result = np.empty(n, dtype=out.dtype)
+      result[order] = out
+      self.arrayList.append(result)
+    self.cols = self.cols + outCols
+
+  # turn columns into rows, see Relation.unpivot
+  # the id columns are repeated and the value columns interleaved as whole
+  # arrays, the names are a DictColumn of valueCols
+  def unpivot(self, idCols, valueCols, nameCol='name', valueCol='value'):
+    assert isinstance(valueCols, tuple) and len(valueCols) > 0, "value columns must be a non-empty tuple"
+    newCols = idCols + (nameCol, valueCol)
+    assert len(set(newCols)) == len(newCols), "unpivot output columns must be unique: {!r}".format(newCols)
+    k = len(valueCols)
+    rowIdx = np.repeat(np.arange(self.length), k)
+    newArrays = [takeColumn(self.rawColumn(c), rowIdx) for c in idCols]
+    names = np.empty(k, dtype=object)
+    names[:] = list(valueCols)
+    newArrays.append(DictColumn(np.tile(np.arange(k, dtype=np.min_scalar_type(k - 1)), self.length), names))
+    values = [self.column(c) for c in valueCols]
+    if any(v.dtype.kind == 'O' for v in values): # keep the python values as they are
+      values = [v.astype(object) for v in values]
+    newArrays.append(np.column_stack(values).ravel())
+    self.arrays = newArrays
+    self.length *= k
+    self.cols = newCols
+
+  # turn rows into columns, see Relation.pivot
+  # ids and names are numbered by their codes, then every new column is
+  # gathered from the rows at once
+  def pivot(self, idCols, nameCol, valueCol, agg=None, fill=None):
+    source = self
+    if agg != None:
+      source = self.groupBy(idCols + (nameCol,)).agg(((valueCol, agg, valueCol),))
+    (idIds, firstRows) = firstAppearanceIds(source.sharedKeyCodes(idCols)[0])
+    (nameIds, nameRows) = firstAppearanceIds(source.sharedKeyCodes((nameCol,))[0])
+    (numIds, numNames) = (len(firstRows), len(nameRows))
+    newCols = Relational.Relation.pivotCols(idCols, source.column(nameCol)[nameRows].tolist())
+
+    cells = idIds * numNames + nameIds
+    counts = np.bincount(cells, minlength=numIds * numNames)
+    if (counts > 1).any():
+      i = np.flatnonzero(counts[cells] > 1)[0]
+      key = tuple(toPython(source.column(c)[i]) for c in idCols)
+      assert False, "several values for ids {!r} and name {!r}, give an aggregate".format(key, toPython(source.column(nameCol)[i]))
+    cellRows = np.full(numIds * numNames, -1, dtype=np.int64)
+    cellRows[cells] = np.arange(source.length)
+    cellRows = cellRows.reshape(numIds, numNames)
+
+    values = source.column(valueCol)
+    newArrays = [takeColumn(source.rawColumn(c), firstRows) for c in idCols]
+    for j in range(numNames):
+      rows = cellRows[:, j]
+      present = rows >= 0
+      if present.all():
+        newArrays.append(values[rows])
+      else:
+        vals = [fill] * numIds
+        for i, val in zip(np.flatnonzero(present).tolist(), values[rows[present]].tolist()):
+          vals[i] = val
+        newArrays.append(toColumn(vals))
+    self.arrays = newArrays
+    self.length = numIds
+    self.cols = newCols
+
+  # castDict is a dict of {column name -> cast function}
+  # the builtin numeric casts convert whole numeric columns at once (see
+  # castsWhole), anything else is cast per value, reporting the values that
+  # fail as Relation.cast does
+  # encoded columns are cast once per distinct value, and are decoded if
+  # the cast values are numbers
+  def cast(self, castDict):
+    for i, colName in enumerate(self.cols):
+      if colName not in castDict:
+        continue
+      fn = castDict[colName]
+      encoded = self.rawColumn(colName)
+      if isinstance(encoded, DictColumn):
+        arr = encoded.values
+      else:
+        arr = encoded
+        encoded = None
+      if castsWhole(arr, fn):
+        arr = arr.astype(np.int64 if fn != float else np.float64)
+        self.arrayList[i] = arr if encoded == None else arr[encoded.codes]
+        continue
+      def castRange(start, stop):
+        newVals = []
+        for val in arr[start:stop].tolist():
+          try:
+            val = fn(val)
+          except:
+            print "error casting column: {!r}, value: {!r}, type: {!r}".format(colName, val, type(val))
+          newVals.append(val)
+        return newVals
+      newVals = toColumn(list(itertools.chain.from_iterable(self.mapRanges(castRange, len(arr)))))
+      if encoded == None:
+        self.arrayList[i] = newVals
+      elif newVals.dtype.kind != 'O':
+        self.arrayList[i] = newVals[encoded.codes]
+      else:
+        self.arrayList[i] = reencodeColumn(encoded.codes, newVals)
+    self.invalidateIndexes()
+
+  # filterDict is dict of {column name -> bool function (true to keep)}
+  # or a boolean Expr
+  def filter(self, filterDict):
+    if isinstance(filterDict, Expr.Expr):
+      self.select(filterDict)
+      return
+    sortedOn = self.sortedOn
+    mask = np.ones(self.length, dtype=bool)
+    for colName, filterFn in filterDict.items():
+      if colName not in self.cols:
+        continue
+      def keep(val):
+        try:
+          return bool(filterFn(val))
+        except:
+          print "error filtering field: {!r}, value: {!r}, type: {!r}".format(colName, val, type(val))
+          return True
+      encoded = self.rawColumn(colName)
+      if isinstance(encoded, DictColumn): # once per distinct value
+        keepValues = np.fromiter((keep(v) for v in encoded.values.tolist()), dtype=bool, count=len(encoded.values))
+        mask[mask] = keepValues[encoded.codes[mask]]
+        continue
+      vals = encoded[mask]
+      def keepRange(start, stop):
+        return np.fromiter((keep(v) for v in vals[start:stop].tolist()), dtype=bool, count=stop - start)
+      mask[mask] = np.concatenate(self.mapRanges(keepRange, len(vals)))
+    self.takeRows(mask)
+    self.keepSorted(sortedOn)
+
+  # helper
+  # integer ranks of the values of column col, which sort like the values
+  # (like keyFn(value) if keyFn is given, keyFn is called once per distinct
+  # value)
+  def columnRanks(self, col, keyFn=None):
+    arr = self.rawColumn(col)
+    if isinstance(arr, DictColumn):
+      (values, codes) = (arr.values, arr.codes)
+    elif keyFn == None:
+      return np.unique(arr, return_inverse=True)[1]
+    else:
+      (values, codes) = np.unique(arr, return_inverse=True)
+    ranks = distinctRanks(values) if keyFn == None else keyRanks(values.tolist(), keyFn)
+    return ranks[codes]
+
+  # sort the rows by the values of sortCols, see Relation.sort
+  # the rows are ordered by one lexsort of the ranks of the values in each
+  # column (negated for reverse), only the index array is sorted so runSize
+  # is ignored
+  def sort(self, sortCols, reverse=False, runSize=None, keyFns=None):
+    keyFns = {} if keyFns == None else keyFns
+    Relational.Relation.compileProjection(self.cols, sortCols) # check the columns
+    ranks = []
+    for c in sortCols:
+      colRanks = self.columnRanks(c, keyFns[c] if c in keyFns else None)
+      descending = reverse if isinstance(reverse, bool) else c in reverse
+      ranks.append(-colRanks if descending else colRanks)
+    if len(ranks) > 0:
+      # lexsort is stable and sorts by the last key first
+      self.takeRows(np.lexsort(ranks[::-1]))
+    if not reverse and not keyFns:
+      self.declareSorted(sortCols)
+
+# Grouping of a ColumnarRelation
+# rows are sorted by group once, then every aggregate reduces whole segments
+class ColumnarGrouping(Relational.Grouping):
+  def agg(self, aggSpecs):
+    (outCols, aggs) = self.resolveSpecs(aggSpecs)
+    rel = self.relation
+    if rel.length == 0:
+      return ColumnarRelation.fromArrays(self.keyCols + outCols, [[] for c in self.keyCols + outCols])
+
+    (groupIds, firstRows) = firstAppearanceIds(rel.sharedKeyCodes(self.keyCols)[0])
+    order = np.argsort(groupIds, kind='mergesort')
+    counts = np.bincount(groupIds)
+    starts = np.cumsum(counts) - counts
+
+    newArrays = [takeColumn(rel.rawColumn(c), firstRows) for c in self.keyCols]
+    for (agg, inCol) in aggs:
+      vals = rel.column(inCol)[order] if inCol != None else order
+      if vals.dtype.kind == 'O' and not isinstance(agg, Aggregates.Count):
+        # python objects, reduce each group as a list
+        newArrays.append(toColumn(Aggregates.Aggregate.reduceSegments(agg, vals, starts, counts)))
+      else:
+        newArrays.append(toColumn(agg.reduceSegments(vals, starts, counts)))
+    return ColumnarRelation.fromArrays(self.keyCols + outCols, newArrays)
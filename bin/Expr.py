@@ -0,0 +1,249 @@
+#!/usr/bin/python
+#
+# Expressions over the columns of a relation
+#
+# Build expressions from column references and literals with the usual
+# operators, then pass them to Relation.select, Relation.generateCol or
+# Relation.filter in place of a python function:
+#   arithmetic: + - * / // % ** and unary -, abs()  (/ is always true division)
+#   comparisons: == != < <= > >=
+#   boolean: & (and), | (or), ~ (not).  python's and/or/not can't be used
+#   col(c).isin(values), and the functions log, log2, log10, exp, sqrt,
+#   floor, ceil and clip(e, lo, hi)
+#
+# On a ColumnarRelation an expression is evaluated on whole numpy arrays.
+# On rows it is compiled into a single python function.
+#
+# ex:
+#   from Expr import col, log, clip
+#   rel.generateCol('tputPerThread', col('tput') / col('threads'))
+#   rel.select((col('conf') == 'tpcc') & col('threads').isin([1, 2, 4]))
+#   rel.filter(clip(log(col('lat_ns')), 0, 10) > 2)
+
+import __future__
+import math
+import operator
+
+try:
+  import numpy as np
+except ImportError: # only needed to evaluate on columns
+  np = None
+
+# wrap python values as literals
+def toExpr(value):
+  return value if isinstance(value, Expr) else Lit(value)
+
+class Expr(object):
+  def __add__(self, other): return BinOp('+', self, other)
+  def __radd__(self, other): return BinOp('+', other, self)
+  def __sub__(self, other): return BinOp('-', self, other)
+  def __rsub__(self, other): return BinOp('-', other, self)
+  def __mul__(self, other): return BinOp('*', self, other)
+  def __rmul__(self, other): return BinOp('*', other, self)
+  def __div__(self, other): return BinOp('/', self, other)
+  def __rdiv__(self, other): return BinOp('/', other, self)
+  def __truediv__(self, other): return BinOp('/', self, other)
+  def __rtruediv__(self, other): return BinOp('/', other, self)
+  def __floordiv__(self, other): return BinOp('//', self, other)
+  def __rfloordiv__(self, other): return BinOp('//', other, self)
+  def __mod__(self, other): return BinOp('%', self, other)
+  def __rmod__(self, other): return BinOp('%', other, self)
+  def __pow__(self, other): return BinOp('**', self, other)
+  def __rpow__(self, other): return BinOp('**', other, self)
+  def __neg__(self): return Func('neg', self)
+  def __abs__(self): return Func('abs', self)
+
+  def __eq__(self, other): return BinOp('==', self, other)
+  def __ne__(self, other): return BinOp('!=', self, other)
+  def __lt__(self, other): return BinOp('<', self, other)
+  def __le__(self, other): return BinOp('<=', self, other)
+  def __gt__(self, other): return BinOp('>', self, other)
+  def __ge__(self, other): return BinOp('>=', self, other)
+
+  def __and__(self, other): return BinOp('&', self, other)
+  def __rand__(self, other): return BinOp('&', other, self)
+  def __or__(self, other): return BinOp('|', self, other)
+  def __ror__(self, other): return BinOp('|', other, self)
+  def __invert__(self): return Func('not', self)
+
+  __hash__ = object.__hash__
+
+  # catch "a < col('x') < b" and and/or/not, which can't be overloaded
+  def __nonzero__(self):
+    raise TypeError("expressions have no truth value, use & | ~ instead of and/or/not: {!r}".format(self))
+  __bool__ = __nonzero__
+
+  def isin(self, values):
+    return IsIn(self, values)
+
+  # return the tuple of columns the expression reads, in order of appearance
+  def columns(self):
+    cols = []
+    self.collectColumns(cols)
+    return tuple(cols)
+
+  # compile into a python function of a row with columns cols
+  def compileRow(self, cols):
+    consts = []
+    src = "lambda row: " + self.pySource(cols, consts)
+    code = compile(src, "<Expr {!r}>".format(self), "eval", __future__.division.compiler_flag, True)
+    return eval(code, {'math': math, 'consts': consts})
+
+  # evaluate on arrays, getColumn(name) returns the numpy array of a column
+  # returns an array of length values
+  def evalColumns(self, getColumn, length):
+    result = self.evalArrays(getColumn)
+    if not isinstance(result, np.ndarray) or result.ndim == 0:
+      result = np.repeat(np.array([result], dtype=object if not isinstance(result, (int, long, float, bool)) else None), length)
+    return result
+
+class Col(Expr):
+  def __init__(self, name):
+    assert isinstance(name, str), "column name must be a string: {!r}".format(name)
+    self.name = name
+  def collectColumns(self, cols):
+    if self.name not in cols:
+      cols.append(self.name)
+  def pySource(self, cols, consts):
+    assert self.name in cols, "Column {!r} not in cols {!r}".format(self.name, cols)
+    return "row[{}]".format(cols.index(self.name))
+  def evalArrays(self, getColumn):
+    return getColumn(self.name)
+  def __repr__(self):
+    return "col({!r})".format(self.name)
+
+class Lit(Expr):
+  def __init__(self, value):
+    self.value = value
+  def collectColumns(self, cols):
+    pass
+  def pySource(self, cols, consts):
+    consts.append(self.value)
+    return "consts[{}]".format(len(consts) - 1)
+  def evalArrays(self, getColumn):
+    return self.value
+  def __repr__(self):
+    return repr(self.value)
+
+# {operator -> (python source operator, function on arrays)}
+binaryOps = {
+  '+'  : ('+', operator.add),
+  '-'  : ('-', operator.sub),
+  '*'  : ('*', operator.mul),
+  '/'  : ('/', operator.truediv),
+  '//' : ('//', operator.floordiv),
+  '%'  : ('%', operator.mod),
+  '**' : ('**', operator.pow),
+  '==' : ('==', operator.eq),
+  '!=' : ('!=', operator.ne),
+  '<'  : ('<', operator.lt),
+  '<=' : ('<=', operator.le),
+  '>'  : ('>', operator.gt),
+  '>=' : ('>=', operator.ge),
+  '&'  : ('and', lambda a, b: np.logical_and(a, b)),
+  '|'  : ('or', lambda a, b: np.logical_or(a, b)),
+}
+
+class BinOp(Expr):
+  def __init__(self, op, left, right):
+    self.op = op
+    self.left = toExpr(left)
+    self.right = toExpr(right)
+  def collectColumns(self, cols):
+    self.left.collectColumns(cols)
+    self.right.collectColumns(cols)
+  def pySource(self, cols, consts):
+    return "({} {} {})".format(self.left.pySource(cols, consts), binaryOps[self.op][0], self.right.pySource(cols, consts))
+  def evalArrays(self, getColumn):
+    return binaryOps[self.op][1](self.left.evalArrays(getColumn), self.right.evalArrays(getColumn))
+  def __repr__(self):
+    return "({!r} {} {!r})".format(self.left, self.op, self.right)
+
+# {function -> (python source template, function on arrays)}
+functions = {
+  'neg'   : ("(-{})", lambda a: -a),
+  'not'   : ("(not {})", lambda a: np.logical_not(a)),
+  'abs'   : ("abs({})", lambda a: np.abs(a)),
+  'log'   : ("math.log({})", lambda a: np.log(a)),
+  'log2'  : ("math.log({}, 2)", lambda a: np.log2(a)),
+  'log10' : ("math.log10({})", lambda a: np.log10(a)),
+  'exp'   : ("math.exp({})", lambda a: np.exp(a)),
+  'sqrt'  : ("math.sqrt({})", lambda a: np.sqrt(a)),
+  'floor' : ("math.floor({})", lambda a: np.floor(a)),
+  'ceil'  : ("math.ceil({})", lambda a: np.ceil(a)),
+  'clip'  : ("min(max({}, {}), {})", lambda a, lo, hi: np.clip(a, lo, hi)),
+}
+
+class Func(Expr):
+  def __init__(self, name, *args):
+    assert name in functions, "unknown function {!r}".format(name)
+    self.name = name
+    self.args = [toExpr(a) for a in args]
+  def collectColumns(self, cols):
+    for a in self.args:
+      a.collectColumns(cols)
+  def pySource(self, cols, consts):
+    return functions[self.name][0].format(*[a.pySource(cols, consts) for a in self.args])
+  def evalArrays(self, getColumn):
+    return functions[self.name][1](*[a.evalArrays(getColumn) for a in self.args])
+  def __repr__(self):
+    return "{}({})".format(self.name, ", ".join(repr(a) for a in self.args))
+
+class IsIn(Expr):
+  def __init__(self, expr, values):
+    self.expr = toExpr(expr)
+    self.values = frozenset(values)
+  def collectColumns(self, cols):
+    self.expr.collectColumns(cols)
+  def pySource(self, cols, consts):
+    consts.append(self.values)
+    return "({} in consts[{}])".format(self.expr.pySource(cols, consts), len(consts) - 1)
+  # values are only compared with the column's values as python compares
+  # them: numbers with numbers, everything else as objects
+  def evalArrays(self, getColumn):
+    arr = self.expr.evalArrays(getColumn)
+    values = list(self.values)
+    if arr.dtype.kind in 'biuf':
+      values = [v for v in values if isinstance(v, (bool, int, long, float, np.number, np.bool_))]
+      return np.in1d(arr, np.array(values, dtype=arr.dtype if len(values) == 0 else None))
+    objectValues = np.empty(len(values), dtype=object)
+    objectValues[:] = values
+    return np.in1d(arr.astype(object), objectValues)
+  def __repr__(self):
+    return "{!r}.isin({!r})".format(self.expr, sorted(self.values))
+
+# split an Expr into the conditions it ands together
+def conjuncts(expr):
+  if isinstance(expr, BinOp) and expr.op == '&':
+    return conjuncts(expr.left) + conjuncts(expr.right)
+  return [expr]
+
+flippedComparisons = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+# return (column, operator, value) if expr compares a column to a literal
+# (column, 'in', frozenset of values) for isin, None for anything else
+def comparison(expr):
+  if isinstance(expr, IsIn) and isinstance(expr.expr, Col):
+    return (expr.expr.name, 'in', expr.values)
+  if not isinstance(expr, BinOp) or expr.op not in flippedComparisons:
+    return None
+  if isinstance(expr.left, Col) and isinstance(expr.right, Lit):
+    return (expr.left.name, expr.op, expr.right.value)
+  if isinstance(expr.left, Lit) and isinstance(expr.right, Col):
+    return (expr.right.name, flippedComparisons[expr.op], expr.left.value)
+  return None
+
+def col(name):
+  return Col(name)
+
+def lit(value):
+  return Lit(value)
+
+def log(e): return Func('log', e)
+def log2(e): return Func('log2', e)
+def log10(e): return Func('log10', e)
+def exp(e): return Func('exp', e)
+def sqrt(e): return Func('sqrt', e)
+def floor(e): return Func('floor', e)
+def ceil(e): return Func('ceil', e)
+def clip(e, lo, hi): return Func('clip', e, lo, hi)
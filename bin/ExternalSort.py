@@ -0,0 +1,150 @@
+#!/usr/bin/python
+#
+# External merge sort: sort more rows than fit in memory
+#
+# rows are read in runs of runSize rows.  Each run is sorted in memory and
+# spilled to a temporary file.  Iterating the result merges the runs lazily
+# with a heap, holding only one batch of rows per run in memory.  Like
+# sorted(), the sort is stable and takes key and reverse.
+#
+# ex:
+#   rows = ExternalSort.externalSort(ExternalSort.drainList(rows), key=operator.itemgetter(0), runSize=100000)
+#   for row in rows:
+#     ...
+
+import heapq
+import os
+import tempfile
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+# rows sorted in memory at a time
+defaultRunSize = 1000000
+
+# rows pickled together in a run file
+batchSize = 1000
+
+# yield the items of a list, removing them from the list, so that each item
+# can be freed once it has been spilled
+def drainList(items):
+  items.reverse()
+  while len(items) > 0:
+    yield items.pop()
+
+# a key that sorts in the opposite order of the key it wraps
+class ReverseKey(object):
+  __slots__ = ('key',)
+  def __init__(self, key):
+    self.key = key
+  def __lt__(self, other):
+    return other.key < self.key
+  def __gt__(self, other):
+    return other.key > self.key
+  def __le__(self, other):
+    return other.key <= self.key
+  def __ge__(self, other):
+    return other.key >= self.key
+  def __eq__(self, other):
+    return self.key == other.key
+  def __ne__(self, other):
+    return self.key != other.key
+
+# wrap the key function keyFn so that it sorts in reverse
+def reverseKey(keyFn):
+  return lambda row: ReverseKey(keyFn(row))
+
+# write a sorted run to a temporary file in tempDir, return its name
+def writeRun(rows, tempDir):
+  (fd, fileName) = tempfile.mkstemp(prefix='sortrun', dir=tempDir)
+  with os.fdopen(fd, 'wb') as f:
+    for start in range(0, len(rows), batchSize):
+      pickle.dump(rows[start:start + batchSize], f, pickle.HIGHEST_PROTOCOL)
+  return fileName
+
+# iterate the rows of a run file
+def readRun(fileName):
+  with open(fileName, 'rb') as f:
+    while True:
+      try:
+        batch = pickle.load(f)
+      except EOFError:
+        return
+      for row in batch:
+        yield row
+
+# merge sorted iterators of rows into one sorted iterator
+# ties are taken from the earliest run first, so the merge is stable
+def mergeRuns(runs, key=None, reverse=False):
+  keyFn = (lambda row: row) if key == None else key
+  if reverse:
+    keyFn = reverseKey(keyFn)
+  heap = []
+  for i, run in enumerate(runs):
+    for row in run:
+      heap.append((keyFn(row), i, row, run))
+      break
+  heapq.heapify(heap)
+  while len(heap) > 0:
+    (k, i, row, run) = heap[0]
+    yield row
+    for row in run:
+      heapq.heapreplace(heap, (keyFn(row), i, row, run))
+      break
+    else:
+      heapq.heappop(heap)
+
+# the result of an external sort: sorted runs spilled to files
+# can be iterated several times, each iteration merges the runs again.
+# the files are removed by close() or when the object is freed
+class SortedRuns(object):
+  def __init__(self, fileNames, length, key=None, reverse=False):
+    self.fileNames = fileNames
+    self.length = length
+    self.key = key
+    self.reverse = reverse
+
+  def __len__(self):
+    return self.length
+
+  def __iter__(self):
+    return mergeRuns([readRun(fileName) for fileName in self.fileNames], self.key, self.reverse)
+
+  def close(self):
+    for fileName in self.fileNames:
+      if os.path.exists(fileName):
+        os.remove(fileName)
+    self.fileNames = []
+
+  def __del__(self):
+    self.close()
+
+# sort the iterable rows, keeping at most runSize rows in memory
+# tempDir: directory of the run files (default: the system temp directory)
+# returns a sorted list if the rows fit in a single run, a SortedRuns
+# otherwise
+def externalSort(rows, key=None, reverse=False, runSize=defaultRunSize, tempDir=None):
+  assert runSize > 0, "runSize must be positive"
+  fileNames = []
+  length = 0
+  rows = iter(rows)
+  try:
+    while True:
+      run = []
+      for row in rows:
+        run.append(row)
+        if len(run) == runSize:
+          break
+      run.sort(key=key, reverse=reverse)
+      length += len(run)
+      if len(fileNames) == 0 and len(run) < runSize:
+        return run # fits in memory
+      if len(run) > 0:
+        fileNames.append(writeRun(run, tempDir))
+      if len(run) < runSize:
+        return SortedRuns(fileNames, length, key, reverse)
+  except:
+    SortedRuns(fileNames, length).close()
+    raise
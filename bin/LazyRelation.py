@@ -0,0 +1,449 @@
+#!/usr/bin/python
+#
+# Lazy relations
+# A LazyRelation supports the same operations as Relational.Relation, but
+# project, select, generateCol, splitAndGenerateCols, leftHashJoin, cast and
+# filter only add a node to a logical plan.  The plan is optimized and run in
+# a single pass the first time rows are needed (reading rows, toStr,
+# hasDuplicates, keysMatch, mins, ...).
+#
+# optimizations:
+#   predicate pushdown: select and filter are moved below projections,
+#     generated columns, casts of other columns and joins
+#   projection pruning: columns that nothing above needs are dropped as early
+#     as possible, in particular before a join hashes its inputs.  Generated
+#     columns that are never used are not computed at all
+#   fusion: consecutive projections and casts are merged, and every chain of
+#     row operations between joins runs as a single pipeline without
+#     materializing intermediate lists
+#
+# functions passed to select/generateCol/filter may be run in a different
+# order than they were added, and not at all for rows that are filtered out
+# earlier.  They should not have side effects.  Predicates (select and
+# filter) keep their order among themselves, so a predicate may rely on an
+# earlier one, e.g. to skip None values.
+#
+# ex:
+#   rel = LazyRelation(relation)
+#   rel.cast({'lat_ns': int})
+#   rel.leftHashJoin(otherRelation, ('exp',))
+#   rel.select(lambda (lat,): lat > 100, ('lat_ns',))
+#   rel.project(('exp', 'lat_ns'))
+#   print rel.explain()
+#   rows = rel.rows # runs the plan
+#
+# a select or filter on an Expr (see Expr.py) that ands several conditions
+# becomes one Select per condition, so each is pushed down as far as it can go
+
+from Relational import Relation
+import Expr
+
+##################
+#
+# logical plan nodes
+# every node has a tuple cols, a tuple of children, and execute() returning
+# an iterator of rows
+#
+##################
+
+# the rows of an existing relation, possibly only some of its columns
+class Scan(object):
+  def __init__(self, relation, cols=None):
+    self.relation = relation
+    self.cols = tuple(relation.cols) if cols == None else cols
+    self.children = ()
+
+  def withCols(self, cols):
+    return Scan(self.relation, cols)
+
+  def describe(self):
+    return "Scan {!r}".format(self.cols)
+
+  def execute(self):
+    if self.cols == tuple(self.relation.cols):
+      return iter(self.relation.rows)
+    if hasattr(self.relation, 'iterProjected'): # only read the needed columns
+      return iter(self.relation.iterProjected(self.cols))
+    projectFn = Relation.compileProjection(tuple(self.relation.cols), self.cols)
+    return (projectFn(row) for row in self.relation.rows)
+
+class Project(object):
+  def __init__(self, child, cols):
+    for col in cols:
+      assert col in child.cols, "Projection Field {!r} not in cols {!r}".format(col, child.cols)
+    self.child = child
+    self.cols = tuple(cols)
+    self.children = (child,)
+
+  def withChildren(self, child):
+    return Project(child, self.cols)
+
+  def describe(self):
+    return "Project {!r}".format(self.cols)
+
+  def execute(self):
+    projectFn = Relation.compileProjection(self.child.cols, self.cols)
+    return (projectFn(row) for row in self.child.execute())
+
+class Cast(object):
+  def __init__(self, child, castDict):
+    self.child = child
+    self.castDict = dict((c, fn) for c, fn in castDict.items() if c in child.cols)
+    self.cols = child.cols
+    self.children = (child,)
+
+  def withChildren(self, child):
+    return Cast(child, self.castDict)
+
+  def describe(self):
+    return "Cast {!r}".format(tuple(sorted(self.castDict.keys())))
+
+  def execute(self):
+    castRow = Relation.compileCast(self.child.cols, self.castDict)
+    return (castRow(row) for row in self.child.execute())
+
+# a filter on a single column
+class Filter(object):
+  def __init__(self, child, col, filterFn):
+    self.child = child
+    self.col = col
+    self.filterFn = filterFn
+    self.inputs = (col,)
+    self.cols = child.cols
+    self.children = (child,)
+
+  def withChildren(self, child):
+    return Filter(child, self.col, self.filterFn)
+
+  def describe(self):
+    return "Filter {!r}".format(self.col)
+
+  def execute(self):
+    keepRow = Relation.compileFilter(self.child.cols, {self.col: self.filterFn})
+    return (row for row in self.child.execute() if keepRow(row))
+
+class Select(object):
+  def __init__(self, child, selectFn, inputs):
+    self.child = child
+    self.selectFn = selectFn
+    self.inputs = inputs
+    self.cols = child.cols
+    self.children = (child,)
+
+  def withChildren(self, child):
+    return Select(child, self.selectFn, self.inputs)
+
+  def describe(self):
+    if isinstance(self.selectFn, Expr.Expr):
+      return "Select {!r}".format(self.selectFn)
+    return "Select {!r}".format(self.inputs)
+
+  def execute(self):
+    keepRow = Relation.compileRowFn(self.child.cols, self.selectFn, self.inputs)
+    return (row for row in self.child.execute() if keepRow(row))
+
+class Generate(object):
+  def __init__(self, child, colName, generateFn, inputs):
+    self.child = child
+    self.colName = colName
+    self.generateFn = generateFn
+    self.inputs = inputs
+    self.newCols = (colName,)
+    self.cols = child.cols + (colName,)
+    self.children = (child,)
+
+  def withChildren(self, child):
+    return Generate(child, self.colName, self.generateFn, self.inputs)
+
+  def describe(self):
+    return "Generate {!r} from {!r}".format(self.colName, self.inputs)
+
+  def execute(self):
+    rowFn = Relation.compileRowFn(self.child.cols, self.generateFn, self.inputs)
+    return (row + (rowFn(row),) for row in self.child.execute())
+
+# splitAndGenerateCols passes the whole row to generateFn, so every column of
+# the child is needed
+class Split(object):
+  def __init__(self, child, colNames, generateFn, inputs):
+    self.child = child
+    self.newCols = colNames
+    self.generateFn = generateFn
+    self.inputs = inputs
+    self.cols = child.cols + colNames
+    self.children = (child,)
+
+  def withChildren(self, child):
+    return Split(child, self.newCols, self.generateFn, self.inputs)
+
+  def describe(self):
+    return "Split {!r} from {!r}".format(self.newCols, self.inputs)
+
+  def execute(self):
+    projectFn = Relation.compileProjection(self.child.cols, self.inputs)
+    for row in self.child.execute():
+      for newColVals in self.generateFn(row, projectFn(row)):
+        assert len(newColVals) == len(self.newCols), "number of new values must match number of new columns"
+        assert isinstance(newColVals, tuple), "new values must be in a tuple"
+        yield row + newColVals
+
+class Join(object):
+  def __init__(self, left, right, joinIndex, inner):
+    self.left = left
+    self.right = right
+    self.joinIndex = tuple(joinIndex)
+    self.inner = inner
+    myNonIndex = tuple(c for c in left.cols if c not in joinIndex)
+    otherNonIndex = tuple(c for c in right.cols if c not in joinIndex)
+    intersection = set(myNonIndex) & set(otherNonIndex)
+    assert len(intersection) == 0, "non-index fields in common while joining: {!r}".format(intersection)
+    self.cols = self.joinIndex + myNonIndex + otherNonIndex
+    self.children = (left, right)
+
+  def withChildren(self, left, right):
+    return Join(left, right, self.joinIndex, self.inner)
+
+  def describe(self):
+    return "{} Join on {!r}".format("Inner" if self.inner else "Left Outer", self.joinIndex)
+
+  def execute(self):
+    return Relation.hashJoinRows(
+        self.left.cols, self.left.execute(),
+        self.right.cols, self.right.execute(),
+        self.joinIndex, self.inner)[1]
+
+##################
+#
+# optimizer
+#
+##################
+
+# rebuild node with new children
+def withChildren(node, children):
+  if len(node.children) == 0:
+    return node
+  return node.withChildren(*children)
+
+# move every Filter and Select as far down the plan as it can go
+def pushPredicates(node):
+  children = [pushPredicates(c) for c in node.children]
+  if isinstance(node, (Filter, Select)):
+    return sinkPredicate(node, children[0])
+  return withChildren(node, children)
+
+# place predicate pred on top of child, or below it when that is equivalent
+# pred stays above the predicates below it, which may guard it
+def sinkPredicate(pred, child):
+  inputs = set(pred.inputs)
+  if isinstance(child, Project):
+    return child.withChildren(sinkPredicate(pred, child.child))
+  if isinstance(child, (Generate, Split)) and len(inputs & set(child.newCols)) == 0:
+    return child.withChildren(sinkPredicate(pred, child.child))
+  if isinstance(child, Cast) and len(inputs & set(child.castDict.keys())) == 0:
+    return child.withChildren(sinkPredicate(pred, child.child))
+  if isinstance(child, Join):
+    # join keys and left columns always come from the left side
+    if inputs <= set(child.left.cols):
+      return child.withChildren(sinkPredicate(pred, child.left), child.right)
+    if child.inner and inputs <= set(child.right.cols):
+      return child.withChildren(child.left, sinkPredicate(pred, child.right))
+  return pred.withChildren(child)
+
+# drop every column that is not needed by the parent of node
+# required is the set of columns the parent reads from node
+# the output of the returned node keeps the relative order of node.cols
+def pruneColumns(node, required):
+  if isinstance(node, Scan):
+    return node.withCols(tuple(c for c in node.cols if c in required))
+  if isinstance(node, Project):
+    cols = tuple(c for c in node.cols if c in required)
+    return Project(pruneColumns(node.child, set(cols)), cols)
+  if isinstance(node, Cast):
+    child = pruneColumns(node.child, required)
+    castDict = dict((c, fn) for c, fn in node.castDict.items() if c in required)
+    return Cast(child, castDict) if len(castDict) > 0 else child
+  if isinstance(node, (Filter, Select)):
+    return node.withChildren(pruneColumns(node.child, required | set(node.inputs)))
+  if isinstance(node, Generate):
+    if node.colName not in required: # never used, don't compute it
+      return pruneColumns(node.child, required)
+    return node.withChildren(pruneColumns(node.child, (required - set(node.newCols)) | set(node.inputs)))
+  if isinstance(node, Split):
+    return node.withChildren(pruneColumns(node.child, set(node.child.cols)))
+  if isinstance(node, Join):
+    keys = set(node.joinIndex)
+    left = pruneColumns(node.left, (required & set(node.left.cols)) | keys)
+    right = pruneColumns(node.right, (required & set(node.right.cols)) | keys)
+    return node.withChildren(left, right)
+  assert False, "unknown plan node {!r}".format(node)
+
+# merge consecutive projections and casts, drop projections that keep
+# every column in order
+def fuse(node):
+  node = withChildren(node, [fuse(c) for c in node.children])
+  if isinstance(node, Project):
+    child = node.child
+    if isinstance(child, Project):
+      return Project(child.child, node.cols)
+    if isinstance(child, Scan):
+      return child.withCols(node.cols)
+    if node.cols == child.cols:
+      return child
+  if isinstance(node, Cast) and isinstance(node.child, Cast):
+    inner = node.child.castDict
+    castDict = dict(inner)
+    for c, fn in node.castDict.items():
+      castDict[c] = composeCasts(inner[c], fn) if c in inner else fn
+    return Cast(node.child.child, castDict)
+  return node
+
+def composeCasts(first, second):
+  return lambda val: second(first(val))
+
+def optimize(plan):
+  optimized = fuse(pruneColumns(pushPredicates(plan), set(plan.cols)))
+  if optimized.cols != plan.cols:
+    optimized = fuse(Project(optimized, plan.cols))
+  return optimized
+
+# return a printable representation of a plan, one node per line
+def planToStr(node, depth=0):
+  out = "  " * depth + node.describe()
+  for child in node.children:
+    out += "\n" + planToStr(child, depth + 1)
+  return out
+
+##################
+#
+# the relation
+#
+##################
+
+class LazyRelation(Relation):
+  # constructor
+  # default (empty relation)
+  # from a Relation (copied, so later changes to it are not seen)
+  # from a LazyRelation (copies the plan)
+  # (tuple(cols), list(tuple(rows)),) as for Relation
+  def __init__(self, arg=None):
+    if isinstance(arg, LazyRelation):
+      self.plan = arg.plan
+    elif isinstance(arg, Relation):
+      self.plan = Scan(type(arg)(arg))
+    else:
+      self.plan = Scan(Relation(arg))
+
+  # every change of the plan drops the indexes
+  @property
+  def plan(self):
+    return self.planNode
+
+  @plan.setter
+  def plan(self, plan):
+    self.planNode = plan
+    self.invalidateIndexes()
+
+  @property
+  def cols(self):
+    return self.plan.cols
+
+  # run the plan
+  # the result replaces the plan so that it is only run once
+  @property
+  def rows(self):
+    if not isinstance(self.plan, Scan) or self.plan.cols != tuple(self.plan.relation.cols):
+      self.plan = Scan(self.collect())
+    return self.plan.relation.rows
+
+  @rows.setter
+  def rows(self, rows):
+    self.plan = Scan(Relation((self.cols, list(rows))))
+
+  # appended rows are added to the result of the plan
+  def appendRows(self, rows):
+    self.rows # run the plan
+    self.plan.relation.append(rows)
+
+  # run the optimized plan and return the result as a new Relation
+  def collect(self):
+    plan = optimize(self.plan)
+    return Relation((plan.cols, list(plan.execute())))
+
+  # return the plan and the optimized plan as a string
+  def explain(self):
+    return "plan:\n" + planToStr(self.plan) + "\noptimized:\n" + planToStr(optimize(self.plan))
+
+  def project(self, projectCols):
+    assert isinstance(projectCols, tuple), "Projection Fields must be a tuple"
+    self.plan = Project(self.plan, projectCols)
+
+  def select(self, selectFn, selectFnColInputs=None):
+    if isinstance(selectFn, Expr.Expr):
+      for conjunct in Expr.conjuncts(selectFn):
+        Relation.compileProjection(self.cols, conjunct.columns()) # check the inputs exist
+        self.plan = Select(self.plan, conjunct, conjunct.columns())
+      return
+    Relation.compileProjection(self.cols, selectFnColInputs) # check the inputs exist
+    self.plan = Select(self.plan, selectFn, selectFnColInputs)
+
+  def generateCol(self, colName, generateFn, generateFnColInputs=None):
+    if isinstance(generateFn, Expr.Expr):
+      generateFnColInputs = generateFn.columns()
+    Relation.compileProjection(self.cols, generateFnColInputs)
+    self.plan = Generate(self.plan, colName, generateFn, generateFnColInputs)
+
+  def splitAndGenerateCols(self, colNames, generateFn, generateFnColInputs):
+    Relation.compileProjection(self.cols, generateFnColInputs)
+    self.plan = Split(self.plan, colNames, generateFn, generateFnColInputs)
+
+  # otherRelation may be lazy as well, its plan becomes part of this one
+  def leftHashJoin(self, otherRelation, joinIndex, inner=True):
+    if isinstance(otherRelation, LazyRelation):
+      otherPlan = otherRelation.plan
+    else:
+      otherPlan = Scan(type(otherRelation)(otherRelation))
+    self.plan = Join(self.plan, otherPlan, joinIndex, inner)
+
+  def cast(self, castDict):
+    self.plan = Cast(self.plan, castDict)
+
+  # window functions need all rows of a partition, so the plan runs first
+  def window(self, partitionCols, orderCols, specs):
+    rel = self.collect()
+    rel.window(partitionCols, orderCols, specs)
+    self.plan = Scan(rel)
+
+  # band and as-of joins run the plan first
+  def bandJoin(self, otherRelation, joinIndex, timeCols, before, after, inner=True):
+    rel = self.collect()
+    rel.bandJoin(otherRelation, joinIndex, timeCols, before, after, inner)
+    self.plan = Scan(rel)
+
+  def asofJoin(self, otherRelation, joinIndex, timeCols, tolerance=None, inner=True):
+    rel = self.collect()
+    rel.asofJoin(otherRelation, joinIndex, timeCols, tolerance, inner)
+    self.plan = Scan(rel)
+
+  # unpivot splits every row into one row per value column, so selects on
+  # the id columns are still pushed below it
+  def unpivot(self, idCols, valueCols, nameCol='name', valueCol='value'):
+    assert isinstance(valueCols, tuple) and len(valueCols) > 0, "value columns must be a non-empty tuple"
+    self.splitAndGenerateCols((nameCol, valueCol), lambda row, vals: zip(valueCols, vals), valueCols)
+    self.project(idCols + (nameCol, valueCol))
+
+  # pivot needs all rows of the same ids, so the plan runs first
+  def pivot(self, idCols, nameCol, valueCol, agg=None, fill=None):
+    rel = self.collect()
+    rel.pivot(idCols, nameCol, valueCol, agg, fill)
+    self.plan = Scan(rel)
+
+  # each column of filterDict becomes its own filter so that they can be
+  # pushed down independently
+  # (a boolean Expr is a select)
+  def filter(self, filterDict):
+    if isinstance(filterDict, Expr.Expr):
+      self.select(filterDict)
+      return
+    for col in self.cols:
+      if col in filterDict:
+        self.plan = Filter(self.plan, col, filterDict[col])
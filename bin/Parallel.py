@@ -0,0 +1,49 @@
+#!/usr/bin/python
+#
+# Run row-wise relation operations on ranges of rows in a pool of processes
+#
+# the functions given to relation operations are usually lambdas, which
+# can't be pickled.  So the work is not sent to the workers: it is kept in a
+# module global and a new pool is forked for each operation.  The workers
+# inherit the function and the relation's rows or column arrays (copy on
+# write, nothing is copied up front) and only send their results back.
+# Results come back in row order.
+#
+# needs processes to be forked (not available on Windows)
+#
+# ex:
+#   rel.setProcesses(32)
+#   rel.generateCol('tputPerThread', lambda (tput, threads): tput / threads, ('tput', 'threads'))
+
+import multiprocessing
+
+# rows below which an operation is not split
+minChunkSize = 10000
+
+# the function of the running operation, inherited by the workers
+task = None
+
+# internal, runs in a worker
+def runRange(bounds):
+  return task(*bounds)
+
+# apply fn(start, stop) to consecutive ranges of range(length)
+# processes: number of worker processes, 1 runs fn once on the whole range
+# chunkSize: rows per range, default splits into about 4 ranges per process
+# returns the list of the results of each range, in order
+def mapRanges(fn, length, processes, chunkSize=None):
+  global task
+  if chunkSize == None:
+    chunkSize = max(minChunkSize, -(-length // (processes * 4)))
+  # workers are daemons and can't start pools of their own
+  if processes <= 1 or length <= chunkSize or multiprocessing.current_process().daemon:
+    return [fn(0, length)]
+  bounds = [(start, min(start + chunkSize, length)) for start in range(0, length, chunkSize)]
+  task = fn
+  pool = multiprocessing.Pool(min(processes, len(bounds)))
+  try:
+    return pool.map(runRange, bounds, 1)
+  finally:
+    task = None
+    pool.close()
+    pool.join()
@@ -9,6 +9,10 @@
 #
 # general data is expected to have fields given by tuple "Columns"
 # and rows of values as a list of tuples in "Rows"
+#
+# set "SortRunSize" to sort the rows with an external merge sort keeping at
+# most that many rows in memory (see ExternalSort.py).  "Rows" is then an
+# iterable of the sorted rows rather than a list
 import matplotlib 
 import matplotlib.pyplot as plt
 import operator
@@ -18,6 +22,7 @@ import os.path
 import collections
 
 import CmpToKey
+import ExternalSort
 
 from PlotFnsCommon import defaultFns
 
@@ -58,28 +63,45 @@ def reorder(plotVars):
       assert item in plotVars['Columns']
       columnsList.append(item)
 
-  # reorder columns within tuples
-  newRows = []
-  for r in plotVars['Rows']:
-    rList = []
-    for c in columnsList:
-      oldIDX = plotVars['Columns'].index(c)
-      rList.append(r[oldIDX])
-    newRow = tuple(rList)
-    newRows.append(newRow)
-
+  # reorder columns within tuples, column positions are looked up once
+  positions = [plotVars['Columns'].index(c) for c in columnsList]
+  rows = plotVars['Rows']
   plotVars['Columns'] = tuple(columnsList)
-  plotVars['Rows'] = newRows
 
-  # sort tuples appropriately
-  for i in range(len(plotVars['Columns'])-1, -1, -1):
-    columnName = plotVars['Columns'][i]
+  # sort tuples appropriately, in one sort of a composite key
+  keyFn = sortKey(plotVars)
+  if 'SortRunSize' in plotVars:
+    # the rows are reordered as they are spilled, and the old rows are
+    # freed as they go: no second list of the rows is built
+    source = ExternalSort.drainList(rows) if isinstance(rows, list) else rows
+    newRows = (tuple([r[i] for i in positions]) for r in source)
+    plotVars['Rows'] = ExternalSort.externalSort(newRows, keyFn, runSize=plotVars['SortRunSize'])
+  else:
+    newRows = [tuple([r[i] for i in positions]) for r in rows]
+    newRows.sort(key=keyFn)
+    plotVars['Rows'] = newRows
+
+# the key sorting rows by all columns at once, in order, with the cmp
+# functions of plotVars['SortColumns'] and descending for the columns in
+# plotVars['ReverseColumns'].  None if rows sort as plain tuples
+def sortKey(plotVars):
+  sortColumns = plotVars['SortColumns'] if 'SortColumns' in plotVars else {}
+  reverseColumns = plotVars['ReverseColumns'] if 'ReverseColumns' in plotVars else ()
+  if not any(c in sortColumns or c in reverseColumns for c in plotVars['Columns']):
+    return None
+  keyFns = []
+  for i, columnName in enumerate(plotVars['Columns']):
     keyFn = operator.itemgetter(i)
-    if 'SortColumns' in plotVars and columnName in plotVars['SortColumns']:
-      keyFn = plotVars['SortColumns'][columnName]
-      keyFn = CmpToKey.map_and_cmp_to_key(operator.itemgetter(i), keyFn)
-    reverse = 'ReverseColumns' in plotVars and columnName in plotVars['ReverseColumns']
-    plotVars['Rows'].sort(reverse=reverse, key=keyFn)
+    if columnName in sortColumns:
+      keyFn = CmpToKey.map_and_cmp_to_key(operator.itemgetter(i), sortColumns[columnName])
+    if columnName in reverseColumns:
+      keyFn = ExternalSort.reverseKey(keyFn)
+    keyFns.append(keyFn)
+  return lambda row: tuple([fn(row) for fn in keyFns])
+
+# the first row of plotVars['Rows'] (which may not be a list)
+def firstRow(plotVars):
+  return next(iter(plotVars['Rows']))
 
 # any layer without an entry in plotVars['LayerFns'] or when a value is None
 # should take the default function
@@ -137,7 +159,7 @@ def setDefaultFns(plotVars):
 # at the beginning of the plot loop start every layer and set LayerValues
 # do not process the first point
 def startAllLayers(plotVars):
-  updateLayerState(plotVars, plotVars['Rows'][0])
+  updateLayerState(plotVars, firstRow(plotVars))
   plotVars['LayerFns']['Init'][0](plotVars)
   for layer in plotVars['Layers']:
     if layer != plotVars['Layers'][-1]: # start and end
@@ -217,7 +239,7 @@ def setupFigureSubplots(plotVars):
   if 'Subplot' not in plotVars['Layers']: return
   haveFigure = 'Figure' in plotVars['Layers']
   subplotsInFigure = collections.defaultdict(set)
-  layerValues = getCurrentLayerValues(plotVars, plotVars['Rows'][0])
+  layerValues = getCurrentLayerValues(plotVars, firstRow(plotVars))
   for row in plotVars['Rows']:
     oldValues = layerValues
     layerValues = getCurrentLayerValues(plotVars, row)
@@ -147,6 +147,8 @@ def Point(plotVars):
 #
 ###################################
 
+# (to compute the running totals once before plotting instead, use
+#  rel.window(seriesCols, (xCol,), (('yCumulative', 'cumsum', yCol),)))
 def BeforeSeriesAddCumulative(plotVars):
   if plotVars['TraceFunctionCalls']:
     print '+SeriesCumulative'
@@ -169,6 +171,8 @@ def PointAddCumulative(plotVars):
 #
 ###################################
 
+# (to compute the percentages once before plotting instead, use
+#  rel.window(subplotCols + (xCol,), (), (('yPct', 'percent', yCol),)))
 def BeforeSubplotAdd100Pct(plotVars):
   if plotVars['TraceFunctionCalls']:
     print '+Subplot (100Pct)'
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+#
+# Quantile sketch: mergeable approximate quantiles in bounded memory
+#
+# values are counted in logarithmic buckets (as in an HDR histogram): bucket
+# i holds the values in (gamma^(i-1), gamma^i] with
+# gamma = (1 + relativeError) / (1 - relativeError), so any quantile is
+# estimated within relativeError of the exact value of that rank.  The
+# number of buckets grows with the log of the range of the values, not with
+# their number: at 1% error, values from 1ns to 100s fit in about 1300
+# buckets.  Negative values are counted in mirrored buckets, zeros apart.
+# The exact min and max are kept and bound every estimate.
+#
+# sketches with the same relativeError merge by adding their buckets, so the
+# sketches of runs, files or nodes combine without the values.  Sketches
+# pickle, and can be kept in relation columns (see Aggregates.Sketch).
+#
+# used by the aggregates Aggregates.Quantile(p) and Aggregates.Sketch(), and
+# by sketchGroups, which sketches a stream of relations (e.g. the chunks of
+# RelationIO.readChunks) without keeping their rows
+#
+# ex:
+#   sketch = QuantileSketch.QuantileSketch(0.01)
+#   for lat in latencies:
+#     sketch.add(lat)
+#   sketch.merge(otherRunSketch)
+#   p99 = sketch.quantile(0.99)
+
+import math
+
+try:
+  import numpy as np
+except ImportError: # only needed by addArray
+  np = None
+
+defaultError = 0.01
+
+class QuantileSketch(object):
+  def __init__(self, relativeError=defaultError):
+    assert 0 < relativeError < 1, "relative error must be in (0, 1)"
+    self.relativeError = relativeError
+    self.gamma = (1 + relativeError) / (1 - relativeError)
+    self.logGamma = math.log(self.gamma)
+    self.positive = {} # {bucket -> count}
+    self.negative = {} # {bucket of -value -> count}
+    self.zeros = 0
+    self.count = 0
+    self.min = None
+    self.max = None
+
+  # add a value (None and NaN are skipped)
+  # returns the sketch
+  def add(self, val, count=1):
+    if val == None or val != val:
+      return self
+    if val > 0:
+      i = int(math.ceil(math.log(val) / self.logGamma))
+      self.positive[i] = self.positive.get(i, 0) + count
+    elif val < 0:
+      i = int(math.ceil(math.log(-val) / self.logGamma))
+      self.negative[i] = self.negative.get(i, 0) + count
+    else:
+      self.zeros += count
+    self.count += count
+    if self.min == None or val < self.min:
+      self.min = val
+    if self.max == None or val > self.max:
+      self.max = val
+    return self
+
+  # add the values of a numpy array (or sequence) of numbers at once
+  # NaNs are skipped.  returns the sketch
+  def addArray(self, vals):
+    vals = np.asarray(vals, dtype=np.float64)
+    vals = vals[~np.isnan(vals)]
+    if len(vals) == 0:
+      return self
+    for buckets, mags in ((self.positive, vals[vals > 0]), (self.negative, -vals[vals < 0])):
+      if len(mags) > 0:
+        (ids, counts) = np.unique(np.ceil(np.log(mags) / self.logGamma).astype(np.int64), return_counts=True)
+        for i, n in zip(ids.tolist(), counts.tolist()):
+          buckets[i] = buckets.get(i, 0) + n
+    self.zeros += int(np.count_nonzero(vals == 0))
+    self.count += len(vals)
+    (low, high) = (float(vals.min()), float(vals.max()))
+    if self.min == None or low < self.min:
+      self.min = low
+    if self.max == None or high > self.max:
+      self.max = high
+    return self
+
+  # add the values counted by otherSketch, which must have the same
+  # relativeError.  returns the sketch
+  def merge(self, otherSketch):
+    assert otherSketch.relativeError == self.relativeError, "can't merge sketches with relative errors {!r} and {!r}".format(self.relativeError, otherSketch.relativeError)
+    for buckets, otherBuckets in ((self.positive, otherSketch.positive), (self.negative, otherSketch.negative)):
+      for i, n in otherBuckets.iteritems():
+        buckets[i] = buckets.get(i, 0) + n
+    self.zeros += otherSketch.zeros
+    self.count += otherSketch.count
+    if otherSketch.min != None and (self.min == None or otherSketch.min < self.min):
+      self.min = otherSketch.min
+    if otherSketch.max != None and (self.max == None or otherSketch.max > self.max):
+      self.max = otherSketch.max
+    return self
+
+  def copy(self):
+    sketch = QuantileSketch(self.relativeError)
+    return sketch.merge(self)
+
+  # the estimated value of rank q * (count - 1) of the sorted values
+  # (q in [0, 1]), None if the sketch is empty
+  def quantile(self, q):
+    assert 0 <= q <= 1, "quantile must be in [0, 1]"
+    if self.count == 0:
+      return None
+    rank = int(q * (self.count - 1))
+    # buckets in the order of their values
+    buckets = [(-self.value(i), n) for i, n in sorted(self.negative.items(), reverse=True)]
+    if self.zeros > 0:
+      buckets.append((0.0, self.zeros))
+    buckets += [(self.value(i), n) for i, n in sorted(self.positive.items())]
+    seen = 0
+    for val, n in buckets:
+      seen += n
+      if seen > rank:
+        return min(max(val, self.min), self.max)
+    return self.max
+
+  # helper
+  # the value standing for bucket i, within relativeError of all its values
+  def value(self, i):
+    return 2 * self.gamma ** i / (self.gamma + 1)
+
+  def __repr__(self):
+    return "QuantileSketch({!r}, count={}, min={!r}, max={!r})".format(self.relativeError, self.count, self.min, self.max)
+
+# sketch the values of col of each group of keyCols over a stream of
+# relations (e.g. RelationIO.readChunks), without keeping their rows
+# sketches: {key tuple -> QuantileSketch} to add to (e.g. of earlier runs)
+# returns the dict of sketches
+def sketchGroups(relations, keyCols, col, relativeError=defaultError, sketches=None):
+  import Aggregates
+  sketches = {} if sketches == None else sketches
+  agg = Aggregates.Sketch(relativeError)
+  for rel in relations:
+    for row in rel.groupBy(keyCols).agg((('sketch', agg, col),)).rows:
+      (key, sketch) = (row[:-1], row[-1])
+      if key in sketches:
+        sketches[key].merge(sketch)
+      else:
+        sketches[key] = sketch
+  return sketches
+
+# return a Relation of the percentiles ps (0-100) of sketches (as returned
+# by sketchGroups), with columns keyCols + 'p<p>' per percentile, e.g.
+# ('conf', 'p50', 'p99', 'p99.9')
+def percentileRelation(sketches, keyCols, ps):
+  from Relational import Relation
+  cols = tuple(keyCols) + tuple("p{:g}".format(p) for p in ps)
+  rows = [key + tuple(sketch.quantile(p / 100.0) for p in ps) for key, sketch in sorted(sketches.items())]
+  return Relation((cols, rows))
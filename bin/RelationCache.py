@@ -0,0 +1,255 @@
+#!/usr/bin/python
+#
+# Content addressed on-disk cache of relations computed by a pipeline
+#
+# cache.call(fn, *args, **kwargs) returns fn(*args, **kwargs), a relation,
+# computing it only if no run of the same function on the same inputs was
+# cached.  The fingerprint (a sha1) of a call covers:
+#   fn: its module, name and code (constants, default arguments and the
+#     values of closure variables included)
+#   relations given as arguments: their columns and values.  For a
+#     LazyRelation the plan, including the functions of its nodes
+#   File(fileName) arguments: the contents of the file
+#   other arguments: their values (objects by class and attributes)
+# cache.collect(lazyRelation) is the result of a lazy pipeline (see
+# LazyRelation.py), fingerprinted by its plan
+#
+# only the code of fn itself is fingerprinted, not the code of the functions
+# it calls: after changing those, pass a version argument or clear() the
+# cache.  Plain strings are fingerprinted as strings, so wrap input file
+# names in File to have their contents fingerprinted
+#
+# every result is saved with RelationStore in a directory of the cache
+# named by its fingerprint, and is returned loaded from there (a memory
+# mapped ColumnarRelation) on a miss as well as on a hit.  With maxBytes,
+# the least recently used results are removed once the cache holds more
+# than maxBytes.  The contents fingerprint of a file is kept with its size
+# and modification time, so unchanged files are not read again.
+#
+# ex:
+#   cache = RelationCache.RelationCache(os.path.expanduser("~/.relcache"), maxBytes=10 << 30)
+#   def report(results, configs, minLat):
+#     rel = RelationIO.readDelimited(results.fileName, columnar=True)
+#     rel.leftHashJoin(RelationIO.readDelimited(configs.fileName), ('exp',))
+#     rel.select(col('lat_ns') > minLat)
+#     return rel.groupBy(('conf',)).agg((('lat', 'mean', 'lat_ns'),))
+#   rel = cache.call(report, RelationCache.File("results.tsv"), RelationCache.File("configs.tsv"), 100)
+
+import functools
+import hashlib
+import json
+import os
+import os.path
+import shutil
+import types
+
+import numpy as np
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+import RelationStore
+
+filesName = "files.json"
+
+# values per chunk when relations are fingerprinted
+fingerprintChunkSize = 65536
+
+# an input file of a cached call, fingerprinted by its contents
+class File(object):
+  def __init__(self, fileName):
+    self.fileName = fileName
+
+  def __repr__(self):
+    return "File({!r})".format(self.fileName)
+
+class RelationCache(object):
+  # dirName: the cache directory, created if needed
+  # maxBytes: the size the results are kept under (None: no limit)
+  def __init__(self, dirName, maxBytes=None):
+    self.dirName = dirName
+    self.maxBytes = maxBytes
+    if not os.path.isdir(dirName):
+      os.makedirs(dirName)
+    self.filesPath = os.path.join(dirName, filesName)
+    self.files = {}
+    if os.path.exists(self.filesPath):
+      with open(self.filesPath) as f:
+        self.files = json.load(f)
+
+  # return fn(*args, **kwargs), from the cache if it was already computed
+  def call(self, fn, *args, **kwargs):
+    key = self.fingerprint((fn, args, kwargs))
+    return self.cached(key, lambda: fn(*args, **kwargs))
+
+  # return the result of the plan of lazyRelation, from the cache if it was
+  # already computed
+  def collect(self, lazyRelation):
+    assert isinstance(lazyRelation, LazyRelation), "collect takes a LazyRelation, not {!r}".format(type(lazyRelation))
+    key = self.fingerprint(lazyRelation)
+    return self.cached(key, lazyRelation.collect)
+
+  # helper
+  # load the result with fingerprint key, or compute() and save it
+  def cached(self, key, compute):
+    entryDir = os.path.join(self.dirName, key)
+    if not os.path.isdir(entryDir):
+      relation = compute()
+      assert isinstance(relation, Relation), "cached functions must return a Relation, not {!r}".format(type(relation))
+      # saved under another name first, so that an interrupted save is never
+      # found under the fingerprint
+      tempDir = os.path.join(self.dirName, "tmp-{}-{}".format(key, os.getpid()))
+      RelationStore.save(relation, tempDir)
+      try:
+        os.rename(tempDir, entryDir)
+      except OSError: # saved meanwhile by another process
+        shutil.rmtree(tempDir, ignore_errors=True)
+    os.utime(entryDir, None) # most recently used
+    self.evict(keep=key)
+    return RelationStore.load(entryDir)
+
+  # remove the least recently used results until the cache holds at most
+  # maxBytes (the result keep is never removed)
+  def evict(self, keep=None):
+    if self.maxBytes == None:
+      return
+    entries = []
+    for name in os.listdir(self.dirName):
+      entryDir = os.path.join(self.dirName, name)
+      if isFingerprint(name) and os.path.isdir(entryDir):
+        entries.append((os.path.getmtime(entryDir), name, dirSize(entryDir)))
+    total = sum(size for (used, name, size) in entries)
+    for (used, name, size) in sorted(entries):
+      if total <= self.maxBytes:
+        break
+      if name != keep:
+        shutil.rmtree(os.path.join(self.dirName, name), ignore_errors=True)
+        total -= size
+
+  # remove every cached result
+  def clear(self):
+    for name in os.listdir(self.dirName):
+      if isFingerprint(name):
+        shutil.rmtree(os.path.join(self.dirName, name), ignore_errors=True)
+    self.files = {}
+    if os.path.exists(self.filesPath):
+      os.remove(self.filesPath)
+
+  # return the fingerprint of a value, as a hex string
+  def fingerprint(self, value):
+    h = hashlib.sha1()
+    self.addFingerprint(h, value, set())
+    return h.hexdigest()
+
+  # internal
+  # add the fingerprint of value to the hash h
+  # seen: ids of the functions and objects being fingerprinted, which are
+  # only referred to when they are found inside themselves
+  # values are compared with isinstance, Exprs overload ==
+  def addFingerprint(self, h, value, seen):
+    add = lambda v: self.addFingerprint(h, v, seen)
+    if value is None or isinstance(value, (bool, int, long, float, complex, str, unicode)):
+      h.update("{}:{!r};".format(type(value).__name__, value))
+    elif isinstance(value, (tuple, list)):
+      h.update("{}:{};".format(type(value).__name__, len(value)))
+      for v in value:
+        add(v)
+    elif isinstance(value, dict):
+      items = sorted((self.fingerprint(k), k, v) for k, v in value.items())
+      h.update("dict:{};".format(len(items)))
+      for (kFingerprint, k, v) in items:
+        h.update(kFingerprint)
+        add(v)
+    elif isinstance(value, (set, frozenset)):
+      h.update("set:{};".format(len(value)))
+      for vFingerprint in sorted(self.fingerprint(v) for v in value):
+        h.update(vFingerprint)
+    elif isinstance(value, File):
+      h.update("file:{};".format(self.fileFingerprint(value.fileName)))
+    elif isinstance(value, LazyRelation):
+      h.update("lazy;")
+      add(value.plan)
+    elif isinstance(value, Relation):
+      addRelationFingerprint(h, value)
+    elif isinstance(value, np.ndarray):
+      addArrayFingerprint(h, value)
+    elif id(value) in seen:
+      h.update("seen;")
+    elif isinstance(value, types.FunctionType):
+      seen.add(id(value))
+      h.update("function:{}.{};".format(value.__module__, value.__name__))
+      add(value.func_code)
+      add(value.func_defaults)
+      add([cell.cell_contents for cell in value.func_closure or ()])
+    elif isinstance(value, types.CodeType):
+      h.update("code:{!r};".format(value.co_code))
+      add(value.co_consts)
+      add(value.co_names)
+      add(value.co_varnames)
+    elif isinstance(value, types.MethodType):
+      h.update("method;")
+      add(value.im_func)
+      add(value.im_self)
+    elif isinstance(value, functools.partial):
+      h.update("partial;")
+      add((value.func, value.args, value.keywords))
+    elif isinstance(value, (type, types.ClassType, types.BuiltinFunctionType)):
+      h.update("{}:{}.{};".format(type(value).__name__, getattr(value, '__module__', None), value.__name__))
+    elif hasattr(value, '__dict__'):
+      seen.add(id(value))
+      h.update("object:{}.{};".format(type(value).__module__, type(value).__name__))
+      add(vars(value))
+    else:
+      h.update("{}:{!r};".format(type(value).__name__, value))
+
+  # helper
+  # the fingerprint of the contents of fileName, read again only if its
+  # size or modification time changed
+  def fileFingerprint(self, fileName):
+    path = os.path.abspath(fileName)
+    stat = os.stat(path)
+    known = self.files.get(path)
+    if known != None and known[:2] == [stat.st_size, stat.st_mtime]:
+      return known[2]
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+      for block in iter(lambda: f.read(1 << 20), ''):
+        h.update(block)
+    self.files[path] = [stat.st_size, stat.st_mtime, h.hexdigest()]
+    tempPath = "{}.{}".format(self.filesPath, os.getpid())
+    with open(tempPath, 'w') as f:
+      json.dump(self.files, f)
+    os.rename(tempPath, self.filesPath)
+    return self.files[path][2]
+
+# helper
+# add the fingerprint of the columns and values of relation to the hash h
+def addRelationFingerprint(h, relation):
+  h.update("relation:{!r}:{};".format(tuple(relation.cols), relation.numRows()))
+  if isinstance(relation, ColumnarRelation):
+    for c in relation.cols:
+      addArrayFingerprint(h, relation.column(c))
+    return
+  rows = relation.rows
+  for start in range(0, len(rows), fingerprintChunkSize):
+    h.update(repr(rows[start:start + fingerprintChunkSize]))
+
+# helper
+# add the fingerprint of a numpy array to the hash h
+def addArrayFingerprint(h, arr):
+  h.update("array:{}:{!r};".format(arr.dtype.str, arr.shape))
+  if arr.dtype.kind == 'O':
+    for start in range(0, len(arr), fingerprintChunkSize):
+      h.update(repr(arr[start:start + fingerprintChunkSize].tolist()))
+  else:
+    h.update(np.ascontiguousarray(arr).tobytes())
+
+# helper
+# True for the names of the result directories
+def isFingerprint(name):
+  return len(name) == 40 and all(c in "0123456789abcdef" for c in name)
+
+# helper
+# the total size of the files in dirName
+def dirSize(dirName):
+  return sum(os.path.getsize(os.path.join(dirName, name)) for name in os.listdir(dirName))
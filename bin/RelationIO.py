@@ -0,0 +1,187 @@
+#!/usr/bin/python
+#
+# Read delimited (csv/tsv) result files into relations
+#
+# Files are read in chunks of rows.  Each chunk is transposed and converted
+# one whole column at a time, either with the type given in dtypes or with
+# the first type in inferTypes that converts every value of the column.
+# Once a column has been read as float it is never tried as int again;
+# columns that need a wider type in a later chunk are converted for the
+# earlier chunks too (int -> float -> str), from the text of the file, so
+# the values don't depend on chunkSize.  The text of inferred columns is
+# kept with the chunk until the column reaches str.
+#
+# ex:
+#   rel = RelationIO.readDelimited("results.tsv")
+#   rel = RelationIO.readDelimited("results.csv", delimiter=",", dtypes={'lat_ns': float})
+#   rel = RelationIO.readManyDelimited(fileNames, processes=8,
+#           fileCols=('exp',), fileColsFn=lambda fileName: (os.path.basename(fileName),))
+#   for chunk in RelationIO.readChunks("huge.tsv"):
+#     ...
+
+import csv
+import itertools
+
+from Relational import Relation
+
+# the types tried, in order, when inferring the type of a column
+inferTypes = (int, float, str)
+
+# convert a tuple of strings to dtype
+# returns a list (or a numpy array when columnar)
+def convertColumn(vals, dtype, columnar):
+  if not columnar:
+    return map(dtype, vals)
+  import numpy as np
+  import ColumnarRelation
+  if dtype in (int, float):
+    return np.array(vals).astype(np.int64 if dtype == int else np.float64)
+  if dtype == str:
+    return ColumnarRelation.toColumn(vals)
+  return ColumnarRelation.toColumn(map(dtype, vals))
+
+# convert vals with the first type, starting at startType, that converts
+# every value.  returns (type, converted values)
+def inferColumn(vals, startType, columnar):
+  for dtype in inferTypes[inferTypes.index(startType):]:
+    try:
+      return (dtype, convertColumn(vals, dtype, columnar))
+    except (ValueError, OverflowError):
+      pass
+  assert False, "str conversion can't fail"
+
+# convert a column of a chunk to a wider type in inferTypes
+# text: the strings the values were converted from, None if there are none
+# (e.g. values of readManyDelimited's fileCols), the values are then
+# converted themselves
+def promoteColumn(vals, text, dtype, newType, columnar):
+  if dtype == newType:
+    return vals
+  if text == None:
+    if columnar:
+      vals = vals.tolist()
+    text = tuple(map(newType, vals))
+  return convertColumn(text, newType, columnar)
+
+# read fileName in chunks of chunkSize rows
+# cols: tuple of column names, if None the first line of the file is the header
+# dtypes: dict of {column name -> type}, other columns are inferred
+# yields (cols, tuple of column types, list of converted columns, list of
+# texts) per chunk, where the text of a column is the tuple of strings its
+# values were inferred from, or None for str columns and columns of dtypes
+def readColumnChunks(fileName, delimiter='\t', cols=None, dtypes=None, chunkSize=100000, columnar=False):
+  dtypes = {} if dtypes == None else dtypes
+  with open(fileName, 'rb') as f:
+    reader = csv.reader(f, delimiter=delimiter)
+    if cols == None:
+      cols = tuple(next(reader))
+    types = [dtypes.get(c, inferTypes[0]) for c in cols]
+    while True:
+      chunk = list(itertools.islice(reader, chunkSize))
+      if len(chunk) == 0:
+        break
+      chunk = filter(None, chunk) # skip blank lines
+      if len(chunk) == 0:
+        continue
+      assert set(map(len, chunk)) == set([len(cols)]), "rows of {!r} must have {} fields".format(fileName, len(cols))
+      columns = []
+      texts = []
+      for i, vals in enumerate(zip(*chunk)):
+        if cols[i] in dtypes:
+          columns.append(convertColumn(vals, dtypes[cols[i]], columnar))
+          texts.append(None)
+        else:
+          (types[i], converted) = inferColumn(vals, types[i], columnar)
+          columns.append(converted)
+          texts.append(vals if types[i] != str else None)
+      yield (cols, tuple(types), columns, texts)
+
+# build a relation from a list of (cols, types, columns) chunks
+# chunks whose columns were read with a narrower type are promoted
+def combineChunks(chunks, cols, columnar):
+  if len(chunks) == 0:
+    return makeRelation(cols, [[] for c in cols], columnar)
+  for (chunkCols, chunkTypes, chunkColumns, chunkTexts) in chunks:
+    assert chunkCols == cols, "mismatched columns: {!r} and {!r}".format(chunkCols, cols)
+  columns = []
+  for i in range(len(cols)):
+    colTypes = set(chunk[1][i] for chunk in chunks)
+    if colTypes <= set(inferTypes):
+      newType = inferTypes[max(inferTypes.index(t) for t in colTypes)]
+      parts = [promoteColumn(chunk[2][i], chunk[3][i], chunk[1][i], newType, columnar) for chunk in chunks]
+    else:
+      assert len(colTypes) == 1, "column {!r} was read as different types {!r}".format(cols[i], colTypes)
+      parts = [chunk[2][i] for chunk in chunks]
+    if columnar:
+      import numpy as np
+      columns.append(np.concatenate(parts))
+    else:
+      columns.append(list(itertools.chain.from_iterable(parts)))
+  return makeRelation(cols, columns, columnar)
+
+def makeRelation(cols, columns, columnar):
+  if columnar:
+    import ColumnarRelation
+    return ColumnarRelation.ColumnarRelation.fromArrays(cols, columns)
+  if len(cols) == 0:
+    return Relation((cols, []))
+  return Relation((tuple(cols), zip(*columns)))
+
+# stream fileName as one relation per chunk of chunkSize rows
+# (see readColumnChunks for the arguments)
+def readChunks(fileName, delimiter='\t', cols=None, dtypes=None, chunkSize=100000, columnar=False):
+  for chunk in readColumnChunks(fileName, delimiter, cols, dtypes, chunkSize, columnar):
+    yield combineChunks([chunk], chunk[0], columnar)
+
+# read a whole delimited file into a Relation (ColumnarRelation if columnar)
+# (see readColumnChunks for the arguments)
+def readDelimited(fileName, delimiter='\t', cols=None, dtypes=None, chunkSize=100000, columnar=False):
+  chunks = list(readColumnChunks(fileName, delimiter, cols, dtypes, chunkSize, columnar))
+  if cols == None and len(chunks) == 0:
+    with open(fileName, 'rb') as f:
+      header = next(csv.reader(f, delimiter=delimiter), [])
+    cols = tuple(header)
+  elif cols == None:
+    cols = chunks[0][0]
+  return combineChunks(chunks, tuple(cols), columnar)
+
+# internal
+# read one file for readManyDelimited in a worker process
+def readFileChunks(args):
+  (fileName, kwargs) = args
+  return list(readColumnChunks(fileName, **kwargs))
+
+# read several files with the same columns into a single relation
+# the files are read by a pool of processes when processes > 1
+# fileCols: tuple of extra column names holding values describing each file
+# fileColsFn: takes a file name, returns a tuple of values for fileCols
+def readManyDelimited(fileNames, delimiter='\t', cols=None, dtypes=None, chunkSize=100000,
+                      columnar=False, processes=1, fileCols=(), fileColsFn=None):
+  kwargs = {'delimiter': delimiter, 'cols': cols, 'dtypes': dtypes,
+            'chunkSize': chunkSize, 'columnar': columnar}
+  work = [(fileName, kwargs) for fileName in fileNames]
+  if processes > 1:
+    import multiprocessing
+    pool = multiprocessing.Pool(processes)
+    try:
+      fileChunks = pool.map(readFileChunks, work, 1)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    fileChunks = map(readFileChunks, work)
+
+  # every chunk gets the values describing its file as extra columns
+  chunks = []
+  for fileName, chunkList in zip(fileNames, fileChunks):
+    fileVals = fileColsFn(fileName) if len(fileCols) > 0 else ()
+    assert len(fileVals) == len(fileCols), "fileColsFn must return a value for every column in fileCols"
+    for (chunkCols, chunkTypes, chunkColumns, chunkTexts) in chunkList:
+      length = len(chunkColumns[0]) if len(chunkColumns) > 0 else 0
+      extraColumns = [convertColumn((val,) * length, type(val), columnar) if columnar else [val] * length for val in fileVals]
+      chunks.append((chunkCols + tuple(fileCols), chunkTypes + tuple(type(v) for v in fileVals),
+                     chunkColumns + extraColumns, chunkTexts + [None] * len(fileVals)))
+  if len(chunks) == 0:
+    allCols = (tuple(cols) if cols != None else ()) + tuple(fileCols)
+    return makeRelation(allCols, [[] for c in allCols], columnar)
+  return combineChunks(chunks, chunks[0][0], columnar)
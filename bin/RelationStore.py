@@ -0,0 +1,137 @@
+#!/usr/bin/python
+#
+# Save relations to disk in a binary format and load them back
+#
+# a saved relation is a directory holding:
+#   schema.json: the columns, the number of rows, and how each column is stored
+#   plain columns (numbers and bools): <i>.npy, the numpy array
+#   dictionary encoded columns (strings, None, mixed types):
+#     <i>.codes.npy: the smallest unsigned integer code per row
+#     <i>.values.pickle: the distinct values, values[code] is the value
+#   columns whose values can't be hashed are pickled whole: <i>.pickle
+#   plain and dictionary encoded columns also get a zone map (the min and max
+#   of each chunk of rows, see ColumnarRelation.createZoneMaps):
+#     <i>.zones.pickle
+#
+# load returns a ColumnarRelation.  The .npy files are memory mapped, so
+# opening a relation only reads the schema and the pages of a column are
+# read when an operation touches them.  Selections the zone maps decide
+# only read the chunks they can't decide.  Dictionary encoded columns are
+# loaded as DictColumns (see ColumnarRelation.encode), their values the
+# first time they are used.  Pickled columns are read when first used.
+#
+# ex:
+#   RelationStore.save(rel, "results.rel")
+#   rel = RelationStore.load("results.rel")
+
+import json
+import os
+import os.path
+
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+import numpy as np
+
+from ColumnarRelation import ColumnarRelation, DeferredColumn, DictColumn, ZoneMap, encodeColumn, toColumn, zoneChunkSize
+
+schemaFileName = "schema.json"
+formatVersion = 1
+
+# save relation (any Relation) into directory dirName
+# the directory is created if needed; files of an earlier save are replaced
+def save(relation, dirName):
+  if not isinstance(relation, ColumnarRelation):
+    relation = ColumnarRelation(relation)
+  if not os.path.isdir(dirName):
+    os.makedirs(dirName)
+
+  # new zone maps get the chunk size of the relation's zone maps
+  zoneMaps = relation.zoneMaps
+  chunkSize = zoneMaps.values()[0].chunkSize if len(zoneMaps) > 0 else zoneChunkSize
+
+  columns = []
+  for i, col in enumerate(relation.cols):
+    arr = relation.rawColumn(col)
+    entry = {'name': col}
+    if not isinstance(arr, DictColumn) and arr.dtype.kind != 'O':
+      entry['encoding'] = 'plain'
+      entry['file'] = "{}.npy".format(i)
+      np.save(os.path.join(dirName, entry['file']), np.ascontiguousarray(arr))
+    else:
+      try:
+        encoded = arr if isinstance(arr, DictColumn) else encodeColumn(arr)
+      except TypeError: # unhashable values
+        encoded = None
+      if encoded == None:
+        entry['encoding'] = 'pickle'
+        entry['file'] = "{}.pickle".format(i)
+        writePickle(os.path.join(dirName, entry['file']), arr.tolist())
+      else:
+        entry['encoding'] = 'dictionary'
+        entry['file'] = "{}.codes.npy".format(i)
+        entry['values'] = "{}.values.pickle".format(i)
+        np.save(os.path.join(dirName, entry['file']), np.ascontiguousarray(encoded.codes))
+        writePickle(os.path.join(dirName, entry['values']), encoded.values.tolist())
+        arr = encoded
+    if entry['encoding'] != 'pickle':
+      entry['zones'] = "{}.zones.pickle".format(i)
+      zoneMap = zoneMaps[col] if col in zoneMaps else ZoneMap.build(arr, chunkSize)
+      writePickle(os.path.join(dirName, entry['zones']), zoneMap)
+    columns.append(entry)
+
+  # the schema is written last so that an interrupted save can't be loaded
+  schema = {'version': formatVersion, 'length': relation.length, 'columns': columns}
+  with open(os.path.join(dirName, schemaFileName), 'w') as f:
+    json.dump(schema, f, indent=2)
+
+# load a relation saved by save()
+# mmap: memory map the column files (read them whole if False)
+def load(dirName, mmap=True):
+  with open(os.path.join(dirName, schemaFileName)) as f:
+    schema = json.load(f)
+  assert schema['version'] == formatVersion, "unknown relation format version {!r} in {!r}".format(schema['version'], dirName)
+  mmapMode = 'r' if mmap else None
+
+  cols = []
+  arrays = []
+  for entry in schema['columns']:
+    cols.append(str(entry['name']))
+    fileName = os.path.join(dirName, entry['file'])
+    if entry['encoding'] == 'plain':
+      arrays.append(np.load(fileName, mmap_mode=mmapMode))
+    elif entry['encoding'] == 'dictionary':
+      valuesName = os.path.join(dirName, entry['values'])
+      arrays.append(DeferredColumn(lambda fileName=fileName, valuesName=valuesName:
+          DictColumn(np.load(fileName, mmap_mode=mmapMode), toColumn(readPickle(valuesName)))))
+    elif entry['encoding'] == 'pickle':
+      arrays.append(DeferredColumn(lambda fileName=fileName: objectColumn(readPickle(fileName))))
+    else:
+      assert False, "unknown column encoding {!r} in {!r}".format(entry['encoding'], dirName)
+
+  rel = ColumnarRelation()
+  rel.cols = tuple(cols)
+  rel.arrays = arrays
+  rel.length = schema['length']
+  for col, entry in zip(cols, schema['columns']):
+    if 'zones' in entry:
+      rel.zoneMaps[col] = readPickle(os.path.join(dirName, entry['zones']))
+  return rel
+
+# internal
+# object array holding vals (even if they are sequences)
+def objectColumn(vals):
+  arr = np.empty(len(vals), dtype=object)
+  for i, val in enumerate(vals):
+    arr[i] = val
+  return arr
+
+def writePickle(fileName, obj):
+  with open(fileName, 'wb') as f:
+    pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+
+def readPickle(fileName):
+  with open(fileName, 'rb') as f:
+    return pickle.load(f)
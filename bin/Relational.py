@@ -3,13 +3,72 @@
 # Relational algebra operations operations
 # cols: a tuple of strings representing the columns of this relation
 # rows: a list of tuples, where each tuple is the values corresponding to cols
+#
+# indexes: createIndex(keyCols) keeps a hash index {key -> row positions}
+# that leftHashJoin (on the right relation), hasDuplicates, keysMatch and
+# selectEquals use instead of hashing the rows again.  Indexes are dropped
+# whenever rows is assigned.  A change in the number of rows is detected as
+# well, but other in place changes (e.g. rel.rows[0] = row) are not: call
+# invalidateIndexes() after them
+#
+# sort order: declareSorted(keyCols) (or isSorted(keyCols) finding it out)
+# records that the rows are sorted by keyCols.  leftHashJoin, keysMatch and
+# hasDuplicates then merge sorted rows instead of hashing them.  The sort
+# order is dropped with the indexes, and kept by operations that keep the
+# order of the rows
+#
+# expressions: select, generateCol and filter also take an Expr (see
+# Expr.py) in place of a function and its input columns, e.g.
+#   rel.select(col('lat_ns') > 100)
+# the expression is compiled into a single function of the row
+#
+# appending: append(rows) adds rows at the end.  Indexes are extended with
+# the new rows instead of being dropped, and views of the relation (see
+# Views.py) are updated from the new rows only
+#
+# statistics: stats() computes the count, min, max, sum and number of
+# distinct values of every column in one pass over the rows, and keeps them
+# until the rows change (like the indexes).  describe() returns them as a
+# relation, mins() and maxs() read them.  None values are not counted
+#
+# parallel execution: after setProcesses(n), cast, filter, select, generateCol
+# and splitAndGenerateCols run on chunks of rows in n processes (see
+# Parallel.py).  The order of the rows is kept
+
+import operator
+import collections
+import bisect
+import itertools
+import heapq
+
+import Aggregates
+import BloomFilter
+import Expr
+import ExternalSort
+import Parallel
+import Views
+import Windows
+
+# raised when rows expected to be sorted are not
+class NotSorted(Exception):
+  pass
+
+# the statistics of a column (see Relation.stats)
+statNames = ('count', 'min', 'max', 'sum', 'distinct')
+
+# rows per chunk transposed into columns by Relation.computeStats
+statsChunkSize = 4096
 
-class Relation:
+class Relation(object):
   # constructor
   # for now have:
   # default (empty relation)
   # copy (copies rows and cols)
   # (tuple(cols), list(tuple(rows)),)
+  # processes and rows per chunk of the row-wise operations (see setProcesses)
+  processes = 1
+  chunkSize = None
+
   def __init__(self, arg=None):
     if arg == None:
       self.rows = []
@@ -32,46 +91,218 @@ class Relation:
         assert len(row) == l
     else:
       assert False, "Relation input invalid: {!r}".format(arg)
-    
+
+  # every assignment of rows drops the indexes and sort order
+  @property
+  def rows(self):
+    return self.rowList
+
+  @rows.setter
+  def rows(self, rows):
+    self.rowList = rows
+    self.invalidateIndexes()
+
+  def numRows(self):
+    return len(self.rows)
+
+  # add rows (tuples of values of cols) at the end of the relation
+  # indexes are extended with the new rows, the sort order is dropped and
+  # the views of the relation are given the new rows
+  def append(self, rows):
+    rows = list(rows)
+    for row in rows:
+      assert len(row) == len(self.cols), "appended rows must have a value per column: {!r}".format(row)
+    start = self.numRows()
+    indexes = getattr(self, 'indexes', None)
+    self.appendRows(rows)
+    self.indexes = {}
+    self.sortedOn = None
+    self.statistics = None
+    for keyCols, (index, rowCount) in (indexes.items() if indexes != None else ()):
+      if rowCount != start:
+        continue # stale
+      keyFn = Relation.compileProjection(self.cols, keyCols)
+      for i, row in enumerate(rows):
+        index.setdefault(keyFn(row), []).append(start + i)
+      self.indexes[keyCols] = (index, self.numRows())
+    for onAppend in getattr(self, 'views', ()):
+      onAppend(rows)
+
   # helper
-  # return a tuple of the given fields
+  # store rows after the current rows, see append
+  def appendRows(self, rows):
+    self.rowList.extend(rows)
+
+  # register onAppend(rows) to be called with the rows of every append
+  # (used by the views in Views.py)
+  def addView(self, onAppend):
+    if getattr(self, 'views', None) == None:
+      self.views = []
+    self.views.append(onAppend)
+
+  # return an iterator of tuples of the given columns
+  def iterProjected(self, projectCols):
+    projectFn = Relation.compileProjection(self.cols, projectCols)
+    return (projectFn(row) for row in self.rows)
+
+  # run cast, filter, select, generateCol and splitAndGenerateCols in
+  # processes processes, on chunks of chunkSize rows (None: split evenly)
+  # functions passed to those operations then run in the worker processes,
+  # so they can't change anything in this process
+  def setProcesses(self, processes, chunkSize=None):
+    assert processes >= 1, "need at least one process"
+    self.processes = processes
+    self.chunkSize = chunkSize
+
+  # intern the values of cols (default: every column holding strings), so
+  # that equal values in different rows are one shared object.  Saves memory
+  # for columns with few distinct values and lets hashing compare keys by
+  # identity.  (ColumnarRelation.encode dictionary encodes them instead)
+  def encode(self, cols=None):
+    sortedOn = self.sortedOn
+    if cols == None:
+      firstRow = self.rows[0] if len(self.rows) > 0 else ()
+      cols = tuple(c for c, val in zip(self.cols, firstRow) if isinstance(val, str))
+    tables = [(i, {}) for i, c in enumerate(self.cols) if c in cols]
+    def internRow(row):
+      newRow = list(row)
+      for (i, table) in tables:
+        newRow[i] = table.setdefault(row[i], row[i])
+      return tuple(newRow)
+    self.rows = map(internRow, self.rows)
+    self.keepSorted(sortedOn)
+
+  # helper
+  # apply fn, a function of a list of rows returning a list, to the rows in
+  # chunks (in parallel if setProcesses was called), return the joined list
+  def mapRowChunks(self, fn):
+    rows = self.rows
+    def runChunk(start, stop):
+      return fn(rows if stop - start == len(rows) else rows[start:stop])
+    chunks = Parallel.mapRanges(runChunk, len(rows), self.processes, self.chunkSize)
+    return chunks[0] if len(chunks) == 1 else list(itertools.chain.from_iterable(chunks))
+
+  # build (or rebuild) a hash index on keyCols and keep it until the rows
+  # change.  returns the index, a dict of {key tuple -> list of row positions}
+  def createIndex(self, keyCols):
+    index = collections.defaultdict(list)
+    for i, key in enumerate(self.iterProjected(keyCols)):
+      index[key].append(i)
+    index = dict(index)
+    if getattr(self, 'indexes', None) == None:
+      self.indexes = {}
+    self.indexes[keyCols] = (index, self.numRows())
+    return index
+
+  # return the index on keyCols, or None if there is none (or it is stale)
+  def getIndex(self, keyCols):
+    indexes = getattr(self, 'indexes', None)
+    if indexes == None or keyCols not in indexes:
+      return None
+    (index, rowCount) = indexes[keyCols]
+    if rowCount != self.numRows():
+      del indexes[keyCols]
+      return None
+    return index
+
+  def invalidateIndexes(self):
+    self.indexes = {}
+    self.sortedOn = None
+    self.statistics = None
+
+  # record that rows are sorted (ascending) by keyCols
+  def declareSorted(self, keyCols):
+    assert isinstance(keyCols, tuple), "key columns must be a tuple"
+    self.sortedOn = keyCols
+
+  # return True if rows are sorted by keyCols
+  # known if declared (keyCols may be a prefix of the declared columns),
+  # otherwise checked with one pass over the rows and remembered
+  def isSorted(self, keyCols):
+    sortedOn = getattr(self, 'sortedOn', None)
+    if sortedOn != None and sortedOn[:len(keyCols)] == keyCols:
+      return True
+    try:
+      for key in Relation.sortedKeys(self.iterProjected(keyCols)):
+        pass
+    except NotSorted:
+      return False
+    self.sortedOn = keyCols
+    return True
+
+  # internal
+  # restore the sort order sortedOn after an operation that kept the order
+  # of the rows, if its columns still exist
+  def keepSorted(self, sortedOn):
+    if sortedOn != None and all(c in self.cols for c in sortedOn):
+      self.sortedOn = sortedOn
+
+  # helper
+  # compile a projection of projectFields out of rows with columns cols
+  # returns a function taking a row and returning a tuple of the given fields
+  # column positions are resolved once here instead of once per row
   @staticmethod
-  def projectRow(cols, row, projectFields):
+  def compileProjection(cols, projectFields):
     assert isinstance(projectFields, tuple), "Projection Fields must be a tuple"
-    newRow = []
     for col in projectFields:
-      assert col in cols, "Projection Field {!r} not in cols {!r}".format(f, cols)
-      newRow.append(row[cols.index(col)])
-    return tuple(newRow)
+      assert col in cols, "Projection Field {!r} not in cols {!r}".format(col, cols)
+    indices = [cols.index(col) for col in projectFields]
+    if len(indices) == 0:
+      return lambda row: ()
+    if len(indices) == 1: # itemgetter of 1 item does not return a tuple
+      i = indices[0]
+      return lambda row: (row[i],)
+    return operator.itemgetter(*indices)
+
+  # helper
+  # return a tuple of the given fields
+  # prefer compileProjection when projecting many rows
+  @staticmethod
+  def projectRow(cols, row, projectFields):
+    return Relation.compileProjection(cols, projectFields)(row)
+
+  # helper
+  # compile fn, applied to the fnColInputs values of a row, into a function
+  # of the whole row with columns cols.  fn may be an Expr instead
+  @staticmethod
+  def compileRowFn(cols, fn, fnColInputs=None):
+    if isinstance(fn, Expr.Expr):
+      return fn.compileRow(cols)
+    projectFn = Relation.compileProjection(cols, fnColInputs)
+    return lambda row: fn(projectFn(row))
 
   # projection on relation
   # A projection collects the specified columns of each tuple in the relation
   # include only those fields listed in projectFields
   def project(self, projectCols):
-    newRows = []
-    for row in self.rows:
-      newRows.append(Relation.projectRow(self.cols, row, projectCols))
+    sortedOn = self.sortedOn
+    projectFn = Relation.compileProjection(self.cols, projectCols)
+    self.rows = map(projectFn, self.rows)
     self.cols = projectCols
-    self.rows = newRows
+    self.keepSorted(sortedOn)
 
   # perform a selection (essentially a filter)
   # A selection collects all columns of specified rows
   # selectFn takes in (tuple of vals) returns True to keep row, False to pass
   # selectFnColInputs determines which column values are the inputs to selectFn
-  def select(self, selectFn, selectFnColInputs):
-    innerSelectFn = lambda row: selectFn(Relation.projectRow(self.cols, row, selectFnColInputs))
-    self.rows = filter(innerSelectFn, self.rows)
+  # (or selectFn is a boolean Expr and selectFnColInputs is left out)
+  def select(self, selectFn, selectFnColInputs=None):
+    sortedOn = self.sortedOn
+    keepRow = Relation.compileRowFn(self.cols, selectFn, selectFnColInputs)
+    self.rows = self.mapRowChunks(lambda rows: [row for row in rows if keepRow(row)])
+    self.keepSorted(sortedOn)
 
   # generate new column for each tuple
   # generateFn takes in tuple of vals, returns new column value
   # generateFnColInputs determines which column values are inputs to generateFn
+  # (or generateFn is an Expr and generateFnColInputs is left out)
   # modifies the relation!
-  def generateCol(self, colName, generateFn, generateFnColInputs):
-    def innerGenerateMap(row):
-      newVal = generateFn(Relation.projectRow(self.cols, row, generateFnColInputs))
-      return row + (newVal,)
-    self.rows = map(innerGenerateMap, self.rows)
+  def generateCol(self, colName, generateFn, generateFnColInputs=None):
+    sortedOn = self.sortedOn
+    rowFn = Relation.compileRowFn(self.cols, generateFn, generateFnColInputs)
+    self.rows = self.mapRowChunks(lambda rows: [row + (rowFn(row),) for row in rows])
     self.cols = self.cols + (colName,)
+    self.keepSorted(sortedOn)
 
   # generate multiple new rows from each row
   # allows a number of new columns to be created
@@ -79,13 +310,16 @@ class Relation:
   # generateFnColInputs determines which column values are inputs to generateFn
   # each new row will be oldRow + newColVals for newColVals in return value of generateFn
   def splitAndGenerateCols(self, colNames, generateFn, generateFnColInputs):
-    newRows = []
-    for row in self.rows:
-      for newColVals in generateFn(row, projectRow(self.cols, row, generateFnColInputs)):
-        assert len(newColVals) == len(colNames), "number of new values must match number of new columns"
-        assert isinstance(newColVals, tuple), "new values must be in a tuple"
-        newRows.append(row + newColVals)
-    self.rows = newRows
+    projectFn = Relation.compileProjection(self.cols, generateFnColInputs)
+    def splitRows(rows):
+      newRows = []
+      for row in rows:
+        for newColVals in generateFn(row, projectFn(row)):
+          assert len(newColVals) == len(colNames), "number of new values must match number of new columns"
+          assert isinstance(newColVals, tuple), "new values must be in a tuple"
+          newRows.append(row + newColVals)
+      return newRows
+    self.rows = self.mapRowChunks(splitRows)
     self.cols = self.cols + colNames
 
   # left hash join
@@ -107,136 +341,813 @@ class Relation:
   # if multiple matches occur the cartesian product of rows with that
   # joinIndex key from the left and right relations is produced
   # (i.e.) all possible matches are created between left and right
+  #
+  # an index on joinIndex of otherRelation is used instead of hashing it.
+  # Otherwise if both relations are sorted by joinIndex they are merged
   def leftHashJoin(self, otherRelation, joinIndex, inner=True):
-    # determine non-index columns from each relation
-    # assert that no names are shared
-    myNonIndex = list(self.cols)
-    otherNonIndex = list(otherRelation.cols)
-    for c in joinIndex:
-      if c in myNonIndex: myNonIndex.remove(c)
-      if c in otherNonIndex: otherNonIndex.remove(c)
-      intersection = set(myNonIndex) & set(otherNonIndex)
+    sortedOn = self.sortedOn
+    otherIndex = otherRelation.getIndex(joinIndex)
+    if otherIndex == None and otherRelation.isSorted(joinIndex) and self.isSorted(joinIndex):
+      (newCols, newRows) = Relation.mergeJoinRows(
+          self.cols, self.rows, otherRelation.cols, otherRelation.rows, joinIndex, inner)
+    else:
+      (newCols, newRows) = Relation.hashJoinRows(
+          self.cols, self.rows, otherRelation.cols, otherRelation.rows, joinIndex, inner, otherIndex)
+    self.cols = newCols
+    self.rows = list(newRows)
+    self.keepSorted(sortedOn) # left rows keep their order
+
+  # helper
+  # left hash join on rows instead of relations (see leftHashJoin)
+  # the right rows are hashed right away, the left rows are streamed
+  # otherIndex is an index on joinIndex of otherRows (see createIndex) to
+  # use instead of hashing otherRows
+  # returns (tuple of joined columns, iterator of joined rows)
+  @staticmethod
+  def hashJoinRows(myCols, myRows, otherCols, otherRows, joinIndex, inner=True, otherIndex=None):
+    (myNonIndex, otherNonIndex) = Relation.joinNonIndexCols(myCols, otherCols, joinIndex)
+    otherValsFn = Relation.compileProjection(otherCols, otherNonIndex)
+    if otherIndex == None:
+      # hash relation 2 (put it in a dictionary by {index columns -> non index columns}
+      otherKeyFn = Relation.compileProjection(otherCols, joinIndex)
+      joinDict = collections.defaultdict(list)
+      for row in otherRows:
+        joinDict[otherKeyFn(row)].append(otherValsFn(row))
+      matches = lambda key: joinDict.get(key, ())
+    else:
+      matches = lambda key: [otherValsFn(otherRows[i]) for i in otherIndex.get(key, ())]
+
+    myKeyFn = Relation.compileProjection(myCols, joinIndex)
+    myValsFn = Relation.compileProjection(myCols, myNonIndex)
+    noMatch = tuple([None] * len(otherNonIndex))
+    def joinedRows():
+      for row in myRows:
+        key = myKeyFn(row)
+        vals = myValsFn(row)
+        otherMatches = matches(key)
+        if len(otherMatches) > 0:
+          for otherRelationVals in otherMatches:
+            yield key + vals + otherRelationVals
+        elif inner == False: # outer join, include Nones
+          yield key + vals + noMatch
+    return (joinIndex + myNonIndex + otherNonIndex, joinedRows())
+
+  # helper
+  # determine non-index columns from each relation
+  # assert that no names are shared
+  @staticmethod
+  def joinNonIndexCols(myCols, otherCols, joinIndex):
+    myNonIndex = tuple(c for c in myCols if c not in joinIndex)
+    otherNonIndex = tuple(c for c in otherCols if c not in joinIndex)
+    intersection = set(myNonIndex) & set(otherNonIndex)
     assert len(intersection) == 0, "non-index fields in common while joining: {!r}".format(intersection)
+    return (myNonIndex, otherNonIndex)
+
+  # helper
+  # left sort-merge join on rows (see leftHashJoin)
+  # myRows and otherRows are iterables sorted by joinIndex.  Both are read
+  # once, in order, and only the right rows sharing the current key are held
+  # in memory, so they may be streamed from files larger than memory.
+  # The output is the same as hashJoinRows
+  # returns (tuple of joined columns, iterator of joined rows)
+  @staticmethod
+  def mergeJoinRows(myCols, myRows, otherCols, otherRows, joinIndex, inner=True):
+    (myNonIndex, otherNonIndex) = Relation.joinNonIndexCols(myCols, otherCols, joinIndex)
+    myKeyFn = Relation.compileProjection(myCols, joinIndex)
+    myValsFn = Relation.compileProjection(myCols, myNonIndex)
+    otherKeyFn = Relation.compileProjection(otherCols, joinIndex)
+    otherValsFn = Relation.compileProjection(otherCols, otherNonIndex)
+    noMatch = tuple([None] * len(otherNonIndex))
+    def joinedRows():
+      others = iter(otherRows)
+      otherRow = next(others, None)
+      otherKey = otherKeyFn(otherRow) if otherRow != None else None
+      lastKey = None
+      group = [] # non index values of the right rows with key lastKey
+      for i, row in enumerate(myRows):
+        key = myKeyFn(row)
+        if i == 0 or key != lastKey:
+          if i > 0 and key < lastKey:
+            raise NotSorted("left rows not sorted by {!r}: {!r} after {!r}".format(joinIndex, key, lastKey))
+          # skip right rows with smaller keys, then collect the matching ones
+          group = []
+          while otherRow != None and otherKey <= key:
+            if otherKey == key:
+              group.append(otherValsFn(otherRow))
+            nextRow = next(others, None)
+            nextKey = otherKeyFn(nextRow) if nextRow != None else None
+            if nextRow != None and nextKey < otherKey:
+              raise NotSorted("right rows not sorted by {!r}: {!r} after {!r}".format(joinIndex, nextKey, otherKey))
+            (otherRow, otherKey) = (nextRow, nextKey)
+          lastKey = key
+        vals = myValsFn(row)
+        if len(group) > 0:
+          for otherRelationVals in group:
+            yield key + vals + otherRelationVals
+        elif inner == False: # outer join, include Nones
+          yield key + vals + noMatch
+    return (joinIndex + myNonIndex + otherNonIndex, joinedRows())
+
+  # helper
+  # iterate over the distinct keys of an iterable of sorted keys
+  # raises NotSorted if a key is smaller than the one before it
+  @staticmethod
+  def sortedKeys(keys):
+    first = True
+    for key in keys:
+      if first:
+        first = False
+      elif key == lastKey:
+        continue
+      elif key < lastKey:
+        raise NotSorted("keys not sorted: {!r} after {!r}".format(key, lastKey))
+      yield key
+      lastKey = key
+
+  # helper
+  # compare two iterables of sorted keys with a merge
+  # returns (set of keys only in myKeys, set of keys only in otherKeys)
+  @staticmethod
+  def mergeKeysDiff(myKeys, otherKeys):
+    leftOnly = set()
+    rightOnly = set()
+    mine = Relation.sortedKeys(myKeys)
+    others = Relation.sortedKeys(otherKeys)
+    myKey = next(mine, None)
+    otherKey = next(others, None)
+    while myKey != None or otherKey != None:
+      if otherKey == None or (myKey != None and myKey < otherKey):
+        leftOnly.add(myKey)
+        myKey = next(mine, None)
+      elif myKey == None or otherKey < myKey:
+        rightOnly.add(otherKey)
+        otherKey = next(others, None)
+      else:
+        myKey = next(mine, None)
+        otherKey = next(others, None)
+    return (leftOnly, rightOnly)
+
+  # band join: join every row to the rows of otherRelation with the same
+  # joinIndex values whose time is in [t - before, t + after], t the time of
+  # the row.  timeCols is (time column of this relation, time column of
+  # otherRelation).  Matches are in the order of their times
+  # columns, inner and the order of the rows as for leftHashJoin
+  # the other rows are sorted by time once per key, then every row finds its
+  # matches with binary searches
+  # ex: lat.bandJoin(flushes, ('node',), ('ts', 'flushTs'), 1000, 0)
+  def bandJoin(self, otherRelation, joinIndex, timeCols, before, after, inner=True):
+    def findRange(times, t):
+      return (bisect.bisect_left(times, t - before), bisect.bisect_right(times, t + after))
+    self.rangeJoin(otherRelation, joinIndex, timeCols, findRange, inner)
+
+  # as-of join: join every row to the row of otherRelation with the same
+  # joinIndex values and the latest time at or before the row's time (the
+  # last one of equal times).  tolerance: only match rows at most tolerance
+  # earlier.  Otherwise as bandJoin
+  # ex: lat.asofJoin(stats, ('node',), ('ts', 'statTs'), inner=False)
+  def asofJoin(self, otherRelation, joinIndex, timeCols, tolerance=None, inner=True):
+    def findRange(times, t):
+      hi = bisect.bisect_right(times, t)
+      if hi == 0 or (tolerance != None and times[hi - 1] < t - tolerance):
+        return (hi, hi)
+      return (hi - 1, hi)
+    self.rangeJoin(otherRelation, joinIndex, timeCols, findRange, inner)
 
-    # hash relation 2 (put it in a dictionary by {index columns -> non index columns}
-    import collections
-    joinDict = collections.defaultDict(list)
+  # helper
+  # join every row to a range of the rows of otherRelation with the same
+  # joinIndex values, sorted by time.  findRange(times, t) returns the range
+  # (start, stop) of the matches of a row with time t in the sorted times
+  def rangeJoin(self, otherRelation, joinIndex, timeCols, findRange, inner):
+    sortedOn = self.sortedOn
+    (myTimeCol, otherTimeCol) = timeCols
+    (myNonIndex, otherNonIndex) = Relation.joinNonIndexCols(self.cols, otherRelation.cols, joinIndex)
+    otherKeyFn = Relation.compileProjection(otherRelation.cols, joinIndex)
+    otherEntryFn = Relation.compileProjection(otherRelation.cols, (otherTimeCol,) + otherNonIndex)
+
+    # {key -> (sorted times, non index values in the same order)}
+    groups = collections.defaultdict(list)
     for row in otherRelation.rows:
-      key = projectRow(otherRelation.cols, row, joinIndex)
-      vals = projectRow(otherRelation.cols, row, nonIndex2)
-      joinDict[key].append(vals)
+      groups[otherKeyFn(row)].append(otherEntryFn(row))
+    tables = {}
+    for key, entries in groups.items():
+      entries.sort(key=operator.itemgetter(0)) # stable, equal times keep their order
+      tables[key] = ([entry[0] for entry in entries], [entry[1:] for entry in entries])
 
-    newCols = joinIndex + tuple(myNonIndex) + tuple(otherNonIndex)
+    myKeyFn = Relation.compileProjection(self.cols, joinIndex)
+    myValsFn = Relation.compileProjection(self.cols, myNonIndex)
+    myTimeFn = Relation.compileProjection(self.cols, (myTimeCol,))
+    noMatch = tuple([None] * len(otherNonIndex))
     newRows = []
     for row in self.rows:
-      key = projectRow(self.cols, row, joinIndex)
-      vals = projectRow(self.cols, row, myNonIndex)
-      if key in joinDict:
-        for otherRelationVals in joinDict[key]:
-          newRows.append( key + vals + otherRelationVals )
+      key = myKeyFn(row)
+      vals = key + myValsFn(row)
+      table = tables.get(key)
+      (start, stop) = findRange(table[0], myTimeFn(row)[0]) if table != None else (0, 0)
+      if stop > start:
+        newRows.extend([vals + otherVals for otherVals in table[1][start:stop]])
       elif inner == False: # outer join, include Nones
-        newRows.append( key + vals + tuple([None] * len(otherNonIndex)) )
-
-    self.cols = newCols
+        newRows.append(vals + noMatch)
+    self.cols = joinIndex + myNonIndex + otherNonIndex
     self.rows = newRows
+    self.keepSorted(sortedOn) # left rows keep their order
+
+  # semi join: keep only the rows whose joinIndex values are found in
+  # otherRelation.  Only the keys of otherRelation are read, no columns are
+  # added and the rows keep their order
+  # bloomBits: for a very large otherRelation, hold a Bloom filter of
+  # bloomBits bits of its keys instead of all of them (see matchedKeys)
+  # ex: configs.semiJoin(results, ('conf', 'threads'))
+  def semiJoin(self, otherRelation, joinIndex, bloomBits=None):
+    self.selectKeys(otherRelation, joinIndex, True, bloomBits)
+
+  # anti join: keep only the rows whose joinIndex values are not found in
+  # otherRelation, see semiJoin
+  # ex: missing = Relation(configs); missing.antiJoin(results, ('conf', 'threads'))
+  def antiJoin(self, otherRelation, joinIndex, bloomBits=None):
+    self.selectKeys(otherRelation, joinIndex, False, bloomBits)
+
+  # helper
+  # keep the rows whose joinIndex values are found in otherRelation, or
+  # those that are not if found is False
+  # uses the index on joinIndex of otherRelation if there is one
+  def selectKeys(self, otherRelation, joinIndex, found, bloomBits):
+    sortedOn = self.sortedOn
+    keyFn = Relation.compileProjection(self.cols, joinIndex)
+    otherKeys = otherRelation.getIndex(joinIndex)
+    if otherKeys == None and bloomBits != None:
+      otherKeys = Relation.matchedKeys(self.iterProjected(joinIndex), otherRelation, joinIndex, bloomBits)
+    elif otherKeys == None:
+      otherKeys = set(otherRelation.iterProjected(joinIndex))
+    self.rows = [row for row in self.rows if (keyFn(row) in otherKeys) == found]
+    self.keepSorted(sortedOn)
+
+  # helper
+  # return the set of the keys of myKeys found in otherRelation
+  # the keys of otherRelation are read twice: into a Bloom filter of
+  # bloomBits bits, which drops the keys of myKeys that surely don't match,
+  # then to find which of the remaining keys do.  Only the Bloom filter and
+  # the remaining keys are held in memory
+  @staticmethod
+  def matchedKeys(myKeys, otherRelation, joinIndex, bloomBits):
+    bloom = BloomFilter.forItems(bloomBits, otherRelation.numRows())
+    for key in otherRelation.iterProjected(joinIndex):
+      bloom.add(key)
+    candidates = set(key for key in myKeys if key in bloom)
+    return set(key for key in otherRelation.iterProjected(joinIndex) if key in candidates)
 
   # return True if the relation contains duplicate rows based off the columns in keyCols
+  # sorted rows are checked by comparing neighbours, finding out whether
+  # the rows are sorted on the way
   def hasDuplicates(self, keyCols):
+    index = self.getIndex(keyCols)
+    if index != None:
+      return len(index) != self.numRows()
+    # in sorted rows a duplicate is next to its twin
+    for i, key in enumerate(self.iterProjected(keyCols)):
+      if i > 0:
+        if key == lastKey: return True
+        if key < lastKey: break # not sorted, hash the keys instead
+      lastKey = key
+    else:
+      if self.sortedOn == None:
+        self.sortedOn = keyCols
+      return False
+
+    keyFn = Relation.compileProjection(self.cols, keyCols)
     keySet = set()
     for row in self.rows:
-      key = projectRow(self.cols, row, keyCols)
+      key = keyFn(row)
       if key in keySet: return True
       keySet.add(key)
     return False
 
+  # return a new Relation of the keyCols values found in more than one row,
+  # with their number of rows in countCol, in the order they first appear
+  # all rows are counted in one pass (see Grouping.agg)
+  def duplicates(self, keyCols, countCol='count'):
+    counts = self.groupBy(keyCols).agg(((countCol, 'count', None),))
+    counts.select(Expr.col(countCol) > 1)
+    return counts
+
+  # keep only the first row of every distinct keyCols value (default: the
+  # whole row), the rows keep their order
+  def distinct(self, keyCols=None):
+    sortedOn = self.sortedOn
+    keyFn = Relation.compileProjection(self.cols, self.cols if keyCols == None else keyCols)
+    seen = set()
+    newRows = []
+    for row in self.rows:
+      key = keyFn(row)
+      if key not in seen:
+        seen.add(key)
+        newRows.append(row)
+    self.rows = newRows
+    self.keepSorted(sortedOn)
+
   # return True if the relations contain the same set of keys based off keyCols
   # if assert then die if not a match
+  # sorted relations are merged, otherwise an index already holds the set
+  # of keys
   def keysMatch(self, otherRelation, keyCols, **kwargs):
-    myKeySet = set()
-    otherKeySet = set()
-    for key in [projectRow(self.cols, r, keyCols) for r in self.rows]:
-      myKeySet.add(key)
-    for key in [projectRow(otherRelation.cols, r, keyCols) for r in otherRelation.rows]:
-      otherKeySet.add(key)
-    symDiff = myKeySet ^ otherKeySet
+    myKeys = self.getIndex(keyCols)
+    otherKeys = otherRelation.getIndex(keyCols)
+    if myKeys == None and otherKeys == None and self.isSorted(keyCols) and otherRelation.isSorted(keyCols):
+      (leftOnly, rightOnly) = Relation.mergeKeysDiff(self.iterProjected(keyCols), otherRelation.iterProjected(keyCols))
+    else:
+      if myKeys == None:
+        myKeys = set(self.iterProjected(keyCols))
+      if otherKeys == None:
+        otherKeys = set(otherRelation.iterProjected(keyCols))
+      leftOnly = set(k for k in myKeys if k not in otherKeys)
+      rightOnly = set(k for k in otherKeys if k not in myKeys)
     if 'doAssert' in kwargs and kwargs['doAssert']:
-      assert len(symDiff) == 0, "keys mismatched\nIn left but not right:\n{!r}\nIn right but not left:\n{!r}".format(myKeySet-otherKeySet, otherKeySet-myKeySet)
-    return len(symDiff) == 0
+      assert len(leftOnly) == 0 and len(rightOnly) == 0, "keys mismatched\nIn left but not right:\n{!r}\nIn right but not left:\n{!r}".format(leftOnly, rightOnly)
+    return len(leftOnly) == 0 and len(rightOnly) == 0
 
-  # convenience functions:
+  # inner join of this relation with all of otherRelations on joinIndex
+  # (see joinDataSetsOrDie)
+  # every relation is hashed once, duplicate keys are found while hashing,
+  # and the joined rows are built once in the order of this relation.
+  # returns a new Relation with the columns of a chain of leftHashJoins
+  def joinManyOrDie(self, otherRelations, joinIndex):
+    relations = [self] + list(otherRelations)
+    nonIndexCols = Relation.joinManyNonIndexCols(relations, joinIndex)
 
-  # castDict is a dict of {column name -> cast function}
-  def cast(self, castDict):
+    # hash {key -> non index values} of every other relation
+    tables = []
+    for i, rel in enumerate(relations):
+      keyFn = Relation.compileProjection(rel.cols, joinIndex)
+      valsFn = Relation.compileProjection(rel.cols, nonIndexCols[i])
+      table = {}
+      for row in rel.rows:
+        key = keyFn(row)
+        if key in table:
+          assert False, Relation.duplicateKeysMessage(rel, i, joinIndex)
+        table[key] = valsFn(row) if i > 0 else None
+      tables.append(table)
+
+    myKeys = tables[0]
+    for table in tables[1:]:
+      if len(table) != len(myKeys) or any(k not in table for k in myKeys):
+        leftOnly = set(k for k in myKeys if k not in table)
+        rightOnly = set(k for k in table if k not in myKeys)
+        assert False, "keys mismatched\nIn left but not right:\n{!r}\nIn right but not left:\n{!r}".format(leftOnly, rightOnly)
+
+    keyFn = Relation.compileProjection(self.cols, joinIndex)
+    valsFn = Relation.compileProjection(self.cols, nonIndexCols[0])
+    otherTables = tables[1:]
     newRows = []
     for row in self.rows:
+      key = keyFn(row)
+      newRow = key + valsFn(row)
+      for table in otherTables:
+        newRow += table[key]
+      newRows.append(newRow)
+    newCols = tuple(joinIndex) + tuple(c for cols in nonIndexCols for c in cols)
+    return Relation((newCols, newRows))
+
+  # helper
+  # the error of joinManyOrDie for duplicate keys in relation i of the join,
+  # listing the first duplicated keys and their counts
+  @staticmethod
+  def duplicateKeysMessage(rel, i, joinIndex):
+    return "duplicate keys in relation {} while joining:\n{}".format(i, rel.duplicates(joinIndex).toStr(10))
+
+  # helper
+  # return the non index columns of every relation joined by joinManyOrDie
+  # asserts that no non index column is shared
+  @staticmethod
+  def joinManyNonIndexCols(relations, joinIndex):
+    nonIndexCols = [tuple(c for c in rel.cols if c not in joinIndex) for rel in relations]
+    seen = set()
+    for cols in nonIndexCols:
+      intersection = seen & set(cols)
+      assert len(intersection) == 0, "non-index fields in common while joining: {!r}".format(intersection)
+      seen |= set(cols)
+    return nonIndexCols
+
+  # keep only the rows whose keyCols values equal the tuple key
+  # uses the index on keyCols if there is one
+  def selectEquals(self, keyCols, key):
+    index = self.getIndex(keyCols)
+    if index == None:
+      self.select(lambda vals: vals == key, keyCols)
+    else:
+      rows = self.rows
+      self.rows = [rows[i] for i in index.get(key, ())]
+
+  # inner join with otherRelation on joinIndex, kept up to date as rows are
+  # appended to either relation.  returns a Views.JoinView
+  def joinView(self, otherRelation, joinIndex):
+    return Views.JoinView(self, otherRelation, joinIndex)
+
+  # group rows by the values of keyCols
+  # returns a Grouping, call agg() on it to compute aggregates per group
+  # (or view() to keep them up to date as rows are appended)
+  # ex: rel.groupBy(('conf', 'threads')).agg((('tput', 'mean', 'tput'), ('runs', 'count', None)))
+  def groupBy(self, keyCols):
+    return Grouping(self, keyCols)
+
+  # helper
+  # check window specs and resolve window function names
+  # returns (output columns, list of (WindowFn, input column))
+  def resolveWindowSpecs(self, specs):
+    outCols = tuple(spec[0] for spec in specs)
+    fns = []
+    for (outCol, fn, inCol) in specs:
+      fn = Windows.getWindowFn(fn)
+      assert (inCol != None) == fn.needsInput, "window function {!r} {} an input column".format(fn, "needs" if fn.needsInput else "takes no")
+      assert inCol == None or inCol in self.cols, "window input {!r} not in cols {!r}".format(inCol, self.cols)
+      fns.append((fn, inCol))
+    assert len(set(self.cols + outCols)) == len(self.cols) + len(outCols), "window output columns must be new and unique"
+    return (outCols, fns)
+
+  # compute window functions over partitions of the rows
+  # rows with the same partitionCols values form a partition, ordered by
+  # orderCols (ties keep the order of the rows)
+  # specs is a tuple of (output column, window function, input column)
+  #   window function is a name in Windows.windowFns or a Windows.WindowFn
+  #   input column is None for rank and rowNumber
+  # adds the output columns to every row, the rows keep their order
+  # ex: rel.window(('conf',), ('threads',), (('cumTput', 'cumsum', 'tput'), ('prev', Windows.Lag(1), 'tput')))
+  def window(self, partitionCols, orderCols, specs):
+    sortedOn = self.sortedOn
+    (outCols, fns) = self.resolveWindowSpecs(specs)
+    rows = self.rows
+    partitionFn = Relation.compileProjection(self.cols, partitionCols)
+    orderFn = Relation.compileProjection(self.cols, orderCols)
+
+    partitions = collections.defaultdict(list)
+    for i, row in enumerate(rows):
+      partitions[partitionFn(row)].append(i)
+    outputs = [[None] * len(rows) for spec in specs]
+    for positions in partitions.values():
+      positions.sort(key=lambda i: orderFn(rows[i]))
+      keys = [orderFn(rows[i]) for i in positions]
+      for out, (fn, inCol) in zip(outputs, fns):
+        if inCol == None:
+          vals = [None] * len(positions)
+        else:
+          colIdx = self.cols.index(inCol)
+          vals = [rows[i][colIdx] for i in positions]
+        for i, val in zip(positions, fn.compute(vals, keys)):
+          out[i] = val
+
+    self.rows = [row + newVals for row, newVals in zip(rows, zip(*outputs))] if len(outputs) > 0 else rows
+    self.cols = self.cols + outCols
+    self.keepSorted(sortedOn)
+
+  # turn columns into rows (melt)
+  # every row becomes one row per column of valueCols, holding the idCols
+  # values, the name of the column in nameCol and its value in valueCol
+  # ex: rel.unpivot(('conf',), ('tput', 'lat')) turns ('conf', 'tput', 'lat')
+  # rows into ('conf', 'name', 'value') rows
+  def unpivot(self, idCols, valueCols, nameCol='name', valueCol='value'):
+    assert isinstance(valueCols, tuple) and len(valueCols) > 0, "value columns must be a non-empty tuple"
+    newCols = idCols + (nameCol, valueCol)
+    assert len(set(newCols)) == len(newCols), "unpivot output columns must be unique: {!r}".format(newCols)
+    idFn = Relation.compileProjection(self.cols, idCols)
+    Relation.compileProjection(self.cols, valueCols) # check the columns
+    values = [(c, self.cols.index(c)) for c in valueCols]
+    self.rows = [idFn(row) + (c, row[i]) for row in self.rows for (c, i) in values]
+    self.cols = newCols
+
+  # turn rows into columns, the reverse of unpivot
+  # rows with the same idCols values become one row, with a column named
+  # str(name) for every distinct nameCol value holding its valueCol value
+  # (fill if the rows have no such name).  Rows and columns are in the
+  # order they first appear
+  # agg: aggregate (see Grouping.agg) the values of rows with the same ids
+  # and name, without it such rows are an error
+  # ex: rel.pivot(('conf',), 'threads', 'tput', 'mean')
+  def pivot(self, idCols, nameCol, valueCol, agg=None, fill=None):
+    source = self
+    if agg != None:
+      source = self.groupBy(idCols + (nameCol,)).agg(((valueCol, agg, valueCol),))
+    idFn = Relation.compileProjection(source.cols, idCols)
+    cellFn = Relation.compileProjection(source.cols, (nameCol, valueCol))
+
+    names = []
+    seenNames = set()
+    cells = {}
+    order = []
+    for row in source.rows:
+      key = idFn(row)
+      (name, value) = cellFn(row)
+      if key not in cells:
+        cells[key] = {}
+        order.append(key)
+      if name not in seenNames:
+        seenNames.add(name)
+        names.append(name)
+      cell = cells[key]
+      assert name not in cell, "several values for ids {!r} and name {!r}, give an aggregate".format(key, name)
+      cell[name] = value
+
+    newCols = Relation.pivotCols(idCols, names)
+    self.rows = [key + tuple(cells[key].get(name, fill) for name in names) for key in order]
+    self.cols = newCols
+
+  # helper
+  # the columns of a pivot with the distinct names names
+  @staticmethod
+  def pivotCols(idCols, names):
+    newCols = idCols + tuple(str(name) for name in names)
+    assert len(set(newCols)) == len(newCols), "pivot output columns must be unique: {!r}".format(newCols)
+    return newCols
+
+  # convenience functions:
+
+  # helper
+  # compile a row function applying castDict to rows with columns cols
+  # castDict is a dict of {column name -> cast function}
+  @staticmethod
+  def compileCast(cols, castDict):
+    # resolve the cast columns once
+    casts = [(i, colName, castDict[colName]) for i, colName in enumerate(cols) if colName in castDict]
+    def castRow(row):
       newRow = list(row)
-      for i, (val, colName) in enumerate(zip(row, self.cols)):
-        if colName in castDict:
-          try:
-            val = castDict[colName](val)
-          except:
-            print "error casting column: {!r}, value: {!r}, type: {!r}".format(colName, val, type(val))
-          newRow[i] = val
-      newRows.append(tuple(newRow))
-    self.rows = newRows
+      for (i, colName, castFn) in casts:
+        val = row[i]
+        try:
+          val = castFn(val)
+        except:
+          print "error casting column: {!r}, value: {!r}, type: {!r}".format(colName, val, type(val))
+        newRow[i] = val
+      return tuple(newRow)
+    return castRow
 
+  # helper
+  # compile a row predicate applying filterDict to rows with columns cols
   # filterDict is dict of {column name -> bool function (true to keep)}
-  def filter(self, filterDict):
-    newRows = []
-    for row in self.rows:
+  @staticmethod
+  def compileFilter(cols, filterDict):
+    # resolve the filtered columns once
+    filters = [(i, colName, filterDict[colName]) for i, colName in enumerate(cols) if colName in filterDict]
+    def keepRow(row):
       keep = True
-      for (val, colName) in zip(row, self.cols):
-        if colName in filterDict:
-          try:
-            keep = filterDict[colName](val)
-          except:
-            print "error filtering field: {!r}, value: {!r}, type: {!r}" % (field, val, type(val))
+      for (i, colName, filterFn) in filters:
+        val = row[i]
+        try:
+          keep = filterFn(val)
+        except:
+          print "error filtering field: {!r}, value: {!r}, type: {!r}".format(colName, val, type(val))
 
         if not keep:
           break # next row
-      if keep:
-        newRows.append(row)
-    self.rows = newRows
+      return keep
+    return keepRow
+
+  # castDict is a dict of {column name -> cast function}
+  def cast(self, castDict):
+    castRow = Relation.compileCast(self.cols, castDict)
+    self.rows = self.mapRowChunks(lambda rows: map(castRow, rows))
+
+  # filterDict is dict of {column name -> bool function (true to keep)}
+  # or a boolean Expr
+  def filter(self, filterDict):
+    if isinstance(filterDict, Expr.Expr):
+      self.select(filterDict)
+      return
+    sortedOn = self.sortedOn
+    keepRow = Relation.compileFilter(self.cols, filterDict)
+    self.rows = self.mapRowChunks(lambda rows: [row for row in rows if keepRow(row)])
+    self.keepSorted(sortedOn)
+
+  # helper
+  # compile the key sorting rows with columns cols by sortCols
+  # reverse: True, False or a tuple of the columns sorted in descending order
+  # keyFns: dict of {column -> key function applied to its values}
+  # returns (key function, reverse) for sorted().  The key is a single
+  # composite key of all columns, so that the rows are sorted once
+  @staticmethod
+  def compileSortKey(cols, sortCols, reverse=False, keyFns=None):
+    keyFns = {} if keyFns == None else keyFns
+    projectFn = Relation.compileProjection(cols, sortCols)
+    if isinstance(reverse, bool) and not any(c in keyFns for c in sortCols):
+      return (projectFn, reverse)
+    colKeyFns = []
+    for c in sortCols:
+      i = cols.index(c)
+      if c in keyFns:
+        keyFn = lambda row, i=i, fn=keyFns[c]: fn(row[i])
+      else:
+        keyFn = operator.itemgetter(i)
+      if not isinstance(reverse, bool) and c in reverse:
+        keyFn = ExternalSort.reverseKey(keyFn)
+      colKeyFns.append(keyFn)
+    return (lambda row: tuple([fn(row) for fn in colKeyFns]), reverse is True)
+
+  # sort the rows by the values of sortCols, with one sort of a composite
+  # key (see compileSortKey for reverse and keyFns).  The sort is stable
+  # runSize: sort at most runSize rows in memory at a time, spilling sorted
+  # runs to temporary files (see ExternalSort.py).  None sorts in memory.
+  # The rows leave the relation's list as they are spilled, so the sort
+  # holds no second copy of them, but the merged rows are read back into a
+  # list: the relation holds every row again at the end.  Use sortedRows to
+  # go through the sorted rows without holding them all
+  # ex: rel.sort(('conf', 'threads'), reverse=('threads',), keyFns={'conf': confOrder.index})
+  def sort(self, sortCols, reverse=False, runSize=None, keyFns=None):
+    (keyFn, reverseAll) = Relation.compileSortKey(self.cols, sortCols, reverse, keyFns)
+    if runSize == None:
+      rows = sorted(self.rows, key=keyFn, reverse=reverseAll)
+    else:
+      rows = self.rows
+      self.rows = []
+      rows = list(ExternalSort.externalSort(ExternalSort.drainList(rows), keyFn, reverseAll, runSize))
+    self.rows = rows
+    if not reverse and not keyFns:
+      self.declareSorted(sortCols)
+
+  # return the rows sorted as sort would sort them, without changing the
+  # relation: the rows are read with iterProjected and spilled in sorted
+  # runs of runSize rows, which iterating the result merges lazily.  The
+  # result is a list if the rows fit in one run, an ExternalSort.SortedRuns
+  # (close() removes its files) otherwise
+  # ex: for row in rel.sortedRows(('conf',), runSize=100000): ...
+  def sortedRows(self, sortCols, reverse=False, runSize=ExternalSort.defaultRunSize, keyFns=None):
+    (keyFn, reverseAll) = Relation.compileSortKey(self.cols, sortCols, reverse, keyFns)
+    return ExternalSort.externalSort(self.iterProjected(self.cols), keyFn, reverseAll, runSize)
+
+  # return the statistics of every column, a dict of {col -> {stat -> value}}
+  # with the stats of statNames:
+  #   count: number of values that are not None
+  #   min, max: of the values that are not None (None if there are none)
+  #   sum: of the values that are not None, None if they are not numbers
+  #   distinct: number of distinct values that are not None, None if the
+  #     values can't be hashed
+  # computed in one pass and kept until the rows change
+  def stats(self):
+    key = (tuple(self.cols), self.numRows())
+    statistics = getattr(self, 'statistics', None)
+    if statistics != None and statistics[1] == key:
+      return statistics[0]
+    catalog = self.computeStats()
+    self.statistics = (catalog, key)
+    return catalog
+
+  # helper
+  # compute the statistics of every column (see stats)
+  # chunks of rows are transposed into columns, which the builtins reduce
+  def computeStats(self):
+    states = [Relation.initialStats() for c in self.cols]
+    rows = iter(self.rows)
+    while True:
+      chunk = list(itertools.islice(rows, statsChunkSize))
+      if len(chunk) == 0:
+        break
+      for state, vals in zip(states, zip(*chunk)):
+        Relation.addStats(state, vals)
+    return dict((c, Relation.statsResult(state)) for c, state in zip(self.cols, states))
 
-  # calculate the mins of all rows
+  # helper
+  # the statistics state of a column without values
+  @staticmethod
+  def initialStats():
+    return {'count': 0, 'min': None, 'max': None, 'sum': 0, 'distinct': set()}
+
+  # helper
+  # add a sequence of values of a column to its statistics state
+  @staticmethod
+  def addStats(state, vals):
+    if None in vals:
+      vals = [v for v in vals if v != None]
+    if len(vals) == 0:
+      return
+    state['count'] += len(vals)
+    (low, high) = (min(vals), max(vals))
+    if state['min'] == None or low < state['min']:
+      state['min'] = low
+    if state['max'] == None or high > state['max']:
+      state['max'] = high
+    if state['sum'] != None:
+      try:
+        state['sum'] = sum(vals, state['sum'])
+      except TypeError: # not numbers
+        state['sum'] = None
+    if state['distinct'] != None:
+      try:
+        state['distinct'].update(vals)
+      except TypeError: # unhashable values
+        state['distinct'] = None
+
+  # helper
+  # the statistics of a column from its state
+  @staticmethod
+  def statsResult(state):
+    result = dict(state)
+    if result['distinct'] != None:
+      result['distinct'] = len(result['distinct'])
+    return result
+
+  # return the statistics of every column (see stats) as a new Relation with
+  # one row per column and the columns ('column',) + statNames
+  def describe(self):
+    catalog = self.stats()
+    return Relation((('column',) + statNames, [(c,) + tuple(catalog[c][s] for s in statNames) for c in self.cols]))
+
+  # the min of every column
   def mins(self):
-    import operator
-    outputMins = [0] * len(self.cols)
-    for i in range(len(self.cols)):
-      l = map(operator.itemgetter(i), self.rows)
-      outputMins[i] = min(l)
-    return tuple(outputMins)
+    catalog = self.stats()
+    return tuple(catalog[c]['min'] for c in self.cols)
+
+  # the max of every column
+  def maxs(self):
+    catalog = self.stats()
+    return tuple(catalog[c]['max'] for c in self.cols)
 
   def __str__(self):
     return self.toStr(5)
 
   def toStr(self, rowCount=-1):
     # convert so that we can properly add newlines
-    rowCount = len(self.rows) if rowCount == -1 else rowCount
+    rows = self.rows
+    rowCount = len(rows) if rowCount == -1 else rowCount
     out = (""
       + "relation\n"
       + "cols: {}\n".format(self.cols)
-      + "# rows: {}\n".format(len(self.rows))
+      + "# rows: {}\n".format(len(rows))
       + "rows:\n"
     )
-    for i, t in enumerate(sorted(self.rows)[0:rowCount]):
+    # only the first rowCount rows are sorted
+    firstRows = sorted(rows) if rowCount >= len(rows) else heapq.nsmallest(rowCount, rows)
+    for i, t in enumerate(firstRows):
       out += str(t)
       if i != rowCount-1:
         out += "\n"
     return out
 
+# groups of the rows of a relation that share the values of keyCols
+# create with Relation.groupBy(keyCols)
+class Grouping(object):
+  def __init__(self, relation, keyCols):
+    assert isinstance(keyCols, tuple), "key columns must be a tuple"
+    self.relation = relation
+    self.keyCols = keyCols
+
+  # helper
+  # check aggSpecs and resolve aggregate names
+  # returns (output columns, list of (Aggregate, input column))
+  def resolveSpecs(self, aggSpecs):
+    outCols = tuple(spec[0] for spec in aggSpecs)
+    aggs = []
+    for (outCol, agg, inCol) in aggSpecs:
+      agg = Aggregates.getAggregate(agg)
+      assert inCol != None or isinstance(agg, Aggregates.Count), "only count may have no input column"
+      assert inCol == None or inCol in self.relation.cols, "aggregate input {!r} not in cols {!r}".format(inCol, self.relation.cols)
+      aggs.append((agg, inCol))
+    assert len(set(self.keyCols + outCols)) == len(self.keyCols) + len(outCols), "aggregate output columns must be unique"
+    return (outCols, aggs)
+
+  # compute aggregates for every group in one pass over the rows
+  # aggSpecs is a tuple of (output column, aggregate, input column)
+  #   aggregate is a name in Aggregates.aggregates or an Aggregates.Aggregate
+  #   input column may be None for count
+  # returns a new Relation with columns keyCols + output columns, one row per
+  # group, in the order each group first appears
+  def agg(self, aggSpecs):
+    (outCols, aggs) = self.resolveSpecs(aggSpecs)
+    rel = self.relation
+    inputCols = tuple(sorted(set(inCol for (agg, inCol) in aggs if inCol != None)))
+    keyFn = Relation.compileProjection(rel.cols, self.keyCols)
+    valsFn = Relation.compileProjection(rel.cols, inputCols)
+
+    # without any input columns collect the key itself to count the group
+    if len(inputCols) == 0:
+      valsFn = lambda row: (None,)
+
+    # collect the input values of every group, then reduce each list
+    groups = {}
+    order = []
+    for row in rel.rows:
+      key = keyFn(row)
+      groupVals = groups.get(key)
+      if groupVals == None:
+        groupVals = groups[key] = [[] for c in range(max(len(inputCols), 1))]
+        order.append(key)
+      for vals, val in zip(groupVals, valsFn(row)):
+        vals.append(val)
+
+    newRows = []
+    for key in order:
+      groupVals = groups[key]
+      out = []
+      for (agg, inCol) in aggs:
+        vals = groupVals[inputCols.index(inCol)] if inCol != None else groupVals[0]
+        out.append(agg.reduce(vals))
+      newRows.append(key + tuple(out))
+    return Relation((self.keyCols + outCols, newRows))
+
+  # the aggregates of agg(aggSpecs), kept up to date as rows are appended
+  # to the relation.  returns a Views.AggView
+  def view(self, aggSpecs):
+    return Views.AggView(self.relation, self.keyCols, aggSpecs)
+
 # multi-way inner join between several relations
 # relations is a list of Relations
 # joinIndex is a tuple of columns that every dataset shares
+# dies if any relation has duplicate keys or the relations' key sets differ
 # return a new Relation (do not modify input relations)
 def joinDataSetsOrDie(relations, joinIndex):
-  for rel in relations:
-    assert not rel.hasDuplicates(joinIndex)
-
   assert len(relations) > 0, "Must have at least 1 relation to join"
-  newRel = Relation(relations[0])
-  if len(dataSets) > 1:
-    for otherRelation in relations[1:]:
-      newRel.keysMatch(otherRelation, joinIndex, doAssert=True)
-      newRel.leftHashJoin(otherRelation, joinIndex)
-  return newRel
+  return relations[0].joinManyOrDie(relations[1:], joinIndex)
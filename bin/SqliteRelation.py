@@ -0,0 +1,591 @@
+#!/usr/bin/python
+#
+# Relations stored in a SQLite database
+#
+# SqliteRelation supports the same operations as Relational.Relation but
+# keeps its rows in a table of a SQLite database file (by default a
+# temporary file, removed when the database is closed), so relations larger
+# than memory can be joined and aggregated.  Rows are only read into python
+# when rows is read.
+#
+# translated into SQL:
+#   project, sort (without keyFns), selectEquals, semiJoin and antiJoin
+#   select, generateCol and filter: an Expr becomes a SQL expression, python
+#     functions (and Exprs without a translation) are registered as SQL
+#     functions and still run inside the query
+#   cast: the cast functions run inside the query as well
+#   leftHashJoin: an index is created on the join keys of the other relation
+#   hasDuplicates and keysMatch
+#   groupBy(...).agg with count, sum, min, max and mean
+#   stats: a single query reduces every column
+# every other operation reads the rows into python and writes the result
+# back.  Every operation writes its result into a new table in the order of
+# the rows: the rowid of a table is the row position.  A relation's table
+# is dropped when the relation is freed.
+#
+# values must be None, ints, floats or strings.  bools come back as ints, and
+# as in Relation None equals None in joins and keys.  Exprs are only
+# translated where SQL gives the values python gives: arithmetic and - abs
+# on columns holding only numbers, & | on conditions, and comparisons with
+# None ordered before every other value.  Other Exprs run as python
+# functions.  Translated arithmetic has SQL semantics for division by zero
+# (x / 0 is None rather than an error)
+#
+# ex:
+#   db = SqliteRelation.Database("results.db")
+#   rel = SqliteRelation(relation, db)
+#   rel.leftHashJoin(SqliteRelation(other, db), ('exp',))
+#   rel.select(col('lat_ns') > 100)
+#   print rel.groupBy(('exp',)).agg((('lat', 'mean', 'lat_ns'),)).rows
+
+import itertools
+import sqlite3
+
+from Relational import Relation, Grouping
+import Aggregates
+import Expr
+
+# quote a table or column name
+def quote(name):
+  return '"' + name.replace('"', '""') + '"'
+
+# the columns of a table holding width values per row.  Tables name their
+# columns by position, so that rows and cols can be assigned separately
+# (a table has at least one column)
+def tableCols(width):
+  return ["c{}".format(i) for i in range(max(width, 1))]
+
+# a SQL select list, NULL for no columns
+def selectList(exprs):
+  return ", ".join(exprs) if len(exprs) > 0 else "NULL"
+
+def isSqlValue(val):
+  return val == None or isinstance(val, (int, long, float, str))
+
+# convert a value read by a SQL function (text is unicode) to the python value
+def fromSql(val):
+  return val.encode('utf-8') if isinstance(val, unicode) else val
+
+# a SQLite database holding the tables of SqliteRelations
+# fileName: the database file, '' for a temporary file
+class Database(object):
+  def __init__(self, fileName=''):
+    self.connection = sqlite3.connect(fileName, isolation_level=None)
+    self.connection.text_factory = str
+    self.count = 0
+
+  def execute(self, sql, params=()):
+    return self.connection.execute(sql, params)
+
+  # return a name of the form <prefix><n> that no table or index has
+  def newName(self, prefix):
+    while True:
+      self.count += 1
+      name = "{}{}".format(prefix, self.count)
+      if self.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() == None:
+        return name
+
+  # create an empty table of rows of width values, return its name
+  def newTable(self, width):
+    table = self.newName('rel')
+    self.execute("CREATE TABLE {} ({})".format(quote(table), ", ".join(tableCols(width))))
+    return table
+
+  # add columns to table until it holds width values per row
+  def widenTable(self, table, width):
+    existing = len(self.execute("PRAGMA table_info({})".format(quote(table))).fetchall())
+    for c in tableCols(width)[existing:]:
+      self.execute("ALTER TABLE {} ADD COLUMN {}".format(quote(table), c))
+
+  # insert rows of width values into table, in one transaction
+  def insertRows(self, table, width, rows):
+    if width == 0:
+      (sql, rows) = ("INSERT INTO {} DEFAULT VALUES".format(quote(table)), (() for row in rows))
+    else:
+      sql = "INSERT INTO {} ({}) VALUES ({})".format(quote(table), ", ".join(tableCols(width)), ", ".join(["?"] * width))
+    self.execute("BEGIN")
+    try:
+      self.connection.executemany(sql, rows)
+    except:
+      self.execute("ROLLBACK")
+      raise
+    self.execute("COMMIT")
+
+  # register fn, a function of a tuple of values, as a SQL function of
+  # numArgs arguments.  returns its name
+  def addFunction(self, fn, numArgs):
+    name = self.newName('pyfn')
+    self.connection.create_function(name, numArgs, lambda *vals: fn(tuple(map(fromSql, vals))))
+    return name
+
+  def close(self):
+    self.connection.close()
+
+# raised for expressions that have no SQL translation
+class NotTranslatable(Exception):
+  pass
+
+# kinds of SQL values that behave as the python values of an Expr (see
+# toSql).  Neither is ever NULL
+numberKind = 'number' # an integer or real (bools are integers)
+boolKind = 'bool' # the 0 or 1 of a condition
+
+# {Expr operator -> SQL operator}
+# arithmetic is only translated on numbers: SQL would add text as 0
+arithmeticOps = {
+  '+'  : '+',
+  '-'  : '-',
+  '*'  : '*',
+  '/'  : '/',
+}
+
+# == and != are IS and IS NOT so that None equals None.  Tables have no
+# column types, so as in python numbers are less than text
+comparisonOps = {
+  '==' : 'IS',
+  '!=' : 'IS NOT',
+  '<'  : '<',
+  '<=' : '<=',
+  '>'  : '>',
+  '>=' : '>=',
+}
+
+# the SQL of "{0} op {1}" when {0} or {1} is NULL: python orders None before
+# every other value
+nullComparisons = {
+  '<'  : "({0} IS NULL AND {1} IS NOT NULL)",
+  '<=' : "({0} IS NULL)",
+  '>'  : "({0} IS NOT NULL AND {1} IS NULL)",
+  '>=' : "({1} IS NULL)",
+}
+
+# and/or are only translated on conditions: python's and/or return one of
+# their operands
+booleanOps = {
+  '&'  : 'AND',
+  '|'  : 'OR',
+}
+
+# {Expr function -> (SQL template, kinds of the argument, kind of the result)}
+sqlFunctions = {
+  'neg' : ("(-{})", (numberKind,), numberKind),
+  'abs' : ("abs({})", (numberKind,), numberKind),
+  'not' : ("(NOT {})", (numberKind, boolKind), boolKind),
+}
+
+# {Aggregate class -> SQL template of the input column}
+# count counts every row, as Count counts None values
+sqlAggregates = {
+  Aggregates.Count : "COUNT(*)",
+  Aggregates.Sum   : "SUM({})",
+  Aggregates.Min   : "MIN({})",
+  Aggregates.Max   : "MAX({})",
+  Aggregates.Mean  : "AVG({})",
+}
+
+# the kind of the SQL of expr: numberKind, boolKind or None if it is not
+# known (e.g. a column holding text or None)
+# columnKind(name) returns the kind of a column
+def sqlKind(expr, columnKind):
+  if isinstance(expr, Expr.Col):
+    return columnKind(expr.name)
+  if isinstance(expr, Expr.Lit):
+    return numberKind if isinstance(expr.value, (int, long, float)) else None
+  if isinstance(expr, Expr.BinOp) and expr.op in arithmeticOps:
+    return numberKind
+  if isinstance(expr, Expr.BinOp) and (expr.op in comparisonOps or expr.op in booleanOps):
+    return boolKind
+  if isinstance(expr, Expr.Func) and expr.name in sqlFunctions:
+    return sqlFunctions[expr.name][2]
+  if isinstance(expr, Expr.IsIn):
+    return boolKind
+  return None
+
+# translate expr into a SQL expression giving the values python gives
+# column(name) returns the SQL of a column, columnKind(name) its kind (see
+# sqlKind).  Literal values are added to params and referred to by number,
+# so that the SQL of an operand may be repeated
+# raises NotTranslatable if some part has no translation
+def toSql(expr, column, columnKind, params):
+  sql = lambda e: toSql(e, column, columnKind, params)
+  kind = lambda e: sqlKind(e, columnKind)
+  if isinstance(expr, Expr.Col):
+    return column(expr.name)
+  if isinstance(expr, Expr.Lit):
+    if not isSqlValue(expr.value):
+      raise NotTranslatable(repr(expr))
+    params.append(expr.value)
+    return "?{}".format(len(params))
+  if isinstance(expr, Expr.BinOp) and expr.op in arithmeticOps:
+    if kind(expr.left) == None or kind(expr.right) == None:
+      raise NotTranslatable(repr(expr))
+    left = sql(expr.left)
+    if expr.op == '/': # true division
+      left = "CAST({} AS REAL)".format(left)
+    return "({} {} {})".format(left, arithmeticOps[expr.op], sql(expr.right))
+  if isinstance(expr, Expr.BinOp) and expr.op in comparisonOps:
+    (left, right) = (sql(expr.left), sql(expr.right))
+    compared = "({} {} {})".format(left, comparisonOps[expr.op], right)
+    if expr.op in nullComparisons and (kind(expr.left) == None or kind(expr.right) == None):
+      return "(CASE WHEN {0} IS NULL OR {1} IS NULL THEN {2} ELSE {3} END)".format(
+          left, right, nullComparisons[expr.op].format(left, right), compared)
+    return compared
+  if isinstance(expr, Expr.BinOp) and expr.op in booleanOps:
+    if kind(expr.left) != boolKind or kind(expr.right) != boolKind:
+      raise NotTranslatable(repr(expr))
+    return "({} {} {})".format(sql(expr.left), booleanOps[expr.op], sql(expr.right))
+  if isinstance(expr, Expr.Func) and expr.name in sqlFunctions:
+    (template, argKinds, resultKind) = sqlFunctions[expr.name]
+    if not all(kind(a) in argKinds for a in expr.args):
+      raise NotTranslatable(repr(expr))
+    return template.format(*[sql(a) for a in expr.args])
+  if isinstance(expr, Expr.IsIn) and all(isSqlValue(v) for v in expr.values):
+    operand = sql(expr.expr)
+    values = [v for v in expr.values if v != None]
+    params.extend(values)
+    numbers = ", ".join("?{}".format(i) for i in range(len(params) - len(values) + 1, len(params) + 1))
+    # NULL is not IN anything
+    if len(values) < len(expr.values):
+      return "({0} IS NULL OR {0} IN ({1}))".format(operand, numbers)
+    return "({0} IS NOT NULL AND {0} IN ({1}))".format(operand, numbers)
+  raise NotTranslatable(repr(expr))
+
+class SqliteRelation(Relation):
+  # constructor
+  # default (empty relation)
+  # copy (from any Relation; a SqliteRelation of the same database is copied
+  # inside the database)
+  # (tuple(cols), list(tuple(rows)),) as for Relation
+  # database: a Database or the name of its file (default: the database of
+  # a copied SqliteRelation, or a new temporary one)
+  def __init__(self, arg=None, database=None):
+    if database == None:
+      database = arg.db if isinstance(arg, SqliteRelation) else Database()
+    elif isinstance(database, str):
+      database = Database(database)
+    self.db = database
+    self.table = None
+    if arg == None:
+      self.cols = ()
+      self.rows = []
+    elif isinstance(arg, SqliteRelation) and arg.db is self.db:
+      self.cols = tuple(arg.cols)
+      self.replaceTable(arg.cols, arg.selectSql(arg.cols))
+    elif isinstance(arg, Relation):
+      self.cols = tuple(arg.cols)
+      self.rows = arg.iterProjected(self.cols)
+    elif (
+           isinstance(arg, tuple) and
+           len(arg) == 2 and
+           isinstance(arg[0], tuple) and
+           isinstance(arg[1], list)
+         ): # input is columns and rows to create relation
+      self.cols = tuple(arg[0])
+      for col in self.cols:
+        assert isinstance(col, str)
+      l = len(self.cols)
+      for row in arg[1]:
+        assert len(row) == l
+      self.rows = arg[1]
+    else:
+      assert False, "SqliteRelation input invalid: {!r}".format(arg)
+
+  # the table is dropped with the relation
+  def __del__(self):
+    if getattr(self, 'table', None) != None:
+      try:
+        self.db.execute("DROP TABLE {}".format(quote(self.table)))
+      except sqlite3.Error: # e.g. the database was closed
+        pass
+
+  # the table is widened when columns are added
+  @property
+  def cols(self):
+    return self.colNames
+
+  @cols.setter
+  def cols(self, cols):
+    self.colNames = tuple(cols)
+    if self.table != None:
+      self.db.widenTable(self.table, len(self.colNames))
+
+  # reading rows reads the whole table, every assignment of rows writes a
+  # new table and drops the indexes
+  @property
+  def rows(self):
+    return list(self.iterProjected(self.cols))
+
+  @rows.setter
+  def rows(self, rows):
+    rows = iter(rows)
+    first = next(rows, None)
+    width = len(first) if first != None else len(self.cols)
+    table = self.db.newTable(width)
+    if first != None:
+      self.db.insertRows(table, width, itertools.chain([first], rows))
+    self.setTable(table)
+
+  def numRows(self):
+    return self.db.execute("SELECT COUNT(*) FROM {}".format(quote(self.table))).fetchone()[0]
+
+  # return an iterator of tuples of the given columns, read from the table
+  # as they are used
+  def iterProjected(self, projectCols):
+    n = len(projectCols)
+    cursor = self.db.execute(self.selectSql(projectCols))
+    return cursor if n > 0 else (row[:n] for row in cursor)
+
+  def appendRows(self, rows):
+    self.db.insertRows(self.table, len(self.cols), rows)
+    self.columnKinds = {}
+
+  # helper
+  # the SQL of column col of the table
+  def column(self, col, alias=None):
+    assert col in self.cols, "Column {!r} not in cols {!r}".format(col, self.cols)
+    sql = "c{}".format(self.cols.index(col))
+    return sql if alias == None else alias + "." + sql
+
+  # helper
+  # the kind of column col for toSql: numberKind if it only holds numbers
+  # found with a query the first time it is needed for the current table
+  def columnKind(self, col):
+    sql = self.column(col)
+    if sql not in self.columnKinds:
+      notNumber = self.db.execute("SELECT 1 FROM {} WHERE typeof({}) NOT IN ('integer', 'real') LIMIT 1".format(
+          quote(self.table), sql)).fetchone()
+      self.columnKinds[sql] = numberKind if notNumber == None else None
+    return self.columnKinds[sql]
+
+  # helper
+  # a query of the columns cols of the rows, in order
+  # where: a SQL condition on the rows
+  def selectSql(self, cols, where=None):
+    return "SELECT {} FROM {}{} ORDER BY rowid".format(
+        selectList([self.column(c) for c in cols]), quote(self.table), "" if where == None else " WHERE " + where)
+
+  # helper
+  # replace the table by a new one holding the rows of the query select,
+  # in order.  The query returns the values of cols
+  def replaceTable(self, cols, select, params=()):
+    table = self.db.newTable(len(cols))
+    self.db.execute("INSERT INTO {} ({}) {}".format(quote(table), ", ".join(tableCols(len(cols))), select), params)
+    self.cols = cols
+    self.setTable(table)
+
+  # helper
+  # make table the table of the relation, dropping the previous one
+  def setTable(self, table):
+    if self.table != None:
+      self.db.execute("DROP TABLE {}".format(quote(self.table)))
+    self.table = table
+    self.columnKinds = {}
+    self.db.widenTable(table, len(self.cols))
+    self.invalidateIndexes()
+
+  # helper
+  # the SQL of the value of an Expr or of fn (a function of the values of
+  # fnColInputs), run as a SQL function when it has no translation
+  # literal values are added to params
+  def valueSql(self, fn, fnColInputs, params):
+    if isinstance(fn, Expr.Expr):
+      try:
+        exprParams = list(params)
+        sql = toSql(fn, self.column, self.columnKind, exprParams)
+        params[:] = exprParams
+        return sql
+      except NotTranslatable:
+        fnColInputs = fn.columns()
+        fn = fn.compileRow(fnColInputs)
+    Relation.compileProjection(self.cols, fnColInputs) # check the inputs exist
+    name = self.db.addFunction(fn, len(fnColInputs))
+    return "{}({})".format(name, ", ".join(self.column(c) for c in fnColInputs))
+
+  # helper
+  # return otherRelation as a SqliteRelation of this database, copying it
+  # into the database if needed
+  def inDatabase(self, otherRelation):
+    if isinstance(otherRelation, SqliteRelation) and otherRelation.db is self.db:
+      return otherRelation
+    return SqliteRelation(otherRelation, self.db)
+
+  # helper
+  # create a SQL index on the columns keyCols (if there is none)
+  def createSqlIndex(self, keyCols):
+    if len(keyCols) > 0:
+      name = "{}_{}".format(self.table, "_".join(self.column(c) for c in keyCols))
+      self.db.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+          quote(name), quote(self.table), ", ".join(self.column(c) for c in keyCols)))
+
+  def project(self, projectCols):
+    assert isinstance(projectCols, tuple), "Projection Fields must be a tuple"
+    sortedOn = self.sortedOn
+    self.replaceTable(projectCols, self.selectSql(projectCols))
+    self.keepSorted(sortedOn)
+
+  # python functions are wrapped in bool(), SQL only keeps rows with a
+  # non-zero number
+  def select(self, selectFn, selectFnColInputs=None):
+    sortedOn = self.sortedOn
+    if not isinstance(selectFn, Expr.Expr):
+      fn = selectFn
+      selectFn = lambda vals: bool(fn(vals))
+    params = []
+    where = self.valueSql(selectFn, selectFnColInputs, params)
+    self.replaceTable(self.cols, self.selectSql(self.cols, where), params)
+    self.keepSorted(sortedOn)
+
+  def generateCol(self, colName, generateFn, generateFnColInputs=None):
+    sortedOn = self.sortedOn
+    params = []
+    value = self.valueSql(generateFn, generateFnColInputs, params)
+    select = "SELECT {}, {} FROM {} ORDER BY rowid".format(
+        selectList([self.column(c) for c in self.cols]), value, quote(self.table))
+    if len(self.cols) == 0:
+      select = "SELECT {} FROM {} ORDER BY rowid".format(value, quote(self.table))
+    self.replaceTable(self.cols + (colName,), select, params)
+    self.keepSorted(sortedOn)
+
+  # castDict is a dict of {column name -> cast function}
+  def cast(self, castDict):
+    values = []
+    for c in self.cols:
+      if c in castDict:
+        castRow = Relation.compileCast((c,), {c: castDict[c]})
+        values.append(self.valueSql(lambda vals, castRow=castRow: castRow(vals)[0], (c,), []))
+      else:
+        values.append(self.column(c))
+    self.replaceTable(self.cols, "SELECT {} FROM {} ORDER BY rowid".format(selectList(values), quote(self.table)))
+
+  # filterDict is dict of {column name -> bool function (true to keep)}
+  # or a boolean Expr
+  def filter(self, filterDict):
+    if isinstance(filterDict, Expr.Expr):
+      self.select(filterDict)
+      return
+    filterCols = tuple(c for c in self.cols if c in filterDict)
+    if len(filterCols) > 0:
+      self.select(Relation.compileFilter(filterCols, filterDict), filterCols)
+
+  # left join inside the database, see Relation.leftHashJoin
+  # otherRelation is copied into the database if it is not in it, and gets
+  # an index on joinIndex
+  def leftHashJoin(self, otherRelation, joinIndex, inner=True):
+    sortedOn = self.sortedOn
+    other = self.inDatabase(otherRelation)
+    (myNonIndex, otherNonIndex) = Relation.joinNonIndexCols(self.cols, other.cols, joinIndex)
+    other.createSqlIndex(joinIndex)
+    values = [self.column(c, 'l') for c in joinIndex + myNonIndex] + [other.column(c, 'r') for c in otherNonIndex]
+    on = " AND ".join("{} IS {}".format(self.column(c, 'l'), other.column(c, 'r')) for c in joinIndex)
+    select = "SELECT {} FROM {} AS l {}JOIN {} AS r ON {} ORDER BY l.rowid, r.rowid".format(
+        selectList(values), quote(self.table), "" if inner else "LEFT ", quote(other.table), on if len(on) > 0 else "1")
+    self.replaceTable(joinIndex + myNonIndex + otherNonIndex, select)
+    self.keepSorted(sortedOn) # left rows keep their order
+
+  # return True if the relation contains duplicate rows based off the columns in keyCols
+  def hasDuplicates(self, keyCols):
+    duplicate = self.db.execute("SELECT 1 FROM {} GROUP BY {} HAVING COUNT(*) > 1 LIMIT 1".format(
+        quote(self.table), self.groupSql(keyCols))).fetchone()
+    return duplicate != None
+
+  # return True if the relations contain the same set of keys based off keyCols
+  # if doAssert then die if not a match
+  def keysMatch(self, otherRelation, keyCols, **kwargs):
+    other = self.inDatabase(otherRelation)
+    leftOnly = self.keysNotIn(other, keyCols)
+    rightOnly = other.keysNotIn(self, keyCols)
+    if 'doAssert' in kwargs and kwargs['doAssert']:
+      assert len(leftOnly) == 0 and len(rightOnly) == 0, "keys mismatched\nIn left but not right:\n{!r}\nIn right but not left:\n{!r}".format(leftOnly, rightOnly)
+    return len(leftOnly) == 0 and len(rightOnly) == 0
+
+  # helper
+  # the set of keyCols values of this relation that other (of the same
+  # database) doesn't have
+  def keysNotIn(self, other, keyCols):
+    select = "SELECT {} FROM {} EXCEPT SELECT {} FROM {}".format(
+        selectList([self.column(c) for c in keyCols]), quote(self.table),
+        selectList([other.column(c) for c in keyCols]), quote(other.table))
+    return set(row[:len(keyCols)] for row in self.db.execute(select))
+
+  # helper
+  # the SQL grouping rows by keyCols (all rows are one group without keys)
+  def groupSql(self, keyCols):
+    return ", ".join(self.column(c) for c in keyCols) if len(keyCols) > 0 else "''"
+
+  # keep only the rows whose keyCols values equal the tuple key
+  def selectEquals(self, keyCols, key):
+    if not all(isSqlValue(val) for val in key):
+      Relation.selectEquals(self, keyCols, key)
+      return
+    if len(keyCols) > 0:
+      where = " AND ".join("{} IS ?".format(self.column(c)) for c in keyCols)
+      self.replaceTable(self.cols, self.selectSql(self.cols, where), tuple(key))
+
+  # semi and anti join inside the database, see Relation.semiJoin
+  # bloomBits is not needed: the database finds the keys in an index
+  def selectKeys(self, otherRelation, joinIndex, found, bloomBits):
+    sortedOn = self.sortedOn
+    other = self.inDatabase(otherRelation)
+    other.createSqlIndex(joinIndex)
+    on = " AND ".join("{} IS {}".format(other.column(c, 'r'), self.column(c, quote(self.table))) for c in joinIndex)
+    where = "{}EXISTS (SELECT 1 FROM {} AS r WHERE {})".format("" if found else "NOT ", quote(other.table), on if len(on) > 0 else "1")
+    self.replaceTable(self.cols, self.selectSql(self.cols, where))
+    self.keepSorted(sortedOn)
+
+  def groupBy(self, keyCols):
+    return SqliteGrouping(self, keyCols)
+
+  # helper
+  # compute the statistics of every column (see Relation.stats) in one query
+  def computeStats(self):
+    if len(self.cols) == 0:
+      return {}
+    values = []
+    for c in self.cols:
+      sql = self.column(c)
+      values += ["COUNT({})".format(sql), "MIN({})".format(sql), "MAX({})".format(sql),
+                 "SUM({})".format(sql), "COUNT(DISTINCT {})".format(sql),
+                 "SUM(typeof({}) NOT IN ('integer', 'real', 'null'))".format(sql)]
+    row = self.db.execute("SELECT {} FROM {}".format(selectList(values), quote(self.table))).fetchone()
+    catalog = {}
+    for i, c in enumerate(self.cols):
+      (count, low, high, total, distinct, notNumbers) = row[6 * i:6 * i + 6]
+      catalog[c] = {'count': count, 'min': low, 'max': high,
+                    'sum': (total if total != None else 0) if not notNumbers else None, 'distinct': distinct}
+    return catalog
+
+  # sort the rows by the values of sortCols, see Relation.sort
+  # sorted by the database, ties keep their order.  keyFns are python
+  # functions, so with keyFns the rows are sorted in python
+  def sort(self, sortCols, reverse=False, runSize=None, keyFns=None):
+    if keyFns:
+      Relation.sort(self, sortCols, reverse, runSize, keyFns)
+      return
+    Relation.compileProjection(self.cols, sortCols) # check the columns
+    order = []
+    for c in sortCols:
+      descending = reverse if isinstance(reverse, bool) else c in reverse
+      order.append(self.column(c) + (" DESC" if descending else ""))
+    self.replaceTable(self.cols, "SELECT {} FROM {} ORDER BY {}".format(
+        selectList([self.column(c) for c in self.cols]), quote(self.table), ", ".join(order + ["rowid"])))
+    if not reverse:
+      self.declareSorted(sortCols)
+
+# Grouping of a SqliteRelation
+# count, sum, min, max and mean are computed by the database, other
+# aggregates read the rows into python
+class SqliteGrouping(Grouping):
+  def agg(self, aggSpecs):
+    (outCols, aggs) = self.resolveSpecs(aggSpecs)
+    rel = self.relation
+    if not all(type(agg) in sqlAggregates for (agg, inCol) in aggs):
+      return SqliteRelation(Grouping.agg(self, aggSpecs), rel.db)
+    values = [rel.column(c) for c in self.keyCols]
+    for (agg, inCol) in aggs:
+      values.append(sqlAggregates[type(agg)].format(rel.column(inCol) if inCol != None else None))
+    # groups in the order they first appear
+    select = "SELECT {} FROM {} GROUP BY {} ORDER BY MIN(rowid)".format(
+        selectList(values), quote(rel.table), rel.groupSql(self.keyCols))
+    result = SqliteRelation(None, rel.db)
+    result.replaceTable(self.keyCols + outCols, select)
+    return result
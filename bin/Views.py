@@ -0,0 +1,110 @@
+#!/usr/bin/python
+#
+# Materialized views over relations that grow with Relation.append
+#
+# a view computes its result once, then only processes the rows appended to
+# its input relations, so appending 1% more rows costs about 1% of the work
+#   AggView: rel.groupBy(keyCols).view(aggSpecs), keeps the mergeable state
+#     (see Aggregates.py) of every aggregate of every group
+#   JoinView: rel.joinView(otherRelation, joinIndex), an inner join keeping
+#     a hash table of the rows of each side, so that rows appended to either
+#     side are joined with the rows of the other
+# view.relation() returns the current result as a new Relation
+#
+# views only follow append: other operations on an input relation (select,
+# project, ...) are not seen by its views
+#
+# ex:
+#   summary = results.groupBy(('conf', 'threads')).view((('tput', 'mean', 'tput'), ('runs', 'count', None)))
+#   results.append(newRows)
+#   print summary.relation()
+
+import collections
+
+import Relational
+
+# groupBy(keyCols).agg(aggSpecs) of relation, kept up to date
+# groups are in the order they first appear, as for Grouping.agg
+class AggView(object):
+  def __init__(self, relation, keyCols, aggSpecs):
+    (self.outCols, aggs) = relation.groupBy(keyCols).resolveSpecs(aggSpecs)
+    self.keyCols = keyCols
+    self.aggs = [agg for (agg, inCol) in aggs]
+    # the rows are projected on the key and the input columns
+    inputCols = tuple(sorted(set(inCol for (agg, inCol) in aggs if inCol != None)))
+    self.projectCols = keyCols + inputCols
+    self.projectFn = Relational.Relation.compileProjection(relation.cols, self.projectCols)
+    k = len(keyCols)
+    self.inputs = [k + inputCols.index(inCol) if inCol != None else None for (agg, inCol) in aggs]
+
+    self.states = {} # {key -> list of aggregate states}
+    self.positions = {} # {key -> position in rows}
+    self.rows = []
+    self.changed = set()
+    self.add(relation.iterProjected(self.projectCols))
+    relation.addView(lambda rows: self.add(self.projectFn(row) for row in rows))
+
+  # internal
+  # add projected rows to their groups
+  def add(self, projectedRows):
+    k = len(self.keyCols)
+    for vals in projectedRows:
+      key = vals[:k]
+      states = self.states.get(key)
+      if states == None:
+        states = self.states[key] = [agg.initial() for agg in self.aggs]
+        self.positions[key] = len(self.rows)
+        self.rows.append(None)
+      for j, (agg, i) in enumerate(zip(self.aggs, self.inputs)):
+        states[j] = agg.add(states[j], vals[i] if i != None else None)
+      self.changed.add(key)
+
+  # return the aggregates of every group as a new Relation
+  # only the groups that changed since the last call are computed again
+  def relation(self):
+    for key in self.changed:
+      self.rows[self.positions[key]] = key + tuple(agg.result(state) for agg, state in zip(self.aggs, self.states[key]))
+    self.changed = set()
+    return Relational.Relation((self.keyCols + self.outCols, self.rows))
+
+# inner join of relation and otherRelation on joinIndex, kept up to date
+# the columns are those of relation.leftHashJoin(otherRelation, joinIndex).
+# The rows start in the order of leftHashJoin, rows joined from appended
+# rows come after them
+class JoinView(object):
+  def __init__(self, relation, otherRelation, joinIndex):
+    nonIndexCols = Relational.Relation.joinNonIndexCols(relation.cols, otherRelation.cols, joinIndex)
+    self.cols = joinIndex + nonIndexCols[0] + nonIndexCols[1]
+    self.joinIndex = joinIndex
+    # {key -> list of non index values} of each side
+    self.tables = (collections.defaultdict(list), collections.defaultdict(list))
+    self.rows = []
+    projectCols = [joinIndex + cols for cols in nonIndexCols]
+    # fill the other side first, so that the first rows come in the order
+    # of relation
+    self.add(1, otherRelation.iterProjected(projectCols[1]))
+    self.add(0, relation.iterProjected(projectCols[0]))
+    for side, rel in enumerate((relation, otherRelation)):
+      projectFn = Relational.Relation.compileProjection(rel.cols, projectCols[side])
+      rel.addView(lambda rows, side=side, projectFn=projectFn: self.add(side, map(projectFn, rows)))
+
+  # internal
+  # add projected rows (key + non index values) to side (0 for relation, 1
+  # for otherRelation) and join them with the rows of the other side
+  def add(self, side, projectedRows):
+    k = len(self.joinIndex)
+    table = self.tables[side]
+    otherTable = self.tables[1 - side]
+    for vals in projectedRows:
+      key = vals[:k]
+      vals = vals[k:]
+      table[key].append(vals)
+      matches = otherTable.get(key, ())
+      if side == 0:
+        self.rows.extend([key + vals + otherVals for otherVals in matches])
+      else:
+        self.rows.extend([key + myVals + vals for myVals in matches])
+
+  # return the joined rows as a new Relation
+  def relation(self):
+    return Relational.Relation((self.cols, self.rows))
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+#
+# Window functions for Relation.window(partitionCols, orderCols, specs)
+#
+# a window function computes one value per row from the rows of its
+# partition, in the order of orderCols.  Every window function can:
+#   compute(vals, keys): vals is the list of input values of one partition
+#     in order, keys the list of their order keys.  returns a list of outputs
+#   computeSegments(vals, starts, counts, newKeys): vals is a numpy array of
+#     the input values sorted by partition and order, partition i is
+#     vals[starts[i]:starts[i]+counts[i]].  newKeys is True for the rows whose
+#     order key differs from the previous row of the partition.  returns the
+#     outputs in the same order (used by ColumnarRelation)
+#
+# window functions are given by name ('cumsum', 'rank', 'rowNumber',
+# 'percent') or as a WindowFn object (e.g. Lag(1), RollingMean(10))
+
+import Aggregates
+
+try:
+  import numpy as np
+except ImportError: # only needed by ColumnarRelation
+  np = None
+
+class WindowFn(object):
+  # False for functions of the order alone (no input column)
+  needsInput = True
+
+  # default: compute each partition separately
+  def computeSegments(self, vals, starts, counts, newKeys):
+    out = []
+    for start, count in zip(starts.tolist(), counts.tolist()):
+      segVals = vals[start:start + count].tolist() if vals is not None else [None] * count
+      keys = np.cumsum(newKeys[start:start + count]).tolist() # equal keys get equal numbers
+      out.extend(self.compute(segVals, keys))
+    return out
+
+# window values RollingPercentile.computeSegments holds at once
+windowBlockValues = 1 << 20
+
+# the first row of the partition of every row
+def segmentStarts(starts, counts):
+  return np.repeat(starts, counts)
+
+# running total
+class CumSum(WindowFn):
+  def compute(self, vals, keys):
+    out = []
+    total = 0
+    for val in vals:
+      total += val
+      out.append(total)
+    return out
+  def computeSegments(self, vals, starts, counts, newKeys):
+    sums = np.cumsum(vals)
+    return sums - segmentStarts(sums[starts] - vals[starts], counts)
+
+# 1, 2, 3, ... in order
+class RowNumber(WindowFn):
+  needsInput = False
+  def compute(self, vals, keys):
+    return range(1, len(keys) + 1)
+  def computeSegments(self, vals, starts, counts, newKeys):
+    return np.arange(len(newKeys)) - segmentStarts(starts, counts) + 1
+
+# 1 + the number of rows with a smaller order key (ties share a rank)
+class Rank(WindowFn):
+  needsInput = False
+  def compute(self, vals, keys):
+    out = []
+    for i, key in enumerate(keys):
+      out.append(out[-1] if i > 0 and key == keys[i - 1] else i + 1)
+    return out
+  def computeSegments(self, vals, starts, counts, newKeys):
+    idx = np.arange(len(newKeys))
+    tieStarts = np.maximum.accumulate(np.where(newKeys, idx, 0))
+    return tieStarts - segmentStarts(starts, counts) + 1
+
+# percentage of the partition's total (0 if the total is 0)
+class Percent(WindowFn):
+  def compute(self, vals, keys):
+    total = sum(vals)
+    return [val * 100.0 / total if total != 0 else 0 for val in vals]
+  def computeSegments(self, vals, starts, counts, newKeys):
+    totals = segmentStarts(np.add.reduceat(vals, starts), counts)
+    with np.errstate(divide='ignore', invalid='ignore'):
+      return np.where(totals != 0, vals * 100.0 / totals, 0)
+
+# value n rows before (Lag) or after (Lead) in the partition, None if there
+# is no such row
+class Lag(WindowFn):
+  def __init__(self, n=1):
+    assert n >= 0, "offset must not be negative"
+    self.n = n
+  def compute(self, vals, keys):
+    return [vals[i - self.n] if i >= self.n else None for i in range(len(vals))]
+  def computeSegments(self, vals, starts, counts, newKeys):
+    idx = np.arange(len(vals)) - self.n
+    return shifted(vals, idx, idx >= segmentStarts(starts, counts))
+
+class Lead(WindowFn):
+  def __init__(self, n=1):
+    assert n >= 0, "offset must not be negative"
+    self.n = n
+  def compute(self, vals, keys):
+    return [vals[i + self.n] if i + self.n < len(vals) else None for i in range(len(vals))]
+  def computeSegments(self, vals, starts, counts, newKeys):
+    idx = np.arange(len(vals)) + self.n
+    return shifted(vals, idx, idx < segmentStarts(starts + counts, counts))
+
+# internal
+# vals[idx] where valid, None elsewhere
+def shifted(vals, idx, valid):
+  if valid.all():
+    return vals[idx]
+  out = np.empty(len(vals), dtype=object)
+  out[valid] = vals[idx[valid]].tolist()
+  return out
+
+# mean of the last size rows up to and including each row
+# (fewer at the start of a partition)
+class RollingMean(WindowFn):
+  def __init__(self, size):
+    assert size > 0, "window size must be positive"
+    self.size = size
+  def compute(self, vals, keys):
+    out = []
+    total = 0.0
+    for i, val in enumerate(vals):
+      total += val
+      if i >= self.size:
+        total -= vals[i - self.size]
+      out.append(total / min(i + 1, self.size))
+    return out
+  def computeSegments(self, vals, starts, counts, newKeys):
+    sums = np.concatenate(([0.0], np.cumsum(vals, dtype=np.float64)))
+    idx = np.arange(len(vals))
+    lo = np.maximum(idx - self.size + 1, segmentStarts(starts, counts))
+    return (sums[idx + 1] - sums[lo]) / (idx + 1 - lo)
+
+# percentile p (0-100) of the last size rows up to and including each row,
+# interpolated like Aggregates.Percentile.  The columnar version builds the
+# windows (a row of size values per row) for blocks of rows, so that it holds
+# about windowBlockValues values at once
+class RollingPercentile(WindowFn):
+  def __init__(self, size, p):
+    assert size > 0, "window size must be positive"
+    self.size = size
+    self.percentile = Aggregates.Percentile(p)
+  def compute(self, vals, keys):
+    return [self.percentile.reduce(vals[max(i - self.size + 1, 0):i + 1]) for i in range(len(vals))]
+  def computeSegments(self, vals, starts, counts, newKeys):
+    if len(vals) == 0:
+      return np.empty(0, dtype=np.float64)
+    vals = vals.astype(np.float64)
+    rowStarts = segmentStarts(starts, counts)
+    offsets = np.arange(self.size)[np.newaxis, :]
+    blockRows = max(windowBlockValues // self.size, 1)
+    out = np.empty(len(vals), dtype=np.float64)
+    for start in range(0, len(vals), blockRows):
+      stop = min(start + blockRows, len(vals))
+      idx = np.arange(start, stop)[:, np.newaxis] - offsets
+      valid = idx >= rowStarts[start:stop, np.newaxis]
+      windows = np.where(valid, vals[np.maximum(idx, 0)], np.nan)
+      out[start:stop] = np.nanpercentile(windows, self.percentile.p, axis=1)
+    return out
+
+windowFns = {
+  'cumsum'    : CumSum(),
+  'rank'      : Rank(),
+  'rowNumber' : RowNumber(),
+  'percent'   : Percent(),
+}
+
+# return the WindowFn for a name or a WindowFn object
+def getWindowFn(fn):
+  if isinstance(fn, WindowFn):
+    return fn
+  assert fn in windowFns, "unknown window function {!r}, use one of {!r} or a WindowFn".format(fn, sorted(windowFns.keys()))
+  return windowFns[fn]
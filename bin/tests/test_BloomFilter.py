@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+# Tests of BloomFilter and of the semi and anti joins using it: a join with
+# a Bloom filter of any size must keep the rows of the exact join of a
+# Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+from SqliteRelation import SqliteRelation
+import BloomFilter
+
+cols = ('conf', 'threads', 'tput')
+rows = [('c{}'.format(i % 13), i % 4, i * 0.5) for i in range(100)] + [(None, 1, 0.0), ('c1', None, 1.0)]
+otherCols = ('threads', 'conf', 'lat')
+otherRows = [(i % 3, 'c{}'.format(i % 7), i) for i in range(40)] + [(1, None, 5)]
+
+class BloomFilterTest(unittest.TestCase):
+  def testNoFalseNegatives(self):
+    bloom = BloomFilter.forItems(1 << 12, 500)
+    items = [('conf', i) for i in range(500)] + ['x{}'.format(i) for i in range(100)]
+    for item in items:
+      bloom.add(item)
+    self.assertTrue(all(item in bloom for item in items))
+
+  def testFalsePositiveRate(self):
+    # 10 bits per item: about 1% false positives with the best number of hashes
+    bloom = BloomFilter.forItems(10000, 1000)
+    self.assertEqual(bloom.numHashes, 7)
+    for i in range(1000):
+      bloom.add(i)
+    falsePositives = sum(1 for i in range(1000, 21000) if i in bloom)
+    self.assertTrue(falsePositives < 20000 * 0.02, falsePositives)
+
+  def testTinyFilter(self):
+    bloom = BloomFilter.BloomFilter(1, 3)
+    bloom.add('a')
+    self.assertTrue('b' in bloom)
+    self.assertTrue('b' not in BloomFilter.BloomFilter(1, 3))
+
+class SemiJoinTest(unittest.TestCase):
+  # helper
+  # check that ops(rel, other) leaves the same rows in every backend, with
+  # and without a Bloom filter of bloomBits, as in a Relation without one
+  def assertSameJoin(self, joinIndex, found, bloomBits=(None, 1, 64, 1 << 16)):
+    expected = Relation((cols, list(rows)))
+    other = Relation((otherCols, list(otherRows)))
+    keys = set(other.iterProjected(joinIndex))
+    expected.select(lambda key: (key in keys) == found, joinIndex)
+    for backend in (Relation, ColumnarRelation, LazyRelation, SqliteRelation):
+      for bits in bloomBits:
+        rel = backend(Relation((cols, list(rows))))
+        (rel.semiJoin if found else rel.antiJoin)(other, joinIndex, bits)
+        self.assertEqual(rel.rows, expected.rows, (backend.__name__, bits))
+    return expected.rows
+
+  def testSemiJoin(self):
+    result = self.assertSameJoin(('conf',), True)
+    self.assertEqual(set(row[0] for row in result), set(['c{}'.format(i) for i in range(7)] + [None]))
+    self.assertSameJoin(('conf', 'threads'), True)
+
+  def testAntiJoin(self):
+    result = self.assertSameJoin(('conf',), False)
+    self.assertEqual(set(row[0] for row in result), set('c{}'.format(i) for i in range(7, 13)))
+    self.assertSameJoin(('threads', 'conf'), False)
+
+  def testIndexedOther(self):
+    other = Relation((otherCols, list(otherRows)))
+    other.createIndex(('conf',))
+    expected = Relation((cols, list(rows)))
+    expected.semiJoin(Relation((otherCols, list(otherRows))), ('conf',))
+    for backend in (Relation, ColumnarRelation):
+      rel = backend(Relation((cols, list(rows))))
+      rel.semiJoin(other, ('conf',), 64)
+      self.assertEqual(rel.rows, expected.rows, backend.__name__)
+
+if __name__ == '__main__':
+  unittest.main()
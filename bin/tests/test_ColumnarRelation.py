@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Tests of ColumnarRelation: operations must give the rows (and report the
+# errors) of the same operations on a Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import math
+import os.path
+import StringIO
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+
+# rows comparable with ==, NaN replaced by a string
+def comparable(rows):
+  return [tuple('nan' if isinstance(v, float) and math.isnan(v) else v for v in row) for row in rows]
+
+class CastTest(unittest.TestCase):
+  # helper
+  # cast rows with castDict on a Relation and a ColumnarRelation (also
+  # dictionary encoded), check they give the same rows and report the same
+  # errors, return the rows
+  def assertSameCast(self, cols, rows, castDict):
+    results = []
+    for rel in (Relation((cols, list(rows))), ColumnarRelation((cols, list(rows))), ColumnarRelation((cols, list(rows)))):
+      if len(results) == 2:
+        rel.encode(cols)
+      out = StringIO.StringIO()
+      (stdout, sys.stdout) = (sys.stdout, out)
+      try:
+        rel.cast(castDict)
+      finally:
+        sys.stdout = stdout
+      results.append((comparable(rel.rows), out.getvalue().count("error casting")))
+    self.assertEqual(results[1], results[0])
+    self.assertEqual(results[2], results[0])
+    return results[0]
+
+  def testFloatKeepsNone(self):
+    (rows, errors) = self.assertSameCast(('x',), [(1,), (None,), (3,)], {'x': float})
+    self.assertEqual(rows, [(1.0,), (None,), (3.0,)])
+    self.assertEqual(errors, 1)
+
+  def testIntOfNanAndInf(self):
+    (rows, errors) = self.assertSameCast(('x',), [(1.5,), (float('nan'),), (float('inf'),)], {'x': int})
+    self.assertEqual(rows, [(1,), ('nan',), (float('inf'),)])
+    self.assertEqual(errors, 2)
+
+  def testIntOfHugeFloat(self):
+    (rows, errors) = self.assertSameCast(('x',), [(1e20,), (2.0,)], {'x': int})
+    self.assertEqual(rows, [(10 ** 20,), (2,)])
+
+  def testNumbers(self):
+    (rows, errors) = self.assertSameCast(('x', 'y'), [(1, 2.7), (2, -2.7)], {'x': float, 'y': int})
+    self.assertEqual(rows, [(1.0, 2), (2.0, -2)])
+    self.assertEqual(errors, 0)
+
+  def testStrings(self):
+    (rows, errors) = self.assertSameCast(('x',), [('1',), ('x',)], {'x': int})
+    self.assertEqual(rows, [(1,), ('x',)])
+    self.assertEqual(errors, 1)
+
+class RowsTest(unittest.TestCase):
+  def testEncodedRows(self):
+    rows = [('a', 1), ('b', 2), ('a', None)]
+    rel = ColumnarRelation((('s', 'n'), list(rows)))
+    rel.encode(('s',))
+    self.assertEqual(rel.rows, Relation((('s', 'n'), list(rows))).rows)
+
+  def testNoColumns(self):
+    rel = ColumnarRelation((('s',), [('a',), ('b',)]))
+    rel.project(())
+    self.assertEqual(rel.rows, [(), ()])
+
+class SortedOnTest(unittest.TestCase):
+  cols = ('k', 'v', 'w')
+  rows = [(1, 'a', 1.5), (2, 'b', -1.0), (2, 'c', 3.0), (5, 'd', 0.5)]
+
+  # helper
+  # apply op to a Relation and a ColumnarRelation declared sorted on k,
+  # check they give the same rows and both still know they are sorted
+  def assertKeepsSorted(self, op):
+    results = []
+    for rel in (Relation((self.cols, list(self.rows))), ColumnarRelation((self.cols, list(self.rows)))):
+      rel.declareSorted(('k',))
+      op(rel)
+      self.assertEqual(rel.sortedOn, ('k',))
+      results.append(rel.rows)
+    self.assertEqual(results[1], results[0])
+
+  def testProject(self):
+    self.assertKeepsSorted(lambda rel: rel.project(('k', 'w')))
+
+  def testSelect(self):
+    self.assertKeepsSorted(lambda rel: rel.select(lambda (w,): w > 0, ('w',)))
+
+  def testFilter(self):
+    self.assertKeepsSorted(lambda rel: rel.filter({'v': lambda v: v != 'b'}))
+
+  def testJoin(self):
+    other = Relation((('k', 'x'), [(2, 'two'), (5, 'five'), (5, 'cinq')]))
+    self.assertKeepsSorted(lambda rel: rel.leftHashJoin(other, ('k',), inner=False))
+
+  def testProjectDropsSortColumn(self):
+    rel = ColumnarRelation((self.cols, list(self.rows)))
+    rel.declareSorted(('k',))
+    rel.project(('v',))
+    self.assertEqual(rel.sortedOn, None)
+
+if __name__ == '__main__':
+  unittest.main()
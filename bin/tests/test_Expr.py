@@ -0,0 +1,46 @@
+#!/usr/bin/python
+#
+# Tests of Expr: an expression must select the same rows on every kind of
+# relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+from SqliteRelation import SqliteRelation
+from Expr import col
+
+relationTypes = (Relation, ColumnarRelation, LazyRelation, SqliteRelation)
+
+class ExprTest(unittest.TestCase):
+  # helper
+  # check that select(expr) keeps the rows expected on every kind of relation
+  def assertSelects(self, cols, rows, expr, expected):
+    for relationType in relationTypes:
+      rel = relationType((cols, list(rows)))
+      rel.select(expr)
+      self.assertEqual(rel.rows, expected, "{}: {!r}".format(relationType.__name__, rel.rows))
+
+  def testIsInMixedTypes(self):
+    rows = [(1,), (2,), (3,)]
+    self.assertSelects(('x',), rows, col('x').isin(['1', 2]), [(2,)])
+    self.assertSelects(('x',), rows, col('x').isin(['1', '2']), [])
+    self.assertSelects(('x',), rows, col('x').isin([1.0, 3]), [(1,), (3,)])
+
+  def testIsInStrings(self):
+    rows = [('1',), ('a',), ('b',)]
+    self.assertSelects(('x',), rows, col('x').isin([1, 'a']), [('a',)])
+
+  def testIsInFloats(self):
+    rows = [(1.5,), (2.0,)]
+    self.assertSelects(('x',), rows, col('x').isin([2, '1.5']), [(2.0,)])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+#
+# Tests of ExternalSort: rows sorted in spilled runs must come back in the
+# order sorted() gives, and a sort with a runSize must give the rows of the
+# same sort of a Relation in memory
+#
+# run from bin: python -m unittest discover -s tests
+
+import operator
+import os
+import os.path
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+from SqliteRelation import SqliteRelation
+import ExternalSort
+
+cols = ('conf', 'threads', 'tput')
+rand = random.Random(1)
+rows = [(rand.choice('abcd'), rand.randint(1, 8), i) for i in range(200)]
+
+class ExternalSortTest(unittest.TestCase):
+  def setUp(self):
+    self.dirName = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dirName)
+
+  # helper
+  # sort rows with externalSort spilling into the test directory, check it
+  # gives the rows of sorted() (ties in their order), return the result
+  def assertSorted(self, runSize, key=None, reverse=False):
+    result = ExternalSort.externalSort(iter(rows), key, reverse, runSize, self.dirName)
+    self.assertEqual(len(result), len(rows))
+    self.assertEqual(list(result), sorted(rows, key=key, reverse=reverse))
+    return result
+
+  def testRunSizes(self):
+    key = operator.itemgetter(0, 1)
+    for runSize in (1, 7, 100, 199, 200, 201, 1000):
+      for reverse in (False, True):
+        self.assertSorted(runSize, key, reverse)
+
+  def testInMemory(self):
+    self.assertTrue(isinstance(self.assertSorted(len(rows) + 1), list))
+    self.assertEqual(os.listdir(self.dirName), [])
+
+  def testRunFiles(self):
+    result = self.assertSorted(30, operator.itemgetter(1))
+    self.assertTrue(isinstance(result, ExternalSort.SortedRuns))
+    self.assertEqual(len(os.listdir(self.dirName)), 7)
+    self.assertEqual(list(result), sorted(rows, key=operator.itemgetter(1))) # merged again
+    result.close()
+    self.assertEqual(os.listdir(self.dirName), [])
+
+  def testEmpty(self):
+    self.assertEqual(ExternalSort.externalSort(iter([]), runSize=10, tempDir=self.dirName), [])
+
+  def testErrorRemovesRuns(self):
+    def failingRows():
+      for row in rows[:50]:
+        yield row
+      raise ValueError("bad row")
+    self.assertRaises(ValueError, ExternalSort.externalSort, failingRows(), None, False, 10, self.dirName)
+    self.assertEqual(os.listdir(self.dirName), [])
+
+  def testDrainList(self):
+    items = list(rows)
+    drained = []
+    for item in ExternalSort.drainList(items):
+      drained.append(item)
+      self.assertEqual(len(items) + len(drained), len(rows))
+    self.assertEqual(drained, rows)
+    self.assertEqual(items, [])
+
+class RelationSortTest(unittest.TestCase):
+  # helper
+  # check that sort(sortCols, reverse, runSize, keyFns) on every backend
+  # gives the rows of the same sort of a Relation in memory
+  def assertSameSort(self, sortCols, reverse=False, keyFns=None):
+    expected = Relation((cols, list(rows)))
+    expected.sort(sortCols, reverse, keyFns=keyFns)
+    for backend in (Relation, ColumnarRelation, LazyRelation, SqliteRelation):
+      for runSize in (None, 1, 17, 1000):
+        rel = backend(Relation((cols, list(rows))))
+        rel.sort(sortCols, reverse, runSize, keyFns)
+        self.assertEqual(rel.rows, expected.rows, (backend.__name__, runSize))
+    return expected.rows
+
+  def testSort(self):
+    result = self.assertSameSort(('conf', 'threads'))
+    self.assertEqual(result, sorted(rows, key=operator.itemgetter(0, 1)))
+    self.assertSameSort(('threads',), reverse=True)
+    self.assertSameSort(('conf', 'threads'), reverse=('threads',))
+
+  def testKeyFns(self):
+    order = ['c', 'a', 'd', 'b']
+    result = self.assertSameSort(('conf', 'threads'), keyFns={'conf': order.index})
+    self.assertEqual([row[0] for row in result], sorted([row[0] for row in rows], key=order.index))
+
+  def testSortedRows(self):
+    rel = Relation((cols, list(rows)))
+    expected = Relation((cols, list(rows)))
+    expected.sort(('threads', 'conf'), reverse=('conf',))
+    for runSize in (13, 1000):
+      sortedRows = rel.sortedRows(('threads', 'conf'), reverse=('conf',), runSize=runSize)
+      self.assertEqual(list(sortedRows), expected.rows)
+    self.assertEqual(rel.rows, rows)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+#
+# Tests of LazyRelation: the optimized plan must return the rows of the
+# same operations run eagerly on a Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from LazyRelation import LazyRelation
+
+cols = ('v', 'w')
+rows = [(None, 1), (3, 2), (1, 3), (4, 4)]
+
+class LazyRelationTest(unittest.TestCase):
+  # helper
+  # check that ops(rel) gives the same rows on a Relation and a LazyRelation
+  def assertSameRows(self, ops):
+    eager = Relation((cols, list(rows)))
+    lazy = LazyRelation(Relation((cols, list(rows))))
+    ops(eager)
+    ops(lazy)
+    self.assertEqual(lazy.cols, eager.cols)
+    self.assertEqual(lazy.rows, eager.rows)
+
+  def testChainedSelects(self):
+    def ops(rel):
+      rel.select(lambda (v,): v is not None, ('v',))
+      rel.select(lambda (v,): v * 2 > 5, ('v',))
+    self.assertSameRows(ops)
+
+  def testChainedSelectsAcrossGenerate(self):
+    def ops(rel):
+      rel.select(lambda (v,): v is not None, ('v',))
+      rel.generateCol('z', lambda (w,): w * 2, ('w',))
+      rel.select(lambda (v,): v * 2 > 5, ('v',))
+    self.assertSameRows(ops)
+
+  def testFilterThenSelect(self):
+    def ops(rel):
+      rel.filter({'v': lambda v: v is not None})
+      rel.select(lambda (v, w): v + w > 5, ('v', 'w'))
+    self.assertSameRows(ops)
+
+  def testSelectBelowJoin(self):
+    other = Relation((('w', 'x'), [(1, 'a'), (2, 'b'), (4, 'd')]))
+    def ops(rel):
+      rel.leftHashJoin(other, ('w',))
+      rel.select(lambda (v,): v is not None, ('v',))
+      rel.select(lambda (v,): v > 2, ('v',))
+    self.assertSameRows(ops)
+
+if __name__ == '__main__':
+  unittest.main()
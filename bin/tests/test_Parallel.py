@@ -0,0 +1,79 @@
+#!/usr/bin/python
+#
+# Tests of Parallel: operations run in a pool of processes must give the
+# rows, in order, of the same operations run in one process on a Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os
+import os.path
+import StringIO
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from Expr import col
+import Parallel
+
+cols = ('i', 'name', 'val')
+rows = [(i, 'n{}'.format(i % 5), str(i * 1.5) if i % 11 else 'bad') for i in range(100)]
+
+class MapRangesTest(unittest.TestCase):
+  def testRangesInOrder(self):
+    results = Parallel.mapRanges(lambda start, stop: (start, stop, os.getpid()), 100, 3, 7)
+    self.assertEqual([(start, stop) for (start, stop, pid) in results], [(s, min(s + 7, 100)) for s in range(0, 100, 7)])
+    self.assertTrue(os.getpid() not in [pid for (start, stop, pid) in results])
+
+  def testOneProcess(self):
+    self.assertEqual(Parallel.mapRanges(lambda start, stop: (start, stop, os.getpid()), 100, 1, 7), [(0, 100, os.getpid())])
+
+class ParallelOperationsTest(unittest.TestCase):
+  # helper
+  # check that ops(rel) leaves the same rows in a Relation run in one
+  # process and in a Relation and a ColumnarRelation run in 3 processes
+  def assertSameRows(self, ops):
+    expected = Relation((cols, list(rows)))
+    ops(expected)
+    for rel in (Relation((cols, list(rows))), ColumnarRelation((cols, list(rows)))):
+      rel.setProcesses(3, chunkSize=7)
+      ops(rel)
+      self.assertEqual(rel.cols, expected.cols, type(rel).__name__)
+      self.assertEqual(rel.rows, expected.rows, type(rel).__name__)
+    return expected.rows
+
+  # helper
+  # run ops with the errors printed by cast and filter hidden
+  def quietly(self, ops):
+    def quietOps(rel):
+      (stdout, sys.stdout) = (sys.stdout, StringIO.StringIO())
+      try:
+        ops(rel)
+      finally:
+        sys.stdout = stdout
+    return quietOps
+
+  def testCast(self):
+    result = self.assertSameRows(self.quietly(lambda rel: rel.cast({'val': float})))
+    self.assertEqual(result[11], (11, 'n1', 'bad'))
+
+  def testFilter(self):
+    self.assertSameRows(self.quietly(lambda rel: rel.filter({'val': lambda v: float(v) > 30})))
+
+  def testSelect(self):
+    self.assertSameRows(lambda rel: rel.select(lambda (i, name): i % 3 == 0 and name != 'n0', ('i', 'name')))
+    self.assertSameRows(lambda rel: rel.select(col('i') % 4 == 1))
+
+  def testGenerateCol(self):
+    result = self.assertSameRows(lambda rel: rel.generateCol('double', lambda (i,): i * 2, ('i',)))
+    self.assertEqual([row[-1] for row in result], range(0, 200, 2))
+
+  def testSplitAndGenerateCols(self):
+    def split(row, (i,)):
+      return [(i, j) for j in range(i % 3)]
+    self.assertSameRows(lambda rel: rel.splitAndGenerateCols(('k', 'j'), split, ('i',)))
+
+if __name__ == '__main__':
+  unittest.main()
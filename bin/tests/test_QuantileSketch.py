@@ -0,0 +1,106 @@
+#!/usr/bin/python
+#
+# Tests of QuantileSketch: every estimate must be within the relative error
+# of the exact value of its rank, and merged sketches must estimate as the
+# sketch of all the values
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+import Aggregates
+import QuantileSketch
+
+rand = random.Random(1)
+latencies = [rand.lognormvariate(8, 2) for i in range(5000)]
+mixed = [rand.gauss(0, 100) for i in range(2000)] + [0.0] * 50 + [1e-6, -1e9, 1e9]
+
+qs = (0, 0.01, 0.1, 0.25, 0.5, 0.9, 0.99, 0.999, 1)
+
+cols = ('conf', 'lat')
+rows = [('abc'[i % 3], lat) for i, lat in enumerate(latencies)]
+
+class SketchTest(unittest.TestCase):
+  # helper
+  # check that estimate is within relativeError of the value of rank
+  # q * (n - 1) of vals
+  def assertClose(self, estimate, vals, q, relativeError):
+    exact = sorted(vals)[int(q * (len(vals) - 1))]
+    self.assertTrue(abs(estimate - exact) <= relativeError * abs(exact) + 1e-12, (q, estimate, exact))
+
+  # helper
+  # check that every quantile of sketch is within its relative error
+  def assertWithinError(self, sketch, vals):
+    self.assertEqual(sketch.count, len(vals))
+    for q in qs:
+      self.assertClose(sketch.quantile(q), vals, q, sketch.relativeError)
+
+class QuantileSketchTest(SketchTest):
+  def testErrorBound(self):
+    for relativeError in (0.05, 0.01, 0.001):
+      for vals in (latencies, mixed):
+        sketch = QuantileSketch.QuantileSketch(relativeError)
+        for val in vals:
+          sketch.add(val)
+        self.assertWithinError(sketch, vals)
+        self.assertWithinError(QuantileSketch.QuantileSketch(relativeError).addArray(vals), vals)
+
+  def testMinMax(self):
+    sketch = QuantileSketch.QuantileSketch().addArray(mixed)
+    self.assertEqual((sketch.quantile(0), sketch.quantile(1)), (min(mixed), max(mixed)))
+
+  def testSkipsNoneAndNan(self):
+    sketch = QuantileSketch.QuantileSketch()
+    for val in (None, float('nan'), 3.0):
+      sketch.add(val)
+    sketch.addArray([float('nan'), 5.0])
+    self.assertEqual((sketch.count, sketch.min, sketch.max), (2, 3.0, 5.0))
+
+  def testEmpty(self):
+    self.assertEqual(QuantileSketch.QuantileSketch().quantile(0.5), None)
+    self.assertEqual(QuantileSketch.QuantileSketch().addArray([]).count, 0)
+
+  def testMerge(self):
+    whole = QuantileSketch.QuantileSketch(0.01).addArray(latencies)
+    parts = [QuantileSketch.QuantileSketch(0.01).addArray(latencies[start:start + 700]) for start in range(0, len(latencies), 700)]
+    merged = parts[0].copy()
+    for part in parts[1:]:
+      merged.merge(part)
+    self.assertEqual([merged.quantile(q) for q in qs], [whole.quantile(q) for q in qs])
+    self.assertEqual(parts[0].count, 700) # copy() left it alone
+    self.assertWithinError(merged, latencies)
+
+  def testMergeOtherError(self):
+    sketch = QuantileSketch.QuantileSketch(0.01)
+    self.assertRaisesRegexp(AssertionError, "can't merge", sketch.merge, QuantileSketch.QuantileSketch(0.02))
+
+class QuantileAggregateTest(SketchTest):
+  def testQuantile(self):
+    specs = (('p50', Aggregates.Quantile(50), 'lat'), ('p99', Aggregates.Quantile(99, 0.001), 'lat'))
+    expected = Relation((cols, list(rows))).groupBy(('conf',)).agg(specs)
+    result = ColumnarRelation((cols, list(rows))).groupBy(('conf',)).agg(specs)
+    self.assertEqual(result.rows, expected.rows)
+    for (conf, p50, p99) in expected.rows:
+      vals = [lat for (c, lat) in rows if c == conf]
+      self.assertClose(p50, vals, 0.5, 0.01)
+      self.assertClose(p99, vals, 0.99, 0.001)
+
+  def testSketchGroups(self):
+    chunks = [Relation((cols, rows[start:start + 1000])) for start in range(0, len(rows), 1000)]
+    sketches = QuantileSketch.sketchGroups(chunks, ('conf',), 'lat')
+    whole = QuantileSketch.sketchGroups([Relation((cols, list(rows)))], ('conf',), 'lat')
+    result = QuantileSketch.percentileRelation(sketches, ('conf',), (50, 99, 99.9))
+    self.assertEqual(result.cols, ('conf', 'p50', 'p99', 'p99.9'))
+    self.assertEqual(result.rows, QuantileSketch.percentileRelation(whole, ('conf',), (50, 99, 99.9)).rows)
+    for ((conf,), sketch) in sketches.items():
+      self.assertWithinError(sketch, [lat for (c, lat) in rows if c == conf])
+
+if __name__ == '__main__':
+  unittest.main()
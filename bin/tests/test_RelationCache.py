@@ -0,0 +1,163 @@
+#!/usr/bin/python
+#
+# Tests of RelationCache: a cached call must return the rows of the call
+# run on a Relation, and be computed again only when its fingerprint changes
+#
+# run from bin: python -m unittest discover -s tests
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+import RelationCache
+import RelationIO
+
+cols = ('conf', 'run', 'tput')
+rows = [('a', 1, 10.0), ('b', 1, 20.0), ('a', 2, 12.0), ('c', 1, 7.5), ('b', 2, 22.0)]
+
+# number of runs of each cached function
+calls = {}
+
+def summary(rel, minTput):
+  calls['summary'] = calls.get('summary', 0) + 1
+  rel = Relation((rel.cols, rel.rows))
+  rel.select(lambda (tput,): tput > minTput, ('tput',))
+  return rel.groupBy(('conf',)).agg((('tput', 'mean', 'tput'), ('runs', 'count', None)))
+
+def readSummary(results, minTput):
+  calls['readSummary'] = calls.get('readSummary', 0) + 1
+  return summary(RelationIO.readDelimited(results.fileName), minTput)
+
+# a function of n rows, the result of each n is another cache entry
+def numbers(n):
+  return Relation((('i', 'name'), [(i, 'n{}'.format(i)) for i in range(n)]))
+
+class RelationCacheTest(unittest.TestCase):
+  def setUp(self):
+    self.dirName = tempfile.mkdtemp()
+    calls.clear()
+
+  def tearDown(self):
+    shutil.rmtree(self.dirName)
+
+  # helper
+  # write rows into a tab separated file of the test directory
+  def writeResults(self, relRows, name="results.tsv"):
+    fileName = os.path.join(self.dirName, name)
+    with open(fileName, 'w') as f:
+      f.write("\t".join(cols) + "\n")
+      for row in relRows:
+        f.write("\t".join(str(v) for v in row) + "\n")
+    return fileName
+
+  # helper
+  # the result directories in the cache
+  def entries(self, cache):
+    return sorted(name for name in os.listdir(cache.dirName) if RelationCache.isFingerprint(name))
+
+  def testCall(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    expected = summary(Relation((cols, list(rows))), 10.0)
+    for i in range(2):
+      result = cache.call(summary, Relation((cols, list(rows))), 10.0)
+      self.assertTrue(isinstance(result, ColumnarRelation))
+      self.assertEqual(result.cols, expected.cols)
+      self.assertEqual(result.rows, expected.rows)
+    self.assertEqual(calls['summary'], 2) # once for expected, once cached
+
+  def testFingerprint(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    rel = Relation((cols, list(rows)))
+    key = cache.fingerprint((summary, (rel, 10.0), {}))
+    self.assertEqual(cache.fingerprint((summary, (Relation((cols, list(rows))), 10.0), {})), key)
+    self.assertNotEqual(cache.fingerprint((summary, (rel, 11.0), {})), key)
+    self.assertNotEqual(cache.fingerprint((summary, (rel, 10), {})), key)
+    self.assertNotEqual(cache.fingerprint((readSummary, (rel, 10.0), {})), key)
+    changed = Relation((cols, list(rows)))
+    changed.append([('d', 1, 1.0)])
+    self.assertNotEqual(cache.fingerprint((summary, (changed, 10.0), {})), key)
+
+  def testClosures(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    def above(limit):
+      return lambda (tput,): tput > limit
+    self.assertEqual(cache.fingerprint(above(10)), cache.fingerprint(above(10)))
+    self.assertNotEqual(cache.fingerprint(above(10)), cache.fingerprint(above(11)))
+    self.assertNotEqual(cache.fingerprint(lambda (tput,): tput > 10), cache.fingerprint(lambda (tput,): tput >= 10))
+
+  def testCollect(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    def plan(limit):
+      rel = LazyRelation(Relation((cols, list(rows))))
+      rel.select(lambda (tput,): tput > limit, ('tput',))
+      return rel
+    expected = Relation((cols, list(rows)))
+    expected.select(lambda (tput,): tput > 10.0, ('tput',))
+    self.assertEqual(cache.collect(plan(10.0)).rows, expected.rows)
+    self.assertEqual(cache.collect(plan(10.0)).rows, expected.rows)
+    self.assertEqual(len(self.entries(cache)), 1)
+    cache.collect(plan(15.0))
+    self.assertEqual(len(self.entries(cache)), 2)
+
+  def testFiles(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    fileName = self.writeResults(rows)
+    expected = summary(Relation((cols, list(rows))), 0)
+    result = cache.call(readSummary, RelationCache.File(fileName), 0)
+    self.assertEqual(result.rows, expected.rows)
+    cache.call(readSummary, RelationCache.File(fileName), 0)
+    self.assertEqual(calls['readSummary'], 1)
+
+    # new contents of another size: computed again
+    self.writeResults(rows + [('d', 1, 1.0)])
+    cache.call(readSummary, RelationCache.File(fileName), 0)
+    self.assertEqual(calls['readSummary'], 2)
+
+  def testUnchangedFilesNotRead(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    fileName = self.writeResults(rows)
+    os.utime(fileName, (1000000000, 1000000000)) # whole seconds, restored exactly
+    key = cache.fileFingerprint(fileName)
+    size = os.stat(fileName).st_size
+    # other contents of the same size and modification time are taken for
+    # the same file, also by another cache on the directory
+    self.writeResults([(conf, run, tput + 1) for (conf, run, tput) in rows])
+    os.utime(fileName, (1000000000, 1000000000))
+    self.assertEqual(os.stat(fileName).st_size, size)
+    self.assertEqual(cache.fileFingerprint(fileName), key)
+    self.assertEqual(RelationCache.RelationCache(cache.dirName).fileFingerprint(fileName), key)
+    os.utime(fileName, (1000000010, 1000000010))
+    self.assertNotEqual(cache.fileFingerprint(fileName), key)
+
+  def testEviction(self):
+    cache = RelationCache.RelationCache(os.path.join(self.dirName, "cache"))
+    cache.call(numbers, 100)
+    size = RelationCache.dirSize(os.path.join(cache.dirName, self.entries(cache)[0]))
+    cache.clear()
+    self.assertEqual(self.entries(cache), [])
+
+    # room for two results (a little larger than the first)
+    cache = RelationCache.RelationCache(cache.dirName, maxBytes=2 * size + size // 2)
+    keys = [cache.fingerprint((numbers, (100 + i,), {})) for i in range(3)]
+    cache.call(numbers, 100)
+    cache.call(numbers, 101)
+    used = os.path.getmtime(os.path.join(cache.dirName, keys[1]))
+    os.utime(os.path.join(cache.dirName, keys[0]), (used + 10, used + 10)) # 100 used last
+    cache.call(numbers, 102)
+    self.assertEqual(self.entries(cache), sorted([keys[0], keys[2]]))
+
+    # a result larger than maxBytes is kept until the next call
+    cache.maxBytes = 1
+    self.assertEqual(cache.call(numbers, 103).rows, numbers(103).rows)
+    self.assertEqual(self.entries(cache), [cache.fingerprint((numbers, (103,), {}))])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+#
+# Tests of RelationIO: the relation read from a file must not depend on
+# chunkSize or on columnar
+#
+# run from bin: python -m unittest discover -s tests
+
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import RelationIO
+
+class ReadDelimitedTest(unittest.TestCase):
+  def setUp(self):
+    self.dirName = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dirName)
+
+  # helper
+  # write text to a file of the test directory, return its name
+  def writeFile(self, text, name="in.tsv"):
+    fileName = os.path.join(self.dirName, name)
+    with open(fileName, 'w') as f:
+      f.write(text)
+    return fileName
+
+  # helper
+  # the rows read from fileName with every chunk size and in both modes
+  def readAll(self, fileName, chunkSizes=(1, 2, 3, 10)):
+    return [RelationIO.readDelimited(fileName, chunkSize=chunkSize, columnar=columnar).rows
+            for chunkSize in chunkSizes for columnar in (False, True)]
+
+  def testBlankLines(self):
+    fileName = self.writeFile("a\tb\n1\tx\n\n2\ty\n\n\n3\tz\n")
+    for rows in self.readAll(fileName):
+      self.assertEqual(rows, [(1, 'x'), (2, 'y'), (3, 'z')])
+
+  def testBlankLinesStreamed(self):
+    fileName = self.writeFile("a\tb\n1\tx\n\n\n2\ty\n")
+    chunks = list(RelationIO.readChunks(fileName, chunkSize=1))
+    self.assertEqual(sum((chunk.rows for chunk in chunks), []), [(1, 'x'), (2, 'y')])
+
+  def testPromotedKeepsText(self):
+    fileName = self.writeFile("a\tb\n007\t1.50\n8\t2\nx\ty\n")
+    for rows in self.readAll(fileName):
+      self.assertEqual(rows, [('007', '1.50'), ('8', '2'), ('x', 'y')])
+
+  def testPromotedToFloat(self):
+    fileName = self.writeFile("a\n1\n2\n2.5\n")
+    for rows in self.readAll(fileName):
+      self.assertEqual(rows, [(1.0,), (2.0,), (2.5,)])
+      self.assertEqual(map(type, rows[0]), [float])
+
+  def testPromotedAcrossFiles(self):
+    fileNames = [self.writeFile("a\n007\n", "1.tsv"), self.writeFile("a\nx\n", "2.tsv")]
+    for columnar in (False, True):
+      rel = RelationIO.readManyDelimited(fileNames, columnar=columnar)
+      self.assertEqual(rel.rows, [('007',), ('x',)])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+#
+# Tests of RelationStore: a saved and loaded relation must have the rows of
+# the Relation it was saved from, and give the same results under the
+# Relation operations
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from Expr import col
+import RelationStore
+
+cols = ('conf', 'run', 'tput', 'ok', 'note')
+rows = [('a', 1, 10.0, True, None), ('b', 1, 20.5, False, 'slow'), ('a', 2, 12.0, True, u'caf\xe9'),
+        ('c', 1, -7.5, True, 3), ('b', 2, 22.0, False, 'slow'), ('a', 3, 11.0, True, None)]
+
+class RelationStoreTest(unittest.TestCase):
+  def setUp(self):
+    self.dirName = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dirName)
+
+  # helper
+  # save a relation of relCols and relRows and load it back
+  def roundTrip(self, relCols=cols, relRows=rows, mmap=True, name="rel"):
+    dirName = os.path.join(self.dirName, name)
+    RelationStore.save(Relation((relCols, list(relRows))), dirName)
+    return RelationStore.load(dirName, mmap)
+
+  # helper
+  # check that ops(rel) leaves the same rows in a Relation and in the
+  # relation loaded from its save
+  def assertSameRows(self, ops, relCols=cols, relRows=rows):
+    (rel, loaded) = (Relation((relCols, list(relRows))), self.roundTrip(relCols, relRows))
+    ops(rel)
+    ops(loaded)
+    self.assertEqual(loaded.cols, rel.cols)
+    self.assertEqual(loaded.rows, rel.rows)
+    return rel.rows
+
+  def testRoundTrip(self):
+    for mmap in (True, False):
+      loaded = self.roundTrip(mmap=mmap, name="rel{}".format(mmap))
+      self.assertTrue(isinstance(loaded, ColumnarRelation))
+      self.assertEqual(loaded.cols, cols)
+      self.assertEqual(loaded.rows, rows)
+      self.assertEqual([type(v) for v in loaded.rows[2]], [type(v) for v in rows[2]])
+
+  def testUnhashableValues(self):
+    relRows = [(1, [1, 2]), (2, {'a': 1}), (3, (4, 5))]
+    self.assertEqual(self.roundTrip(('k', 'v'), relRows).rows, relRows)
+
+  def testEmpty(self):
+    loaded = self.roundTrip(relRows=[])
+    self.assertEqual(loaded.cols, cols)
+    self.assertEqual(loaded.rows, [])
+
+  def testSaveAgain(self):
+    RelationStore.save(Relation((cols, list(rows))), os.path.join(self.dirName, "rel"))
+    self.assertEqual(self.roundTrip(('x',), [(1,), (2,)]).rows, [(1,), (2,)])
+
+  def testSelectWithZoneMaps(self):
+    relRows = [(i % 7, i, 'k{}'.format(i % 3)) for i in range(100)]
+    for expr in (col('i') < 30, (col('i') >= 42) & (col('m') == 3), col('s') == 'k1', col('i') > 1000):
+      dirName = os.path.join(self.dirName, "zones")
+      rel = ColumnarRelation((('m', 'i', 's'), list(relRows)))
+      rel.createZoneMaps(chunkSize=8)
+      RelationStore.save(rel, dirName)
+      (expected, loaded) = (Relation((('m', 'i', 's'), list(relRows))), RelationStore.load(dirName))
+      expected.select(expr)
+      loaded.select(expr)
+      self.assertEqual(loaded.rows, expected.rows, repr(expr))
+
+  def testOperations(self):
+    other = Relation((('conf', 'threads'), [('a', 4), ('b', 8), ('c', 2)]))
+    def ops(rel):
+      rel.select(lambda (run,): run < 3, ('run',))
+      rel.leftHashJoin(other, ('conf',))
+      rel.generateCol('perThread', lambda (tput, threads): tput / threads, ('tput', 'threads'))
+      rel.project(('conf', 'run', 'perThread', 'note'))
+      rel.sort(('conf', 'run'), reverse=True)
+    self.assertSameRows(ops)
+    result = self.assertSameRows(lambda rel: rel.append([('d', 1, 1.0, False, 'new')]))
+    self.assertEqual(result[-1], ('d', 1, 1.0, False, 'new'))
+
+  def testGroupBy(self):
+    loaded = self.roundTrip()
+    result = loaded.groupBy(('conf',)).agg((('runs', 'count', None), ('tput', 'max', 'tput')))
+    expected = Relation((cols, list(rows))).groupBy(('conf',)).agg((('runs', 'count', None), ('tput', 'max', 'tput')))
+    self.assertEqual(result.rows, expected.rows)
+
+if __name__ == '__main__':
+  unittest.main()
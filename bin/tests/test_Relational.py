@@ -0,0 +1,301 @@
+#!/usr/bin/python
+#
+# Tests of the Relation operations: every backend (ColumnarRelation,
+# LazyRelation, SqliteRelation) must give the rows of a plain Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Relational
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+from SqliteRelation import SqliteRelation
+import Aggregates
+
+cols = ('conf', 'run', 'tput', 'lat')
+rows = [('a', 1, 10.0, 5), ('b', 1, 20.0, 7), ('a', 2, 12.0, 6), ('c', 1, 7.5, 3),
+        ('b', 2, 22.0, 9), ('a', 3, 11.0, 4), ('b', 3, 21.0, 8)]
+
+backends = (ColumnarRelation, LazyRelation, SqliteRelation)
+
+# a Relation of relCols and relRows, followed by one of every backend
+def allRelations(relCols=cols, relRows=rows):
+  return [Relation((relCols, list(relRows)))] + [backend(Relation((relCols, list(relRows)))) for backend in backends]
+
+# floats rounded so that sums computed in another order compare equal
+def rounded(rows):
+  return [tuple(round(v, 9) if isinstance(v, float) else v for v in row) for row in rows]
+
+class RelationTest(unittest.TestCase):
+  # helper
+  # check that fn(rel) returns a relation with the same columns and rows on
+  # a Relation of cols and relRows and on every backend, and return the rows
+  def assertSameResult(self, fn, relCols=cols, relRows=rows, sortRows=False):
+    expected = fn(Relation((relCols, list(relRows))))
+    expectedRows = sorted(expected.rows) if sortRows else expected.rows
+    for backend in backends:
+      result = fn(backend(Relation((relCols, list(relRows)))))
+      resultRows = sorted(result.rows) if sortRows else result.rows
+      self.assertEqual(result.cols, expected.cols, backend.__name__)
+      self.assertEqual(rounded(resultRows), rounded(expectedRows), backend.__name__)
+    return expectedRows
+
+  # helper
+  # check that ops(rel) leaves the same columns and rows in a Relation of
+  # cols and relRows and in every backend, and return the rows
+  def assertSameRows(self, ops, relCols=cols, relRows=rows, sortRows=False):
+    def result(rel):
+      ops(rel)
+      return rel
+    return self.assertSameResult(result, relCols, relRows, sortRows)
+
+class GroupByTest(RelationTest):
+  def testAggregates(self):
+    specs = (('runs', 'count', None), ('tput', 'mean', 'tput'), ('sd', 'stddev', 'tput'),
+             ('low', 'min', 'lat'), ('high', 'max', 'lat'), ('total', 'sum', 'lat'))
+    result = self.assertSameResult(lambda rel: rel.groupBy(('conf',)).agg(specs))
+    self.assertEqual([row[:3] for row in result], [('a', 3, 11.0), ('b', 3, 21.0), ('c', 1, 7.5)])
+    self.assertEqual([row[4:] for row in result], [(4, 6, 15), (7, 9, 24), (3, 3, 3)])
+
+  def testPercentile(self):
+    specs = (('p50', Aggregates.Percentile(50), 'tput'), ('p90', Aggregates.Percentile(90), 'tput'))
+    result = self.assertSameResult(lambda rel: rel.groupBy(('conf',)).agg(specs))
+    self.assertEqual(result[0][:2], ('a', 11.0))
+    self.assertAlmostEqual(result[0][2], 11.8)
+
+  def testSeveralKeys(self):
+    specs = (('runs', 'count', None), ('tput', 'max', 'tput'))
+    self.assertSameResult(lambda rel: rel.groupBy(('conf', 'run')).agg(specs))
+
+  def testEmpty(self):
+    result = self.assertSameResult(lambda rel: rel.groupBy(('conf',)).agg((('runs', 'count', None),)), relRows=[])
+    self.assertEqual(result, [])
+
+class IndexTest(RelationTest):
+  def testIndexPositions(self):
+    expected = {('a',): [0, 2, 5], ('b',): [1, 4, 6], ('c',): [3]}
+    for rel in allRelations():
+      self.assertEqual(rel.createIndex(('conf',)), expected, type(rel).__name__)
+      self.assertEqual(rel.getIndex(('conf',)), expected, type(rel).__name__)
+
+  def testAppendExtendsIndex(self):
+    for rel in allRelations():
+      rel.createIndex(('conf', 'run'))
+      rel.append([('c', 2, 8.0, 2), ('a', 1, 9.0, 1)])
+      index = rel.getIndex(('conf', 'run'))
+      self.assertEqual(index, Relation((rel.cols, rel.rows)).createIndex(('conf', 'run')), type(rel).__name__)
+
+  def testChangeDropsIndex(self):
+    for rel in allRelations():
+      rel.createIndex(('conf',))
+      rel.select(lambda (run,): run > 1, ('run',))
+      self.assertEqual(rel.getIndex(('conf',)), None, type(rel).__name__)
+
+  def testJoinWithIndex(self):
+    other = Relation((('conf', 'threads'), [('a', 4), ('b', 8), ('a', 16), ('d', 2)]))
+    indexed = Relation((other.cols, list(other.rows)))
+    indexed.createIndex(('conf',))
+    for inner in (True, False):
+      expected = self.assertSameRows(lambda rel: rel.leftHashJoin(other, ('conf',), inner))
+      self.assertEqual(self.assertSameRows(lambda rel: rel.leftHashJoin(indexed, ('conf',), inner)), expected)
+
+  def testKeysWithIndex(self):
+    def check(rel):
+      plain = Relation((cols, list(rows)))
+      rel.createIndex(('conf',))
+      rel.createIndex(('conf', 'run'))
+      self.assertEqual(rel.hasDuplicates(('conf',)), True)
+      self.assertEqual(rel.hasDuplicates(('conf', 'run')), False)
+      self.assertEqual(rel.keysMatch(plain, ('conf', 'run')), True)
+      plain.select(lambda (conf,): conf != 'c', ('conf',))
+      self.assertEqual(rel.keysMatch(plain, ('conf',)), False)
+    for rel in allRelations():
+      check(rel)
+
+  def testSelectEqualsWithIndex(self):
+    expected = self.assertSameRows(lambda rel: rel.selectEquals(('conf',), ('b',)))
+    def ops(rel):
+      rel.createIndex(('conf',))
+      rel.selectEquals(('conf',), ('b',))
+    self.assertEqual(self.assertSameRows(ops), expected)
+    self.assertEqual([row[1] for row in expected], [1, 2, 3])
+
+# (cols, rows) of the relations joined to (cols, rows) on joinIndex by
+# JoinManyTest
+joinIndex = ('conf', 'run')
+otherTables = [(('run', 'conf', 'cpu'), [(3, 'b', 0.3), (1, 'a', 0.1), (2, 'a', 0.2), (1, 'c', 0.4),
+                                         (2, 'b', 0.5), (3, 'a', 0.6), (1, 'b', 0.7)]),
+               (('conf', 'run', 'mem'), [(row[0], row[1], row[1] * 100) for row in rows])]
+
+class JoinManyTest(RelationTest):
+  # helper
+  # the join as a chain of leftHashJoins
+  def chainJoin(self, rel):
+    result = Relation((rel.cols, rel.rows))
+    result.project(joinIndex + tuple(c for c in rel.cols if c not in joinIndex))
+    for (otherCols, otherRows) in otherTables:
+      result.leftHashJoin(Relation((otherCols, list(otherRows))), joinIndex)
+    return result
+
+  def testSameAsChain(self):
+    expected = self.chainJoin(Relation((cols, list(rows))))
+    others = [Relation((otherCols, list(otherRows))) for (otherCols, otherRows) in otherTables]
+    result = self.assertSameResult(lambda rel: rel.joinManyOrDie(others, joinIndex))
+    self.assertEqual(result, expected.rows)
+    joined = Relational.joinDataSetsOrDie([Relation((cols, list(rows)))] + others, joinIndex)
+    self.assertEqual(joined.cols, expected.cols)
+    self.assertEqual(joined.rows, expected.rows)
+
+  def testDuplicateKeys(self):
+    others = [Relation((otherCols, list(otherRows))) for (otherCols, otherRows) in otherTables]
+    others[1].append([('a', 1, 0)])
+    for rel in allRelations():
+      self.assertRaisesRegexp(AssertionError, "duplicate keys in relation 2", rel.joinManyOrDie, others, joinIndex)
+
+  def testMismatchedKeys(self):
+    others = [Relation((otherCols, list(otherRows))) for (otherCols, otherRows) in otherTables]
+    others[0].select(lambda (conf,): conf != 'c', ('conf',))
+    for rel in allRelations():
+      self.assertRaisesRegexp(AssertionError, "keys mismatched", rel.joinManyOrDie, others, joinIndex)
+
+class PivotTest(RelationTest):
+  def testUnpivot(self):
+    result = self.assertSameRows(lambda rel: rel.unpivot(('conf', 'run'), ('tput', 'lat'), 'metric', 'val'))
+    self.assertEqual(result[:2], [('a', 1, 'tput', 10.0), ('a', 1, 'lat', 5)])
+    self.assertEqual(len(result), 2 * len(rows))
+
+  def testPivot(self):
+    result = self.assertSameRows(lambda rel: rel.pivot(('conf',), 'run', 'tput'))
+    self.assertEqual(result, [('a', 10.0, 12.0, 11.0), ('b', 20.0, 22.0, 21.0), ('c', 7.5, None, None)])
+
+  def testPivotColumns(self):
+    rel = Relation((cols, list(rows)))
+    rel.pivot(('run',), 'conf', 'lat', fill=0)
+    self.assertEqual(rel.cols, ('run', 'a', 'b', 'c'))
+    self.assertEqual(rel.rows, [(1, 5, 7, 3), (2, 6, 9, 0), (3, 4, 8, 0)])
+
+  def testPivotAggregate(self):
+    result = self.assertSameRows(lambda rel: rel.pivot((), 'conf', 'tput', 'mean'))
+    self.assertEqual(result, [(11.0, 21.0, 7.5)])
+
+  def testPivotDuplicates(self):
+    for rel in allRelations():
+      self.assertRaisesRegexp(AssertionError, "several values for ids", rel.pivot, (), 'conf', 'tput')
+
+  def testRoundTrip(self):
+    def ops(rel):
+      rel.unpivot(('conf', 'run'), ('tput', 'lat'))
+      rel.pivot(('conf', 'run'), 'name', 'value')
+    self.assertEqual(self.assertSameRows(ops), rows)
+
+class DistinctTest(RelationTest):
+  def testDistinct(self):
+    result = self.assertSameRows(lambda rel: rel.distinct(('conf',)))
+    self.assertEqual(result, [rows[0], rows[1], rows[3]])
+    self.assertEqual(self.assertSameRows(lambda rel: rel.distinct()), rows)
+
+  def testDistinctRows(self):
+    relRows = [(1, 'x'), (2, None), (1, 'x'), (1, 'y'), (2, None)]
+    result = self.assertSameRows(lambda rel: rel.distinct(), ('n', 's'), relRows)
+    self.assertEqual(result, [(1, 'x'), (2, None), (1, 'y')])
+
+  def testDuplicates(self):
+    result = self.assertSameResult(lambda rel: rel.duplicates(('conf',), 'runs'))
+    self.assertEqual(result, [('a', 3), ('b', 3)])
+    self.assertEqual(self.assertSameResult(lambda rel: rel.duplicates(('conf', 'run'))), [])
+
+  def testHasDuplicates(self):
+    for rel in allRelations():
+      self.assertEqual(rel.hasDuplicates(('conf',)), True, type(rel).__name__)
+      self.assertEqual(rel.hasDuplicates(('conf', 'run')), False, type(rel).__name__)
+
+# (cols, rows) of the events and marks joined on node by time by
+# RangeJoinTest
+eventTable = (('node', 'ts', 'lat'), [(1, 10, 5.0), (2, 11, 6.0), (1, 25, 7.0), (1, 3, 8.0),
+                                      (3, 12, 9.0), (2, 40, 1.0), (1, 20, 2.0)])
+markTable = (('node', 'markTs', 'mark'), [(1, 20, 'c'), (1, 8, 'a'), (2, 11, 'd'), (1, 12, 'b'),
+                                          (1, 20, 'e'), (2, 30, 'f')])
+
+class RangeJoinTest(RelationTest):
+  # helper
+  # check that join(rel, marks) leaves the same rows in every backend
+  # joining the events and a Relation of the marks
+  def assertSameJoin(self, join):
+    marks = Relation((markTable[0], list(markTable[1])))
+    return self.assertSameRows(lambda rel: join(rel, marks), eventTable[0], eventTable[1])
+
+  # helper
+  # the band join of the events and marks, comparing every pair of rows
+  def pairwiseBandJoin(self, before, after, inner):
+    result = []
+    for (node, ts, lat) in eventTable[1]:
+      matches = [(markTs, mark) for (markNode, markTs, mark) in sorted(markTable[1], key=lambda row: row[1])
+                 if markNode == node and ts - before <= markTs <= ts + after]
+      if len(matches) == 0 and not inner:
+        matches = [(None, None)]
+      result.extend([(node, ts, lat) + match for match in matches])
+    return result
+
+  def testBandJoin(self):
+    for (before, after) in ((5, 0), (2, 10), (0, 0), (100, 100)):
+      for inner in (True, False):
+        result = self.assertSameJoin(lambda rel, marks: rel.bandJoin(marks, ('node',), ('ts', 'markTs'), before, after, inner))
+        self.assertEqual(result, self.pairwiseBandJoin(before, after, inner), (before, after, inner))
+
+  def testAsofJoin(self):
+    result = self.assertSameJoin(lambda rel, marks: rel.asofJoin(marks, ('node',), ('ts', 'markTs'), inner=False))
+    self.assertEqual([row[3:] for row in result],
+                     [(8, 'a'), (11, 'd'), (20, 'e'), (None, None), (None, None), (30, 'f'), (20, 'e')])
+
+  def testAsofJoinTolerance(self):
+    result = self.assertSameJoin(lambda rel, marks: rel.asofJoin(marks, ('node',), ('ts', 'markTs'), 2))
+    self.assertEqual([row[3:] for row in result], [(8, 'a'), (11, 'd'), (20, 'e')])
+
+  def testFloatTimes(self):
+    marks = Relation((markTable[0], [(node, markTs + 0.5, mark) for (node, markTs, mark) in markTable[1]]))
+    self.assertSameRows(lambda rel: rel.bandJoin(marks, ('node',), ('ts', 'markTs'), 3, 1.5, False), eventTable[0], eventTable[1])
+    self.assertSameRows(lambda rel: rel.asofJoin(marks, ('node',), ('ts', 'markTs'), 5.0), eventTable[0], eventTable[1])
+
+class StatsTest(RelationTest):
+  statRows = [('a', 1, 2.5, None), ('b', None, -1.0, 'x'), ('a', 3, 2.5, 'y'), (None, 3, 0.0, 'x')]
+
+  def testStats(self):
+    expected = {'conf': {'count': 3, 'min': 'a', 'max': 'b', 'sum': None, 'distinct': 2},
+                'run': {'count': 3, 'min': 1, 'max': 3, 'sum': 7, 'distinct': 2},
+                'tput': {'count': 4, 'min': -1.0, 'max': 2.5, 'sum': 4.0, 'distinct': 3},
+                'lat': {'count': 3, 'min': 'x', 'max': 'y', 'sum': None, 'distinct': 2}}
+    for rel in allRelations(relRows=self.statRows):
+      self.assertEqual(rel.stats(), expected, type(rel).__name__)
+
+  def testEncodedStats(self):
+    rel = ColumnarRelation((cols, list(self.statRows)))
+    rel.encode()
+    self.assertEqual(rel.stats(), Relation((cols, list(self.statRows))).stats())
+
+  def testEmpty(self):
+    for rel in allRelations(relRows=[]):
+      self.assertEqual(rel.stats()['run'], {'count': 0, 'min': None, 'max': None, 'sum': 0, 'distinct': 0}, type(rel).__name__)
+
+  def testKeptUntilChange(self):
+    for rel in allRelations():
+      self.assertTrue(rel.stats() is rel.stats(), type(rel).__name__)
+      rel.append([('d', 9, 100.0, 1)])
+      self.assertEqual(rel.stats()['run']['max'], 9, type(rel).__name__)
+      rel.select(lambda (run,): run < 3, ('run',))
+      self.assertEqual(rel.stats()['run']['max'], 2, type(rel).__name__)
+
+  def testDescribe(self):
+    result = self.assertSameResult(lambda rel: rel.describe(), relRows=self.statRows)
+    self.assertEqual(result[1], ('run', 3, 1, 3, 7, 2))
+    for rel in allRelations():
+      self.assertEqual(rel.mins(), ('a', 1, 7.5, 3), type(rel).__name__)
+      self.assertEqual(rel.maxs(), ('c', 3, 22.0, 9), type(rel).__name__)
+
+if __name__ == '__main__':
+  unittest.main()
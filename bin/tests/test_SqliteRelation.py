@@ -0,0 +1,77 @@
+#!/usr/bin/python
+#
+# Tests of SqliteRelation: Exprs translated into SQL must give the rows the
+# same Exprs give on a Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from SqliteRelation import SqliteRelation
+from Expr import col
+
+cols = ('x', 's', 'n')
+rows = [(1, 'a', None), (3, 'b', 2), (None, 'c', 5), (2, None, 0)]
+
+class SqliteExprTest(unittest.TestCase):
+  # helper
+  # check that select(expr) keeps the same rows on both relations
+  def assertSameSelect(self, expr):
+    (rel, sqlRel) = (Relation((cols, list(rows))), SqliteRelation((cols, list(rows))))
+    rel.select(expr)
+    sqlRel.select(expr)
+    self.assertEqual(sqlRel.rows, rel.rows, repr(expr))
+    return rel.rows
+
+  # helper
+  # check that generateCol(expr) generates the same values on both relations
+  def assertSameGenerated(self, expr, relRows=rows):
+    (rel, sqlRel) = (Relation((cols, list(relRows))), SqliteRelation((cols, list(relRows))))
+    rel.generateCol('g', expr)
+    sqlRel.generateCol('g', expr)
+    self.assertEqual(sqlRel.rows, rel.rows, repr(expr))
+    return [row[-1] for row in rel.rows]
+
+  def testStringConcatenation(self):
+    numbered = [row for row in rows if row[1] != None]
+    self.assertEqual(self.assertSameGenerated(col('s') + 'z', numbered), ['az', 'bz', 'cz'])
+
+  def testArithmetic(self):
+    numbered = [(1, 'a', 2), (3, 'b', 4)]
+    self.assertEqual(self.assertSameGenerated(col('x') * 2 + col('n') - 1, numbered), [3, 9])
+    self.assertEqual(self.assertSameGenerated(col('x') / 2, numbered), [0.5, 1.5])
+    self.assertEqual(self.assertSameGenerated(-abs(col('n')), numbered), [-2, -4])
+
+  def testNoneComparisons(self):
+    self.assertEqual(self.assertSameSelect(col('x') < 2), [(1, 'a', None), (None, 'c', 5)])
+    self.assertSameSelect(col('x') <= 2)
+    self.assertSameSelect(col('x') > 2)
+    self.assertSameSelect(col('x') >= 2)
+    self.assertSameSelect(col('x') < col('n'))
+    self.assertSameSelect(col('n') >= col('x'))
+    self.assertSameSelect(~(col('x') < 2))
+    self.assertSameSelect(col('x') == None)
+    self.assertSameSelect(col('s') > 'a')
+
+  def testMixedTypeComparisons(self):
+    self.assertSameSelect(col('s') > 1)
+    self.assertSameSelect(col('x') == '1')
+
+  def testBooleanOps(self):
+    self.assertSameSelect((col('x') > 1) & (col('s') != 'c'))
+    self.assertSameSelect((col('x') > 2) | (col('n') == None))
+    self.assertSameSelect(col('s') & (col('x') > 1))
+
+  def testIsIn(self):
+    self.assertSameSelect(col('x').isin([1, 2]))
+    self.assertSameSelect(~col('x').isin([1, 2]))
+    self.assertSameSelect(col('x').isin([None, 3]))
+    self.assertSameSelect(col('s').isin(['a', 'c']) & (col('x') < 3))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+#
+# Tests of Views: after rows are appended, a view must give the rows of the
+# same operation computed again on the whole Relation
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Relational import Relation
+from ColumnarRelation import ColumnarRelation
+from LazyRelation import LazyRelation
+from SqliteRelation import SqliteRelation
+import Aggregates
+
+cols = ('conf', 'threads', 'tput')
+rows = [('a', 1, 10.0), ('b', 1, 20.0), ('a', 2, 14.0), ('c', 4, 7.5), ('b', 2, 21.0)]
+appends = [[('a', 1, 12.0), ('d', 8, 3.0)], [], [('c', 4, 8.5), ('b', 1, 19.0), ('d', 8, 4.0)]]
+
+otherCols = ('conf', 'threads', 'lat')
+otherRows = [('a', 1, 5), ('b', 2, 9), ('a', 1, 6), ('e', 1, 1)]
+otherAppends = [[('d', 8, 2)], [('c', 4, 3), ('a', 2, 7)], []]
+
+backends = (Relation, ColumnarRelation, LazyRelation, SqliteRelation)
+
+# floats rounded so that sums computed in another order compare equal
+def rounded(rows):
+  return [tuple(round(v, 9) if isinstance(v, float) else v for v in row) for row in rows]
+
+class AggViewTest(unittest.TestCase):
+  # helper
+  # check that the view of aggSpecs grouped by keyCols gives the rows of
+  # groupBy(keyCols).agg(aggSpecs) on a Relation of all the rows, after
+  # each append
+  def assertSameAgg(self, keyCols, aggSpecs):
+    for backend in backends:
+      rel = backend(Relation((cols, list(rows))))
+      view = rel.groupBy(keyCols).view(aggSpecs)
+      allRows = list(rows)
+      for newRows in [[]] + appends:
+        rel.append(newRows)
+        allRows += newRows
+        expected = Relation((cols, list(allRows))).groupBy(keyCols).agg(aggSpecs)
+        result = view.relation()
+        self.assertEqual(result.cols, expected.cols, backend.__name__)
+        self.assertEqual(rounded(result.rows), rounded(expected.rows), backend.__name__)
+
+  def testAggregates(self):
+    self.assertSameAgg(('conf',), (('runs', 'count', None), ('tput', 'mean', 'tput'), ('sd', 'stddev', 'tput'),
+                                   ('low', 'min', 'tput'), ('high', 'max', 'tput'), ('total', 'sum', 'threads')))
+
+  def testPercentile(self):
+    self.assertSameAgg(('conf', 'threads'), (('p50', Aggregates.Percentile(50), 'tput'), ('runs', 'count', None)))
+
+  def testNoKeys(self):
+    self.assertSameAgg((), (('tput', 'mean', 'tput'),))
+
+class JoinViewTest(unittest.TestCase):
+  # helper
+  # a relation of the other rows on joinIndex and lat
+  def other(self, theirRows, joinIndex, backend=Relation):
+    rel = Relation((otherCols, list(theirRows)))
+    rel.project(joinIndex + ('lat',))
+    return backend(rel)
+
+  # helper
+  # the rows of relation.leftHashJoin(otherRelation, joinIndex) of
+  # Relations of the rows
+  def join(self, myRows, theirRows, joinIndex):
+    rel = Relation((cols, list(myRows)))
+    rel.leftHashJoin(self.other(theirRows, joinIndex), joinIndex)
+    return rel
+
+  def testAppends(self):
+    for joinIndex in (('conf',), ('conf', 'threads')):
+      for backend in backends:
+        (rel, other) = (backend(Relation((cols, list(rows)))), self.other(otherRows, joinIndex, backend))
+        view = rel.joinView(other, joinIndex)
+        expected = self.join(rows, otherRows, joinIndex)
+        self.assertEqual(view.relation().cols, expected.cols)
+        self.assertEqual(view.relation().rows, expected.rows) # in the order of leftHashJoin
+        (allRows, allOtherRows) = (list(rows), list(otherRows))
+        for (newRows, newOtherRows) in zip(appends, otherAppends):
+          rel.append(newRows)
+          other.append(self.other(newOtherRows, joinIndex).rows)
+          allRows += newRows
+          allOtherRows += newOtherRows
+          expected = self.join(allRows, allOtherRows, joinIndex)
+          self.assertEqual(sorted(view.relation().rows), sorted(expected.rows), (backend.__name__, joinIndex))
+
+if __name__ == '__main__':
+  unittest.main()
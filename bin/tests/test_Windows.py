@@ -0,0 +1,51 @@
+#!/usr/bin/python
+#
+# Tests of Windows: the columnar window functions must compute the values
+# of the row-wise ones
+#
+# run from bin: python -m unittest discover -s tests
+
+import os.path
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import Windows
+
+class RollingPercentileTest(unittest.TestCase):
+  # helper
+  # check computeSegments against compute on each partition, with windows
+  # built in blocks of blockValues values
+  def assertSameAsRows(self, size, p, counts, blockValues):
+    random.seed(size)
+    vals = np.array([random.random() for i in range(sum(counts))])
+    counts = np.array(counts)
+    starts = np.cumsum(counts) - counts
+    fn = Windows.RollingPercentile(size, p)
+    expected = []
+    for start, count in zip(starts, counts):
+      expected.extend(fn.compute(vals[start:start + count].tolist(), None))
+    saved = Windows.windowBlockValues
+    Windows.windowBlockValues = blockValues
+    try:
+      out = fn.computeSegments(vals, starts, counts, None)
+    finally:
+      Windows.windowBlockValues = saved
+    self.assertEqual(len(out), len(expected))
+    for a, b in zip(out.tolist(), expected):
+      self.assertAlmostEqual(a, b)
+
+  def testBlocks(self):
+    for blockValues in (1, 7, 40, 1 << 20):
+      self.assertSameAsRows(4, 50, [10, 3, 1, 20], blockValues)
+      self.assertSameAsRows(3, 99, [5, 5], blockValues)
+
+  def testWindowLargerThanBlock(self):
+    self.assertSameAsRows(50, 90, [30, 70], 16)
+
+if __name__ == '__main__':
+  unittest.main()